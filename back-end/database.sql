@@ -46,12 +46,74 @@ CREATE TABLE device_sensors (
 );
 
 -- 6. Pembacaan data dalam HEX per device (gabungan semua sensor per device)
+-- Dipartisi per bulan berdasarkan timestamp (PostgreSQL 12+). Partisi baru dibuat
+-- dan partisi lama dilepas oleh: python -m maintenance.partitions
 CREATE TABLE sensor_readings (
-    reading_id BIGSERIAL PRIMARY KEY,
+    reading_id BIGSERIAL,
     device_id INT NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     encoded_data VARCHAR(64) NOT NULL,
+    PRIMARY KEY (reading_id, timestamp),
     FOREIGN KEY (device_id) REFERENCES devices(device_id) ON DELETE CASCADE
+) PARTITION BY RANGE (timestamp);
+
+-- 6b. Nilai sensor hasil decode HEX (satu baris per reading per sensor)
+-- device_id dan timestamp diduplikasi dari sensor_readings agar agregasi tidak perlu join
+CREATE TABLE sensor_values (
+    reading_id BIGINT NOT NULL,
+    device_sensor_id INT NOT NULL,
+    device_id INT NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (reading_id, device_sensor_id, timestamp),
+    FOREIGN KEY (reading_id, timestamp) REFERENCES sensor_readings(reading_id, timestamp) ON DELETE CASCADE,
+    FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
+) PARTITION BY RANGE (timestamp);
+
+-- Partisi awal: DEFAULT (menampung timestamp di luar rentang partisi) serta
+-- bulan ini dan 3 bulan berikutnya; selanjutnya dibuat oleh maintenance.partitions
+CREATE TABLE sensor_readings_default PARTITION OF sensor_readings DEFAULT;
+CREATE TABLE sensor_values_default PARTITION OF sensor_values DEFAULT;
+
+DO $$
+DECLARE
+    month_start DATE := date_trunc('month', NOW())::date;
+BEGIN
+    FOR i IN 0..3 LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF sensor_readings FOR VALUES FROM (%L) TO (%L)',
+                       'sensor_readings_p' || to_char(month_start, 'YYYYMMDD'),
+                       month_start, month_start + INTERVAL '1 month');
+        EXECUTE format('CREATE TABLE %I PARTITION OF sensor_values FOR VALUES FROM (%L) TO (%L)',
+                       'sensor_values_p' || to_char(month_start, 'YYYYMMDD'),
+                       month_start, month_start + INTERVAL '1 month');
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+END $$;
+
+-- 6c. Rollup per jam dan per hari (min/max/sum/count per sensor), diperbarui saat ingest
+-- Rata-rata = sum_value / sample_count, sehingga bucket bisa digabung tanpa kehilangan presisi
+CREATE TABLE sensor_rollup_hourly (
+    device_sensor_id INT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    device_id INT NOT NULL,
+    min_value DOUBLE PRECISION NOT NULL,
+    max_value DOUBLE PRECISION NOT NULL,
+    sum_value DOUBLE PRECISION NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (device_sensor_id, bucket_start),
+    FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
+);
+
+CREATE TABLE sensor_rollup_daily (
+    device_sensor_id INT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    device_id INT NOT NULL,
+    min_value DOUBLE PRECISION NOT NULL,
+    max_value DOUBLE PRECISION NOT NULL,
+    sum_value DOUBLE PRECISION NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (device_sensor_id, bucket_start),
+    FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
 );
 
 -- 7. Tabel user sistem
@@ -61,7 +123,31 @@ CREATE TABLE users (
     pass VARCHAR(255) NOT NULL
 );
 
+-- 7b. Posisi terakhir job maintenance (agar job batch bisa dilanjutkan)
+CREATE TABLE maintenance_checkpoints (
+    job VARCHAR(50) PRIMARY KEY,
+    last_timestamp TIMESTAMP,
+    last_reading_id BIGINT,
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 7c. Content instance Antares terakhir yang sudah diambil poller, per device
+CREATE TABLE poller_checkpoints (
+    app_name VARCHAR(50) NOT NULL,
+    device_code VARCHAR(50) NOT NULL,
+    last_ct TIMESTAMP NOT NULL,  -- waktu pembuatan (ct) di Antares, UTC
+    last_ri VARCHAR(255),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (app_name, device_code)
+);
+
 -- 8. Indexing untuk efisiensi pencarian historis
 CREATE INDEX idx_readings_timestamp ON sensor_readings(timestamp);
-CREATE INDEX idx_readings_device ON sensor_readings(device_id);
-CREATE INDEX idx_devices_code ON devices(code);
\ No newline at end of file
+-- Unik: satu reading per device per timestamp, duplikat dilewati oleh ON CONFLICT DO NOTHING
+CREATE UNIQUE INDEX idx_readings_device_time_unique ON sensor_readings(device_id, timestamp DESC);
+CREATE INDEX idx_devices_code ON devices(code);
+CREATE INDEX idx_sensor_values_device_time ON sensor_values(device_id, timestamp);
+CREATE INDEX idx_sensor_values_sensor_time ON sensor_values(device_sensor_id, timestamp);
+CREATE INDEX idx_rollup_hourly_device_time ON sensor_rollup_hourly(device_id, bucket_start);
+CREATE INDEX idx_rollup_daily_device_time ON sensor_rollup_daily(device_id, bucket_start);
@@ -0,0 +1,17 @@
+-- Migration 001: tabel sensor_values (nilai sensor hasil decode HEX)
+-- Jalankan sekali pada database yang sudah ada, lalu isi data lama dengan:
+--   python -m maintenance.backfill_sensor_values
+
+CREATE TABLE IF NOT EXISTS sensor_values (
+    reading_id BIGINT NOT NULL,
+    device_sensor_id INT NOT NULL,
+    device_id INT NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (reading_id, device_sensor_id),
+    FOREIGN KEY (reading_id) REFERENCES sensor_readings(reading_id) ON DELETE CASCADE,
+    FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_sensor_values_device_time ON sensor_values(device_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_sensor_values_sensor_time ON sensor_values(device_sensor_id, timestamp);
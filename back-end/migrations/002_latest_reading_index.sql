@@ -0,0 +1,9 @@
+-- Migration 002: index komposit untuk query reading terbaru per device
+-- CONCURRENTLY tidak mengunci tabel dari INSERT webhook, tetapi tidak boleh
+-- dijalankan di dalam transaksi (jalankan dengan psql biasa, tanpa -1/BEGIN).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_readings_device_time
+    ON sensor_readings(device_id, timestamp DESC);
+
+-- Index device_id tunggal sudah tercakup oleh prefix index komposit
+DROP INDEX CONCURRENTLY IF EXISTS idx_readings_device;
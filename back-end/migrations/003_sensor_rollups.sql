@@ -0,0 +1,31 @@
+-- Migration 003: tabel rollup per jam dan per hari
+-- maintenance.backfill_sensor_values ikut mengisi rollup. Jika sensor_values sudah
+-- terisi sebelum migrasi ini, bangun rollup dari data lama dengan:
+--   python -m maintenance.rollups --since 2000-01-01
+
+CREATE TABLE IF NOT EXISTS sensor_rollup_hourly (
+    device_sensor_id INT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    device_id INT NOT NULL,
+    min_value DOUBLE PRECISION NOT NULL,
+    max_value DOUBLE PRECISION NOT NULL,
+    sum_value DOUBLE PRECISION NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (device_sensor_id, bucket_start),
+    FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS sensor_rollup_daily (
+    device_sensor_id INT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    device_id INT NOT NULL,
+    min_value DOUBLE PRECISION NOT NULL,
+    max_value DOUBLE PRECISION NOT NULL,
+    sum_value DOUBLE PRECISION NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (device_sensor_id, bucket_start),
+    FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_rollup_hourly_device_time ON sensor_rollup_hourly(device_id, bucket_start);
+CREATE INDEX IF NOT EXISTS idx_rollup_daily_device_time ON sensor_rollup_daily(device_id, bucket_start);
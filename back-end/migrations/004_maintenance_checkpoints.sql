@@ -0,0 +1,11 @@
+-- Migration 004: checkpoint untuk job maintenance.compaction
+-- Menggantikan DELETE besar di greenhouse_maintenance.sh; job menyimpan posisi
+-- terakhir per tier sehingga bisa dihentikan dan dilanjutkan kapan saja.
+
+CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+    job VARCHAR(50) PRIMARY KEY,
+    last_timestamp TIMESTAMP,
+    last_reading_id BIGINT,
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,17 @@
+-- Migration 005: partisi sensor_readings dan sensor_values per bulan (PostgreSQL 12+)
+-- Tabel besar tidak bisa diubah menjadi tabel partisi dengan satu ALTER TABLE tanpa
+-- menghentikan webhook, sehingga migrasi ini dijalankan dengan tool Python secara online:
+--
+--   python -m maintenance.partition_migration prepare   -- tabel *_new + trigger mirror
+--   python -m maintenance.partition_migration copy      -- salin data lama per batch (bisa dilanjutkan)
+--   python -m maintenance.partition_migration cutover   -- tukar nama tabel (transaksi singkat)
+--   python -m maintenance.partition_migration cleanup   -- hapus *_legacy setelah dicek
+--
+-- Hentikan cron maintenance.compaction selama prepare..cutover.
+-- Setelah itu partisi dikelola oleh: python -m maintenance.partitions
+--
+-- Perubahan skema (lihat database.sql):
+-- - sensor_readings: PRIMARY KEY (reading_id, timestamp), timestamp NOT NULL
+-- - sensor_values: PRIMARY KEY (reading_id, device_sensor_id, timestamp),
+--   FOREIGN KEY (reading_id, timestamp) REFERENCES sensor_readings
+-- - partisi DEFAULT sensor_readings_default / sensor_values_default
@@ -0,0 +1,35 @@
+-- Migration 006: satu reading per device per timestamp (ingest idempoten)
+-- Webhook dan poller fetch_antares bisa mencatat content instance Antares yang sama.
+-- Dengan index unik ini INSERT ... ON CONFLICT DO NOTHING (shared/ingest.py) melewati
+-- reading yang sudah tersimpan. Kode ingest baru juga berjalan sebelum migrasi ini
+-- (ON CONFLICT tanpa target), hanya saja duplikat baru belum tertolak.
+--
+-- Index unik pada tabel partisi harus memuat kolom partisi (timestamp) dan tidak bisa
+-- dibuat CONCURRENTLY: INSERT tertahan selama migrasi. Jalankan saat sepi; dengan spool
+-- webhook aktif (WEBHOOK_SPOOL_PATH) reading yang tertahan masuk spool dan diputar ulang.
+--
+-- Reading lama dari poller memakai waktu polling (bukan ct Antares), sehingga duplikatnya
+-- dengan reading webhook tidak terdeteksi di sini; hanya timestamp yang persis sama dihapus.
+
+BEGIN;
+
+-- Tahan INSERT baru agar tidak ada duplikat baru di antara DELETE dan CREATE INDEX
+LOCK TABLE sensor_readings IN SHARE MODE;
+
+-- 1. Hapus duplikat lama, simpan reading_id terkecil (sensor_values ikut terhapus lewat CASCADE)
+DELETE FROM sensor_readings r
+USING sensor_readings d
+WHERE r.device_id = d.device_id
+  AND r.timestamp = d.timestamp
+  AND r.reading_id > d.reading_id;
+
+-- 2. Index unik dengan bentuk yang sama menggantikan idx_readings_device_time
+CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_device_time_unique
+    ON sensor_readings(device_id, timestamp DESC);
+
+DROP INDEX IF EXISTS idx_readings_device_time;
+
+COMMIT;
+
+-- 3. Rollup masih menghitung nilai dari duplikat yang dihapus; hitung ulang sejak data tertua:
+--   python -m maintenance.rollups --since 2000-01-01
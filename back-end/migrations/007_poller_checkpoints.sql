@@ -0,0 +1,14 @@
+-- Migration 007: checkpoint poller fetch_antares per device (polling catch-up)
+-- Poller menyimpan content instance Antares terakhir yang sudah diambil (ct dan ri)
+-- dalam transaksi yang sama dengan reading-nya, lalu pada run berikutnya hanya
+-- meminta content instance yang lebih baru. Tanpa tabel ini poller tidak bisa berjalan
+-- dengan POLL_CATCHUP=1 (default); set POLL_CATCHUP=0 untuk mode lama (hanya /la).
+
+CREATE TABLE IF NOT EXISTS poller_checkpoints (
+    app_name VARCHAR(50) NOT NULL,
+    device_code VARCHAR(50) NOT NULL,
+    last_ct TIMESTAMP NOT NULL,  -- waktu pembuatan (ct) di Antares, UTC
+    last_ri VARCHAR(255),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (app_name, device_code)
+);
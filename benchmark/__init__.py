@@ -0,0 +1,12 @@
+"""
+Benchmarks for the Smart Greenhouse API and webhook.
+Run from the project root, e.g. `python -m benchmark.serving --url http://127.0.0.1:5000`.
+
+Components:
+- serving.py: Keep-alive HTTP load driver reporting requests/sec and latency percentiles,
+  for any route list, every read route of the API and the Antares webhook
+- datagen.py: Deterministic synthetic sensor history and webhook payloads
+- report.py: Compares two serving.py JSON reports and flags regressions
+- payload_parser.py: Micro-benchmark of the webhook payload parser and validator
+- README.md: How to run the benchmarks and the numbers measured so far
+"""
@@ -0,0 +1,231 @@
+"""
+Synthetic sensor data for benchmarks.
+
+Readings are generated for the devices in the database and encoded in the HEX
+layout of their device_sensors rows (one big-endian 16-bit word per sensor,
+scaled by shared.decoder.SENSOR_SCALES). Values follow a daily cycle with
+noise around typical greenhouse conditions, a small share of readings is
+lost like on a real LoRa link, and the output is the same for the same --seed.
+
+Subcommands:
+  history   Write --years of readings per device through shared.ingest, so
+            sensor_values and the hourly/daily rollups are filled exactly as
+            by the webhook. Missing partitions for the range are created
+            first; running it again skips the readings already stored.
+  payloads  Print webhook payloads as NDJSON, in one or all Antares formats,
+            e.g. for POST /webhook/antares/batch.
+
+Usage (from the project root):
+    python -m benchmark.datagen history [--years 1] [--interval 300] [--device CZ1] [--batch-size 5000] [--seed 1]
+    python -m benchmark.datagen payloads [--count 1000] [--format all] [--device CZ1] > payloads.ndjson
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.decoder import SENSOR_SCALES
+from shared.ingest import Reading
+
+# sensor_type -> (mean, daily swing, noise sd, min, max) in physical units;
+# the swing peaks at 14:00 (negative = lowest at 14:00)
+SENSOR_PROFILES = {
+    "Temperature": (27.0, 5.0, 0.4, 10.0, 45.0),
+    "Humidity": (75.0, -12.0, 1.5, 30.0, 100.0),
+    "Soil Moisture": (45.0, -4.0, 1.0, 5.0, 90.0),
+    "pH": (6.3, 0.0, 0.05, 4.0, 8.5),
+    "EC": (1.8, 0.0, 0.05, 0.2, 4.0),
+}
+# Light (lux) follows the sun instead: zero at night, peak at noon
+LIGHT_PEAK = 30000.0
+DEFAULT_PROFILE = (50.0, 0.0, 1.0, 0.0, 100.0)
+
+# Webhook payload formats accepted by /webhook/antares
+PAYLOAD_FORMATS = ("direct", "m2m:cin", "m2m:sgn", "payload")
+
+# device_code -> sensor types in sensor_order
+Layouts = Dict[str, List[str]]
+
+def sensor_value(sensor_type: str, hour: float, rng: random.Random) -> float:
+    """Physical value of one sensor at `hour` (0-24, local time)"""
+    if sensor_type == "Light":
+        daylight = max(0.0, math.sin(math.pi * (hour - 6) / 12))
+        return max(0.0, LIGHT_PEAK * daylight * rng.uniform(0.6, 1.0))
+    mean, swing, noise, low, high = SENSOR_PROFILES.get(sensor_type, DEFAULT_PROFILE)
+    value = mean + swing * math.cos(2 * math.pi * (hour - 14) / 24) + rng.gauss(0, noise)
+    return min(high, max(low, value))
+
+def encode(sensor_types: Sequence[str], values: Sequence[float]) -> str:
+    """Physical values -> HEX string in the device layout (inverse of shared.decoder)"""
+    words = []
+    for sensor_type, value in zip(sensor_types, values):
+        raw = int(round(value * SENSOR_SCALES.get(sensor_type, 1)))
+        words.append(f"{min(0xFFFF, max(0, raw)):04X}")
+    return "".join(words)
+
+def generate_readings(layouts: Layouts, start: datetime, end: datetime, interval: float,
+                      seed: int = 1, loss: float = 0.01) -> Iterator[Reading]:
+    """
+    Readings of every device from start to end, in time order (naive local
+    timestamps). Readings sit on a fixed grid of `interval` seconds plus a few
+    seconds of jitter, and each one depends only on seed, device and grid slot,
+    so overlapping ranges generate the same readings.
+    """
+    jitter = min(10.0, interval / 10)
+    slot = math.ceil(start.timestamp() / interval)
+    last = end.timestamp() / interval
+    while slot < last:
+        timestamp = datetime.fromtimestamp(slot * interval)
+        hour = timestamp.hour + timestamp.minute / 60
+        for device_code, sensor_types in layouts.items():
+            rng = random.Random(f"{seed}/{device_code}/{slot}")
+            if rng.random() < loss:
+                continue
+            values = [sensor_value(sensor_type, hour, rng) for sensor_type in sensor_types]
+            at = timestamp + timedelta(seconds=round(rng.uniform(0, jitter), 3))
+            yield device_code, encode(sensor_types, values), at
+        slot += 1
+
+def webhook_payload(reading: Reading, payload_format: str = "direct", counter: int = 0) -> dict:
+    """One reading as the webhook receives it, in one of PAYLOAD_FORMATS"""
+    device_code, encoded_data, timestamp = reading
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.astimezone()
+    if payload_format == "direct":
+        return {"deviceName": device_code, "data": encoded_data, "timestamp": timestamp.isoformat()}
+    if payload_format == "payload":
+        return {"payload": {"deviceName": device_code, "data": encoded_data, "timestamp": timestamp.isoformat()}}
+
+    # Antares content instance: no device timestamp, the reading time is ct (UTC)
+    ct = timestamp.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    cin = {
+        "rn": f"cin_{counter}", "ty": 4, "ct": ct, "lt": ct, "cnf": "text/plain:0",
+        "con": json.dumps({"type": "uplink", "port": 1, "data": encoded_data,
+                           "counter": counter, "deviceName": device_code}),
+    }
+    if payload_format == "m2m:cin":
+        return {"m2m:cin": cin}
+    if payload_format == "m2m:sgn":
+        return {"m2m:sgn": {"m2m:nev": {"m2m:rep": {"m2m:cin": cin}, "m2m:rss": 1},
+                            "m2m:sur": "/antares-cse/sub-greenhouse-webhook"}}
+    raise ValueError(f"Unknown payload format: {payload_format}")
+
+def payload_stream(layouts: Layouts, formats: Sequence[str] = PAYLOAD_FORMATS,
+                   start: Optional[datetime] = None, seed: int = 1) -> Iterator[dict]:
+    """
+    Endless webhook payloads, round-robin over devices and formats, starting at
+    `start` (default now). Each round over the devices is one second later
+    (ct has no fraction), so no payload repeats a stored reading of the stream.
+    """
+    rng = random.Random(seed)
+    timestamp = (start or datetime.now()).replace(microsecond=0)
+    counter = 0
+    while True:
+        hour = timestamp.hour + timestamp.minute / 60
+        for device_code, sensor_types in layouts.items():
+            values = [sensor_value(sensor_type, hour, rng) for sensor_type in sensor_types]
+            reading = (device_code, encode(sensor_types, values), timestamp)
+            yield webhook_payload(reading, formats[counter % len(formats)], counter)
+            counter += 1
+        timestamp += timedelta(seconds=1)
+
+def layouts_from_rows(devices: Dict[str, List[dict]]) -> Layouts:
+    """{"CZ1": [{"sensor_type": ..., "sensor_order": ...}, ...]} -> Layouts"""
+    return {code: [sensor['sensor_type'] for sensor in sorted(sensors, key=lambda s: s['sensor_order'])]
+            for code, sensors in devices.items() if sensors}
+
+def load_layouts(conn, device_codes: Optional[Sequence[str]] = None) -> Layouts:
+    """Sensor layouts of the given devices (default: all devices with sensors)"""
+    from shared.device_registry import device_registry
+    device_registry.refresh(conn)
+    codes = device_codes or [device['code'] for device in device_registry.devices(conn)]
+    return layouts_from_rows({code: device_registry.get_sensors(conn, code) for code in codes})
+
+def write_history(conn, layouts: Layouts, start: datetime, end: datetime, interval: float,
+                  batch_size: int, seed: int, loss: float) -> int:
+    """Insert generated readings in batches, one transaction per batch; returns rows inserted"""
+    from shared.ingest import insert_readings
+    from maintenance.partitions import ensure_partitions, is_partitioned, next_period
+
+    if is_partitioned(conn, "sensor_readings"):
+        ensure_partitions(conn, start, next_period(end, "month"))
+
+    expected = int((end - start).total_seconds() / interval) * len(layouts)
+    inserted = 0
+    handled = 0
+    started = time.monotonic()
+    batch = []
+    readings = generate_readings(layouts, start, end, interval, seed, loss)
+    while True:
+        reading = next(readings, None)
+        if reading is not None:
+            batch.append(reading)
+        if batch and (reading is None or len(batch) >= batch_size):
+            inserted += len(insert_readings(conn, batch))
+            conn.commit()
+            handled += len(batch)
+            batch = []
+            elapsed = time.monotonic() - started
+            logging.info(f"{handled}/~{expected} readings ({inserted} new), "
+                         f"{handled / elapsed:.0f} readings/s, up to {reading[2] if reading else end:%Y-%m-%d}")
+        if reading is None:
+            return inserted
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--device", action="append", help="device code (repeatable, default: all devices)")
+    common.add_argument("--seed", type=int, default=1, help="random seed (same seed, same data)")
+
+    parser = argparse.ArgumentParser(description="Generate synthetic sensor history and webhook payloads")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    history = commands.add_parser("history", parents=[common], help="write readings into sensor_readings")
+    history.add_argument("--years", type=float, default=1, help="years of history, ending now")
+    history.add_argument("--interval", type=float, default=300, help="seconds between readings per device")
+    history.add_argument("--loss", type=float, default=0.01, help="share of readings that never arrive")
+    history.add_argument("--batch-size", type=int, default=5000, help="readings per transaction")
+
+    payloads = commands.add_parser("payloads", parents=[common], help="print webhook payloads as NDJSON")
+    payloads.add_argument("--count", type=int, default=1000, help="payloads to print")
+    payloads.add_argument("--format", choices=PAYLOAD_FORMATS + ("all",), default="all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    import psycopg2
+    from maintenance.config import DB_CONFIG
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        layouts = load_layouts(conn, args.device)
+        if not layouts:
+            logging.error("No devices with a sensor layout found")
+            return
+        conn.commit()
+
+        if args.command == "history":
+            end = datetime.now().replace(microsecond=0)
+            start = end - timedelta(days=365 * args.years)
+            logging.info(f"Generating {args.years} years of readings for {len(layouts)} devices "
+                         f"every {args.interval:g}s ({start:%Y-%m-%d} - {end:%Y-%m-%d})")
+            inserted = write_history(conn, layouts, start, end, args.interval,
+                                     args.batch_size, args.seed, args.loss)
+            logging.info(f"Done: {inserted} readings inserted. Refresh planner statistics with ANALYZE "
+                         f"before benchmarking")
+        else:
+            formats = PAYLOAD_FORMATS if args.format == "all" else (args.format,)
+            stream = payload_stream(layouts, formats, seed=args.seed)
+            for _ in range(args.count):
+                sys.stdout.write(json.dumps(next(stream)) + "\n")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Micro-benchmark of the webhook payload parser and validator.
+
+Runs the sample Antares payloads (direct, m2m:cin, m2m:sgn notification and
+nested payload) through the parse + validate path of the webhook and prints
+microseconds per payload, next to the parser the webhook used before
+(format probing, strptime loops, int(data, 16) and a device list rebuilt on
+every call). No server or database is needed.
+
+Usage (from the project root):
+    python -m benchmark.payload_parser [--number 20000] [--repeat 5] [--json]
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+from datetime import datetime
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "flask_api"))
+
+from webhook.webhook_config import WebhookConfig
+from webhook.webhook_utils import parse_webhook_payload, validate_hex_data
+
+CONTENT = json.dumps({
+    "type": "uplink", "port": 1, "data": "01F402BC006400C8", "counter": 1532,
+    "devEui": "a1b2c3d4e5f60708", "deviceName": "CZ1",
+    "radio": {"gwDataRate": "SF10BW125", "hardware": {"rssi": -97, "snr": 6.5}},
+})
+
+SAMPLE_PAYLOADS = {
+    # webhook_setup/webhook_verification.sh
+    "direct": {"deviceName": "CZ1", "data": "01F402BC006400C8", "timestamp": "2025-09-13T06:29:14.000Z"},
+    "m2m:cin": {"m2m:cin": {"rn": "cin_1532", "ty": 4, "ct": "20250913T062914", "lt": "20250913T062914",
+                            "cnf": "text/plain:0", "con": CONTENT}},
+    # Subscription notification (nct 2), as sent to /webhook/antares
+    "m2m:sgn": {"m2m:sgn": {"m2m:nev": {"m2m:rep": {"m2m:cin": {
+        "rn": "cin_1532", "ty": 4, "ct": "20250913T062914", "lt": "20250913T062914",
+        "cnf": "text/plain:0", "con": CONTENT}}, "m2m:rss": 1},
+        "m2m:sur": "/antares-cse/sub-greenhouse-webhook-cabai"}},
+    "payload": {"payload": {"deviceName": "CZ1", "data": "01F402BC006400C8", "timestamp": "2025-09-13 06:29:14"}},
+}
+
+# --- Parser before the fast path, kept here as the baseline ---
+
+def legacy_parse_timestamp(timestamp_str):
+    if not timestamp_str:
+        return datetime.now()
+    try:
+        if 'T' in timestamp_str:
+            clean_ts = timestamp_str.replace('Z', '+00:00')
+            return datetime.fromisoformat(clean_ts.replace('Z', ''))
+        for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]:
+            try:
+                return datetime.strptime(timestamp_str, fmt)
+            except:
+                continue
+    except Exception:
+        pass
+    return datetime.now()
+
+def legacy_parse_webhook_payload(payload):
+    try:
+        device_name = payload.get('deviceName') or payload.get('device')
+        encoded_data = payload.get('data')
+        timestamp_str = payload.get('timestamp')
+        if not encoded_data and 'm2m:cin' in payload:
+            try:
+                con_data = json.loads(payload['m2m:cin'].get('con', '{}'))
+                device_name = device_name or con_data.get('deviceName')
+                encoded_data = con_data.get('data')
+            except:
+                pass
+        if not encoded_data and 'payload' in payload:
+            nested = payload['payload']
+            device_name = device_name or nested.get('deviceName')
+            encoded_data = encoded_data or nested.get('data')
+            timestamp_str = timestamp_str or nested.get('timestamp')
+        if not device_name or not encoded_data:
+            return None
+        return device_name, encoded_data, legacy_parse_timestamp(timestamp_str)
+    except Exception:
+        return None
+
+def legacy_validate_hex_data(data):
+    if not data or len(data) < 2:
+        return False
+    try:
+        int(data, 16)
+        return len(data) % 2 == 0
+    except ValueError:
+        return False
+
+def legacy_validate_device(device_name):
+    all_devices = []
+    for devices in WebhookConfig.DEVICE_MAPPING.values():
+        all_devices.extend(devices)
+    return device_name in all_devices
+
+# --- Parse + validate, as WebhookDataHandler.validate_payload does ---
+
+def fast_path(payload) -> bool:
+    parsed = parse_webhook_payload(payload)
+    return (parsed is not None and WebhookConfig.validate_device(parsed[0])
+            and validate_hex_data(parsed[1]))
+
+def legacy_path(payload) -> bool:
+    parsed = legacy_parse_webhook_payload(payload)
+    return (parsed is not None and legacy_validate_device(parsed[0])
+            and legacy_validate_hex_data(parsed[1]))
+
+def measure(func: Callable, payload, number: int, repeat: int) -> float:
+    """Best of `repeat` runs, microseconds per call"""
+    best = min(timeit.repeat(lambda: func(payload), number=number, repeat=repeat))
+    return best / number * 1e6
+
+def run(number: int, repeat: int) -> Dict[str, dict]:
+    report = {}
+    for name, payload in SAMPLE_PAYLOADS.items():
+        legacy_ok = legacy_path(payload)
+        fast_ok = fast_path(payload)
+        legacy_us = measure(legacy_path, payload, number, repeat)
+        fast_us = measure(fast_path, payload, number, repeat)
+        report[name] = {
+            "legacy_us": round(legacy_us, 2),
+            "fast_us": round(fast_us, 2),
+            # Only comparable when the old parser accepted the payload too
+            "speedup": round(legacy_us / fast_us, 2) if legacy_ok else None,
+            "legacy_valid": legacy_ok,
+            "fast_valid": fast_ok,
+        }
+    return report
+
+def print_report(report: Dict[str, dict]) -> None:
+    print(f"{'format':<10} {'legacy µs':>10} {'fast µs':>9} {'speedup':>8} {'legacy valid':>13} {'fast valid':>11}")
+    for name, stats in report.items():
+        speedup = f"{stats['speedup']}x" if stats['speedup'] is not None else "-"
+        print(f"{name:<10} {stats['legacy_us']:>10} {stats['fast_us']:>9} {speedup:>8} "
+              f"{str(stats['legacy_valid']):>13} {str(stats['fast_valid']):>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the webhook payload parser and validator")
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs, the best one is reported")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.number, args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compare two benchmark.serving --json reports.
+
+For every target in both reports, prints requests/sec and p50/p95/p99
+latency of the baseline and the current run with the change in percent, and
+flags a regression when requests/sec dropped or p95/p99 grew by more than
+--threshold percent, or when the current run had errors the baseline did not.
+p99 is only judged for targets with at least --min-requests requests in both
+runs; below that it is one or two samples and mostly noise.
+Exits with status 1 on a regression, so it can gate a script or CI job.
+
+Usage (from the project root):
+    python -m benchmark.serving --all-routes --webhook --json > baseline.json
+    ... change the code, restart the server ...
+    python -m benchmark.serving --all-routes --webhook --json > current.json
+    python -m benchmark.report baseline.json current.json [--threshold 10] [--min-requests 500] [--markdown]
+"""
+import sys
+import json
+import argparse
+from typing import List, Optional
+
+# Stats compared, and whether a higher value is better
+METRICS = [("rps", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)]
+# Stats that fail the comparison when they regress beyond the threshold
+GATED = ("rps", "p95_ms", "p99_ms")
+
+def change(before: float, after: float) -> Optional[float]:
+    """Relative change in percent (None when there is no baseline value)"""
+    if not before:
+        return None
+    return round((after - before) / before * 100, 1)
+
+def compare(baseline: dict, current: dict, threshold: float, min_requests: int = 0) -> List[dict]:
+    """One row per target present in both reports, the total last"""
+    targets = [path for path in baseline["paths"] if path in current["paths"]]
+    pairs = [(path, baseline["paths"][path], current["paths"][path]) for path in targets]
+    pairs.append(("TOTAL", baseline["total"], current["total"]))
+
+    rows = []
+    for path, before, after in pairs:
+        row = {"path": path, "regressions": []}
+        enough_samples = min(before["requests"], after["requests"]) >= min_requests
+        for metric, higher_is_better in METRICS:
+            delta = change(before[metric], after[metric])
+            row[metric] = (before[metric], after[metric], delta)
+            worse = delta is not None and (-delta if higher_is_better else delta) > threshold
+            if worse and metric in GATED and (metric != "p99_ms" or enough_samples):
+                row["regressions"].append(metric)
+        if after["errors"] and not before["errors"]:
+            row["regressions"].append("errors")
+        row["errors"] = (before["errors"], after["errors"])
+        rows.append(row)
+    return rows
+
+def format_cell(values: tuple) -> str:
+    before, after, delta = values
+    return f"{before} -> {after}" + (f" ({delta:+.1f}%)" if delta is not None else "")
+
+def print_table(rows: List[dict]) -> None:
+    width = max([32] + [len(row["path"]) for row in rows])
+    print(f"{'path':<{width}} " + " ".join(f"{metric:>24}" for metric, _ in METRICS) + f" {'errors':>12}  status")
+    for row in rows:
+        cells = " ".join(f"{format_cell(row[metric]):>24}" for metric, _ in METRICS)
+        errors = f"{row['errors'][0]} -> {row['errors'][1]}"
+        status = "REGRESSION " + ",".join(row["regressions"]) if row["regressions"] else "ok"
+        print(f"{row['path']:<{width}} {cells} {errors:>12}  {status}")
+
+def print_markdown(rows: List[dict]) -> None:
+    print("| path | " + " | ".join(metric for metric, _ in METRICS) + " | errors | status |")
+    print("|---|" + "---:|" * len(METRICS) + "---:|---|")
+    for row in rows:
+        cells = " | ".join(format_cell(row[metric]) for metric, _ in METRICS)
+        status = "**regression** " + ", ".join(row["regressions"]) if row["regressions"] else "ok"
+        print(f"| `{row['path']}` | {cells} | {row['errors'][0]} -> {row['errors'][1]} | {status} |")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark.serving JSON reports")
+    parser.add_argument("baseline", help="report of the reference run")
+    parser.add_argument("current", help="report of the run to check")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="allowed change in percent before rps, p95 or p99 count as a regression")
+    parser.add_argument("--min-requests", type=int, default=500,
+                        help="requests per target needed in both runs before p99 is judged")
+    parser.add_argument("--markdown", action="store_true", help="print a markdown table (e.g. for a PR)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    if baseline.get("concurrency") != current.get("concurrency"):
+        print(f"warning: concurrency differs ({baseline.get('concurrency')} vs {current.get('concurrency')})",
+              file=sys.stderr)
+    skipped = set(baseline["paths"]) ^ set(current["paths"])
+    if skipped:
+        print(f"warning: targets in only one report are skipped: {', '.join(sorted(skipped))}", file=sys.stderr)
+
+    rows = compare(baseline, current, args.threshold, args.min_requests)
+    if args.markdown:
+        print_markdown(rows)
+    else:
+        print_table(rows)
+
+    regressions = [row["path"] for row in rows if row["regressions"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:g}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+HTTP load driver for comparing gunicorn serving profiles.
+
+Opens --concurrency keep-alive connections, each in its own thread, and sends
+requests round-robin over the given targets for --duration seconds after a
+short warm-up. Prints requests/sec, error count and p50/p95/p99 latency,
+overall and per target. Only the standard library is used for the load
+itself, so it runs from the same venv as the API.
+
+A target is a path (GET) or "METHOD path". --all-routes requests every read
+route of flask_api/routes.py for --device; POST /api/devices/refresh is left
+out because it empties the caches being measured. --webhook adds
+POST /webhook/antares with fresh payloads from benchmark.datagen in every
+Antares format, encoded in the layouts served by /api/devices/{code}/sensors
+and timed after the newest stored reading.
+Save --json reports and compare them with benchmark.report.
+
+Usage (from the project root):
+    python -m benchmark.serving --url http://127.0.0.1:5000 [--path /health] [--path "POST /api/devices/refresh"]
+                                [--all-routes] [--webhook] [--device CZ1]
+                                [--concurrency 32] [--duration 20] [--warmup 3] [--api-key KEY] [--json]
+"""
+import os
+import time
+import json
+import argparse
+import threading
+import http.client
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PATHS = ["/health", "/api/latest-readings", "/api/CZ1/24"]
+
+WEBHOOK_TARGET = "POST /webhook/antares"
+
+# (method, path, request body or None)
+Request = Tuple[str, str, Optional[bytes]]
+
+def all_routes(device: str) -> List[str]:
+    """Every read route of flask_api/routes.py, with typical query parameters"""
+    return [
+        "/api/ping",
+        "/health",
+        "/api/latest-readings",
+        f"/api/latest-readings/{device}",
+        f"/api/{device}/history?bucket=1h&range=7d",
+        f"/api/{device}/24",
+        f"/api/{device}/7",
+        "/api/batch?range=24h&bucket=1h",
+        f"/api/{device}/export?format=ndjson&limit=1000",
+        "/api/devices",
+        f"/api/devices/{device}/sensors",
+        "/api/plants",
+        "/api/cache/stats",
+        "/api/db/stats",
+        "/metrics",
+    ]
+
+def parse_target(target: str) -> Tuple[str, str]:
+    """"/health" -> ("GET", "/health"), "POST /api/devices/refresh" -> ("POST", ...)"""
+    method, _, path = target.strip().rpartition(" ")
+    return (method.strip().upper() or "GET"), path
+
+class PayloadSource:
+    """Thread-safe stream of unique webhook payloads (JSON bytes)"""
+
+    def __init__(self, layouts: Dict[str, List[str]], start: datetime = None, seed: int = 1):
+        # Imported here so plain GET runs need nothing beyond the standard library
+        from benchmark.datagen import payload_stream
+        self._stream = payload_stream(layouts, start=start, seed=seed)
+        self._lock = threading.Lock()
+
+    def __call__(self) -> bytes:
+        with self._lock:
+            payload = next(self._stream)
+        return json.dumps(payload).encode()
+
+def webhook_source(url: str, api_key: str = None, seed: int = 1, timeout: float = 30) -> Optional[PayloadSource]:
+    """
+    Payloads in the sensor layouts served by the API under test, timed after
+    the newest stored reading so an earlier run's payloads are not repeated
+    (None when no device has a layout)
+    """
+    parts = urlsplit(url)
+    headers = {"X-API-KEY": api_key} if api_key else {}
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+
+    def get(path):
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        return json.loads(body) if response.status == 200 else {}
+
+    try:
+        layouts = {}
+        for device in get("/api/devices").get("devices", []):
+            sensors = get(f"/api/devices/{device['code']}/sensors").get("sensors", [])
+            if sensors:
+                layouts[device["code"]] = [sensor["sensor_type"] for sensor in
+                                           sorted(sensors, key=lambda sensor: sensor["sensor_order"])]
+        latest = [reading["timestamp"] for reading in get("/api/latest-readings").get("readings", [])]
+    finally:
+        conn.close()
+    if not layouts:
+        return None
+
+    # Stored timestamps are local time, serialized by Flask with a GMT label
+    start = max([datetime.now()] + [parsedate_to_datetime(timestamp).replace(tzinfo=None)
+                                    for timestamp in latest if timestamp])
+    return PayloadSource(layouts, start + timedelta(seconds=1), seed)
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+class Worker(threading.Thread):
+    """One client connection sending requests back to back"""
+
+    def __init__(self, host: str, port: int, paths: List[str], headers: Dict[str, str],
+                 offset: int, start_at: float, stop_at: float, timeout: float,
+                 bodies: Dict[str, Callable[[], bytes]] = None):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.paths = paths
+        self.requests = {path: parse_target(path) for path in paths}
+        self.bodies = bodies or {}
+        self.headers = headers
+        self.offset = offset
+        self.start_at = start_at
+        self.stop_at = stop_at
+        self.timeout = timeout
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_codes = defaultdict(lambda: defaultdict(int))
+
+    def _connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _send(self, conn, request: Request) -> int:
+        method, path, body = request
+        headers = self.headers
+        if body is not None:
+            headers = dict(headers, **{"Content-Type": "application/json"})
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.getheader("Connection", "").lower() == "close":
+            conn.close()
+        return response.status
+
+    def run(self):
+        conn = self._connect()
+        i = self.offset
+        while True:
+            now = time.monotonic()
+            if now >= self.stop_at:
+                break
+            path = self.paths[i % len(self.paths)]
+            i += 1
+            body = self.bodies[path]() if path in self.bodies else None
+            request = self.requests[path] + (body,)
+            now = time.monotonic()
+            status = None
+            try:
+                try:
+                    status = self._send(conn, request)
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # The server closed an idle keep-alive connection (keepalive
+                    # timeout, max_requests restart); retry once like urllib3 does
+                    conn.close()
+                    status = self._send(conn, request)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+            elapsed = time.monotonic() - now
+
+            # Requests that finished during the warm-up are not counted
+            if now < self.start_at:
+                continue
+            if ok:
+                self.latencies[path].append(elapsed)
+            else:
+                self.errors[path] += 1
+                self.error_codes[path][str(status or "connection")] += 1
+        conn.close()
+
+def summarize(latencies: List[float], errors: int, duration: float,
+              error_codes: Dict[str, int] = None) -> dict:
+    latencies.sort()
+    stats = {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+    if error_codes:
+        stats["error_codes"] = error_codes
+    return stats
+
+def run(url: str, paths: List[str], concurrency: int, duration: float, warmup: float,
+        api_key: str = None, timeout: float = 30,
+        bodies: Dict[str, Callable[[], bytes]] = None) -> dict:
+    parts = urlsplit(url)
+    headers = {"Connection": "keep-alive"}
+    if api_key:
+        headers["X-API-KEY"] = api_key
+
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+    workers = [
+        Worker(parts.hostname, parts.port or 80, paths, headers, n, start_at, stop_at, timeout, bodies)
+        for n in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    all_latencies = []
+    all_errors = 0
+    per_path = {}
+    for path in paths:
+        latencies = [value for worker in workers for value in worker.latencies[path]]
+        errors = sum(worker.errors[path] for worker in workers)
+        error_codes = defaultdict(int)
+        for worker in workers:
+            for code, count in worker.error_codes[path].items():
+                error_codes[code] += count
+        all_latencies.extend(latencies)
+        all_errors += errors
+        per_path[path] = summarize(latencies, errors, duration, dict(error_codes))
+
+    return {
+        "url": url,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "total": summarize(all_latencies, all_errors, duration),
+        "paths": per_path,
+    }
+
+def print_report(report: dict) -> None:
+    print(f"{report['url']}  concurrency={report['concurrency']}  duration={report['duration_s']}s")
+    width = max([32] + [len(path) for path in report["paths"]])
+    print(f"{'path':<{width}} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    rows = list(report["paths"].items()) + [("TOTAL", report["total"])]
+    for path, stats in rows:
+        print(f"{path:<{width}} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>9} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+        if stats.get("error_codes"):
+            codes = ", ".join(f"{code}: {count}" for code, count in sorted(stats["error_codes"].items()))
+            print(f"{'':<{width}}   errors by status: {codes}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure requests/sec and latency percentiles of the API")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="base URL of the running server")
+    parser.add_argument("--path", action="append",
+                        help=f"path or \"METHOD path\" to request (repeatable, default: {' '.join(DEFAULT_PATHS)})")
+    parser.add_argument("--all-routes", action="store_true", help="request every read route of the API")
+    parser.add_argument("--webhook", action="store_true", help=f"add {WEBHOOK_TARGET} with generated payloads")
+    parser.add_argument("--device", default="CZ1", help="device code used in --all-routes paths")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the --webhook payloads")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of load before measuring")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="X-API-KEY header (default: $API_KEY)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    paths = list(args.path or [])
+    if args.all_routes:
+        paths += all_routes(args.device)
+    bodies = {}
+    if args.webhook:
+        source = webhook_source(args.url, args.api_key, args.seed)
+        if source is None:
+            parser.error("--webhook: no device sensor layouts found (check --url and --api-key)")
+        paths.append(WEBHOOK_TARGET)
+        bodies[WEBHOOK_TARGET] = source
+
+    report = run(args.url, paths or DEFAULT_PATHS, args.concurrency, args.duration,
+                 args.warmup, args.api_key, bodies=bodies)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
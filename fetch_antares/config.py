@@ -4,6 +4,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 API_KEY = os.getenv("ANTARES_API_KEY")
+# Alamat aplikasi di Antares; untuk uji coba arahkan ke mock lokal (mock_antares.py),
+# mis. http://127.0.0.1:8443/~/antares-cse/antares-id
+ANTARES_BASE_URL = os.getenv("ANTARES_BASE_URL", "https://platform.antares.id:8443/~/antares-cse/antares-id").rstrip("/")
 HEADERS = {
     "X-M2M-Origin": API_KEY,
     "Content-Type": "application/json;ty=4",
@@ -25,3 +28,26 @@ DB_CONFIG = {
     "host": os.getenv("DB_HOST"),
     "port": os.getenv("DB_PORT")
 }
+
+# Mode polling: "sequential" (satu per satu) atau "concurrent" (paralel terbatas)
+POLL_MODE = os.getenv("POLL_MODE", "sequential")
+POLL_MAX_WORKERS = int(os.getenv("POLL_MAX_WORKERS", "8"))
+# Batas request bersamaan ke satu host Antares
+POLL_HOST_CONCURRENCY = int(os.getenv("POLL_HOST_CONCURRENCY", "4"))
+# Token bucket: rata-rata request per detik dan burst maksimum
+POLL_RATE_PER_SECOND = float(os.getenv("POLL_RATE_PER_SECOND", "2"))
+POLL_BURST = int(os.getenv("POLL_BURST", "4"))
+
+# Catch-up: ambil semua content instance sejak checkpoint terakhir per device
+# (tabel poller_checkpoints), bukan hanya yang terbaru (/la). 0 = mode lama
+POLL_CATCHUP = os.getenv("POLL_CATCHUP", "1") == "1"
+# Ukuran halaman dan jumlah halaman maksimum per device per run
+POLL_PAGE_SIZE = int(os.getenv("POLL_PAGE_SIZE", "100"))
+POLL_MAX_PAGES = int(os.getenv("POLL_MAX_PAGES", "20"))
+# Device tanpa checkpoint (run pertama) atau gangguan panjang: mundur paling jauh sekian jam
+POLL_MAX_CATCHUP_HOURS = float(os.getenv("POLL_MAX_CATCHUP_HOURS", "24"))
+
+# Pool koneksi database (dipakai ulang selama proses berjalan)
+DB_POOL_SIZE = int(os.getenv("POLL_DB_POOL_SIZE", "2"))
+# Koneksi yang menganggur lebih lama dari ini dicek dengan SELECT 1 sebelum dipakai
+DB_HEALTHCHECK_INTERVAL = int(os.getenv("POLL_DB_HEALTHCHECK_INTERVAL", "60"))
@@ -0,0 +1,120 @@
+# fetch_antares/db.py
+import time
+import logging
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import RealDictCursor, execute_values
+from contextlib import contextmanager
+from config import DB_CONFIG, DB_POOL_SIZE, DB_HEALTHCHECK_INTERVAL
+
+# Pool koneksi yang hidup selama proses poller berjalan
+connection_pool = None
+
+# Waktu terakhir koneksi dikembalikan ke pool, per id(conn)
+last_used = {}
+
+def init_connection_pool():
+    """Inisialisasi pool koneksi database"""
+    global connection_pool
+    try:
+        connection_pool = psycopg2.pool.ThreadedConnectionPool(
+            1, DB_POOL_SIZE,
+            cursor_factory=RealDictCursor,
+            **DB_CONFIG
+        )
+        logging.info("Pool koneksi database siap")
+    except Exception as e:
+        logging.error(f"Gagal inisialisasi pool koneksi: {e}")
+        raise
+
+def is_healthy(conn):
+    """Cek koneksi yang lama menganggur sebelum dipakai lagi"""
+    if conn.closed:
+        return False
+    used = last_used.get(id(conn))
+    if used is None or time.monotonic() - used < DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_db_connection():
+    """Ambil koneksi sehat dari pool; koneksi rusak dibuang dan diganti yang baru"""
+    if connection_pool is None:
+        init_connection_pool()
+
+    for _ in range(DB_POOL_SIZE + 1):
+        conn = connection_pool.getconn()
+        if is_healthy(conn):
+            return conn
+        logging.warning("Koneksi database tidak sehat, membuka koneksi baru")
+        return_db_connection(conn, close=True)
+
+    raise psycopg2.OperationalError("Tidak ada koneksi database yang sehat")
+
+def return_db_connection(conn, close=False):
+    """Kembalikan koneksi ke pool (close=True untuk membuang koneksi rusak)"""
+    if connection_pool and conn:
+        if close or conn.closed:
+            last_used.pop(id(conn), None)
+        else:
+            last_used[id(conn)] = time.monotonic()
+        connection_pool.putconn(conn, close=close or bool(conn.closed))
+
+@contextmanager
+def transaction():
+    """Satu transaksi: commit jika sukses, rollback jika gagal; koneksi putus dibuang"""
+    conn = get_db_connection()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except psycopg2.OperationalError:
+        broken = True
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_db_connection(conn, close=broken)
+
+def close_connection_pool():
+    """Tutup semua koneksi saat proses selesai"""
+    global connection_pool
+    if connection_pool:
+        connection_pool.closeall()
+        connection_pool = None
+        last_used.clear()
+
+def load_checkpoints(conn):
+    """Checkpoint catch-up semua device: {(app_name, device_code): (last_ct, last_ri)}"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT app_name, device_code, last_ct, last_ri FROM poller_checkpoints")
+        return {(row['app_name'], row['device_code']): (row['last_ct'], row['last_ri'])
+                for row in cur.fetchall()}
+    finally:
+        cur.close()
+
+def save_checkpoints(conn, checkpoints):
+    """Simpan checkpoint di transaksi yang sama dengan reading-nya (maju bersama, atau tidak sama sekali)"""
+    if not checkpoints:
+        return
+    cur = conn.cursor()
+    try:
+        execute_values(cur, """
+            INSERT INTO poller_checkpoints (app_name, device_code, last_ct, last_ri)
+            VALUES %s
+            ON CONFLICT (app_name, device_code) DO UPDATE SET
+                last_ct = EXCLUDED.last_ct,
+                last_ri = EXCLUDED.last_ri,
+                updated_at = CURRENT_TIMESTAMP
+        """, [(app_name, device_code, last_ct, last_ri)
+              for (app_name, device_code), (last_ct, last_ri) in checkpoints.items()])
+    finally:
+        cur.close()
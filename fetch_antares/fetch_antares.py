@@ -1,11 +1,29 @@
+import os
+import sys
 import requests
-import json
+from requests.adapters import HTTPAdapter
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import logging
 import time
-from config import HEADERS, APP_DEVICES, DB_CONFIG
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from config import (
+    HEADERS, ANTARES_BASE_URL, APP_DEVICES, POLL_MODE, POLL_MAX_WORKERS,
+    POLL_HOST_CONCURRENCY, POLL_RATE_PER_SECOND, POLL_BURST,
+    POLL_CATCHUP, POLL_PAGE_SIZE, POLL_MAX_PAGES, POLL_MAX_CATCHUP_HOURS
+)
+from rate_limit import RequestLimiter
+from db import transaction, close_connection_pool, load_checkpoints, save_checkpoints
+
+# Tambahkan root proyek ke path untuk modul shared
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.antares import cin_content, parse_timestamp, reading_time
+from shared.ingest import database_unavailable, insert_readings, recent_readings, valid_encoded_data
+from shared.latest_cache import latest_cache
+from shared.config import SharedConfig
+from shared.metrics import MetricsRegistry
 
 
 # Logging konfigurasi dasar
@@ -18,23 +36,38 @@ logging.basicConfig(
 # Session untuk koneksi HTTP reuse
 session = requests.Session()
 session.headers.update(HEADERS)
+session.mount("https://", HTTPAdapter(pool_maxsize=max(10, POLL_HOST_CONCURRENCY)))
 
-def get_latest_data(app_name, device_name, retries=3, delay=5):
-    url = f"https://platform.antares.id:8443/~/antares-cse/antares-id/{app_name}/{device_name}/la"
-    
+# Metrik sweep terakhir; ditulis ke METRICS_DIR/poller.prom dan ikut tampil di /metrics API
+poller_metrics = MetricsRegistry()
+fetch_seconds = poller_metrics.gauge(
+    "greenhouse_poller_fetch_duration_seconds",
+    "Duration of the last fetch per device, retries and rate limiting included", ["app", "device"])
+fetch_success = poller_metrics.gauge(
+    "greenhouse_poller_fetch_success", "1 when the last fetch of the device returned data", ["app", "device"])
+fetch_new = poller_metrics.gauge(
+    "greenhouse_poller_fetch_new_readings",
+    "Readings newer than the checkpoint found by the last fetch of the device", ["app", "device"])
+sweep_seconds = poller_metrics.gauge(
+    "greenhouse_poller_sweep_duration_seconds", "Duration of the last sweep")
+sweep_saved = poller_metrics.gauge(
+    "greenhouse_poller_sweep_readings_saved", "Readings saved by the last sweep")
+sweep_devices = poller_metrics.gauge(
+    "greenhouse_poller_sweep_devices", "Devices polled by the last sweep")
+sweep_finished = poller_metrics.gauge(
+    "greenhouse_poller_last_sweep_timestamp_seconds", "Unix time the last sweep finished")
+
+def antares_get(url, app_name, device_name, params=None, retries=3, delay=5, limiter=None):
+    """GET ke Antares dengan retry; isi JSON response, atau None jika semua percobaan gagal"""
     for attempt in range(retries):
         try:
             timeout = 30 + (attempt * 10)
-            response = session.get(url, timeout=timeout)
+            # Limiter (mode concurrent) mengatur laju dan jumlah request per host
+            with (limiter.slot(url) if limiter else nullcontext()):
+                response = session.get(url, params=params, timeout=timeout)
 
             if response.status_code == 200:
-                raw = response.json()["m2m:cin"]["con"]
-                parsed = json.loads(raw)
-                return {
-                    "device_code": device_name,  
-                    "encoded_data": parsed.get("data"),
-                    "timestamp": datetime.now()
-                }
+                return response.json()
             else:
                 logging.error(f"{app_name}/{device_name} - HTTP {response.status_code} (attempt {attempt+1})")
                 
@@ -53,70 +86,319 @@ def get_latest_data(app_name, device_name, retries=3, delay=5):
     logging.error(f"{app_name}/{device_name} - Gagal ambil data setelah {retries} percobaan")
     return None
 
+def cin_reading(device_name, cin):
+    """Reading dari satu content instance, atau None jika tidak berisi data"""
+    parsed = cin_content(cin) or {}
+    if not parsed.get("data"):
+        return None
+    # Aturan yang sama dengan webhook (HEX, panjang genap, maks. 64 digit): content
+    # instance rusak dilewati, checkpoint tetap maju melewatinya
+    if not valid_encoded_data(parsed.get("data")):
+        logging.warning(f"{device_name} - Data tidak valid dilewati (ri={cin.get('ri')}): {str(parsed.get('data'))[:80]}")
+        return None
+    return {
+        "device_code": device_name,
+        "encoded_data": parsed.get("data"),
+        # Waktu dari device/Antares (ct), bukan waktu polling: reading yang sama
+        # dari webhook atau sweep berikutnya punya key yang sama dan tidak disimpan dua kali
+        "timestamp": reading_time(parsed.get("timestamp"), cin.get("ct"))
+    }
+
+def cin_created(cin):
+    """ct content instance sebagai datetime UTC naive (format kolom poller_checkpoints.last_ct)"""
+    created = parse_timestamp(cin.get("ct"), assume_tz=timezone.utc)
+    if created.tzinfo is not None:
+        created = created.astimezone(timezone.utc).replace(tzinfo=None)
+    return created
+
+def get_latest_data(app_name, device_name, retries=3, delay=5, limiter=None):
+    body = antares_get(f"{ANTARES_BASE_URL}/{app_name}/{device_name}/la", app_name, device_name,
+                       retries=retries, delay=delay, limiter=limiter)
+    if body is None:
+        return None
+    try:
+        return cin_reading(device_name, body["m2m:cin"])
+    except (KeyError, TypeError) as e:
+        logging.error(f"{app_name}/{device_name} - Response /la tidak dikenali: {e}")
+        return None
+
+def get_new_data(app_name, device_name, checkpoint=None, limiter=None):
+    """
+    Semua content instance setelah checkpoint (last_ct, last_ri), dengan request list
+    oneM2M (rcn=4, ty=4, filter cra/crb). Tanpa checkpoint, atau jika checkpoint lebih
+    lama dari POLL_MAX_CATCHUP_HOURS, mulai dari batas itu.
+
+    Antares mengembalikan list terbaru dulu, jadi backlog diambil per jendela waktu
+    mulai dari yang terlama: jendela yang isinya tidak muat satu halaman POLL_PAGE_SIZE
+    dipersempit, dan checkpoint hanya maju melewati jendela yang sudah lengkap. Sisa
+    backlog setelah POLL_MAX_PAGES request diambil pada run berikutnya.
+    Return: (readings, checkpoint baru), atau None jika request pertama gagal (checkpoint tetap)
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    oldest = now - timedelta(hours=POLL_MAX_CATCHUP_HOURS)
+    last_ct, last_ri = checkpoint or (oldest, None)
+    if last_ct < oldest:
+        logging.warning(f"{app_name}/{device_name} - Checkpoint {last_ct} lebih lama dari "
+                        f"{POLL_MAX_CATCHUP_HOURS} jam, data sebelum {oldest} dilewati")
+        last_ct, last_ri = oldest, None
+
+    url = f"{ANTARES_BASE_URL}/{app_name}/{device_name}"
+    second = timedelta(seconds=1)
+    readings = []
+    newest = checkpoint  # hanya maju jika ada content instance baru atau jendela lengkap
+    seen = set()
+    lower, upper = last_ct, now
+    complete = False
+    for request in range(POLL_MAX_PAGES):
+        # Mundur satu detik: ct hanya sampai detik, dan cra bisa inklusif atau eksklusif.
+        # Content instance yang sudah tersimpan dilewati di bawah atau oleh ON CONFLICT
+        params = {"rcn": 4, "ty": 4, "cra": (lower - second).strftime("%Y%m%dT%H%M%S"), "lim": POLL_PAGE_SIZE}
+        if upper < now:
+            params["crb"] = upper.strftime("%Y%m%dT%H%M%S")
+        body = antares_get(url, app_name, device_name, limiter=limiter, params=params)
+        if body is None:
+            if request == 0:
+                return None
+            break
+        cins = (body.get("m2m:cnt") or {}).get("m2m:cin") or []
+
+        if len(cins) >= POLL_PAGE_SIZE and upper - lower > second:
+            # Jendela penuh: yang lebih lama dari halaman ini belum terambil. Persempit ke
+            # bagian terlama, seukuran perkiraan dari rentang waktu halaman (terbaru dulu)
+            filled = upper - min(cin_created(cin) for cin in cins)
+            length = max(second, min((upper - lower) / 2, filled * 0.8))
+            upper = lower + timedelta(seconds=max(1, int(length.total_seconds())))
+            continue
+        if len(cins) >= POLL_PAGE_SIZE:
+            logging.warning(f"{app_name}/{device_name} - Lebih dari {POLL_PAGE_SIZE} content instance "
+                            f"dalam satu detik ({lower}), sebagian bisa terlewat")
+
+        for cin in cins:
+            created, ri = cin_created(cin), cin.get("ri")
+            # Jendela bersebelahan berbagi satu detik: content instance bisa muncul dua kali
+            if created < last_ct or (created == last_ct and ri == last_ri) or (created, ri) in seen:
+                continue
+            seen.add((created, ri))
+            reading = cin_reading(device_name, cin)
+            if reading:
+                readings.append(reading)
+            if newest is None or created >= newest[0]:
+                newest = (created, ri)
+
+        if upper >= now:
+            complete = True
+            break
+        # Jendela lengkap: semua sebelum upper sudah diambil
+        if newest is None or newest[0] < upper:
+            newest = (upper, None)
+        # Jendela berikutnya sama panjang, atau dua kali lipat jika yang ini masih longgar
+        length = upper - lower
+        if len(cins) < POLL_PAGE_SIZE // 2:
+            length *= 2
+        lower, upper = upper, min(now, upper + length)
+
+    if not complete:
+        logging.warning(f"{app_name}/{device_name} - Backlog belum habis setelah {POLL_MAX_PAGES} request, "
+                        f"dilanjutkan pada run berikutnya dari {newest[0] if newest else last_ct}")
+    return readings, newest
+
+def fetch_device(app_name, device_name, checkpoint=None, limiter=None):
+    """
+    Ambil data baru satu device (get_new_data(), atau get_latest_data() jika POLL_CATCHUP=0)
+    dengan durasi dan hasil per device dicatat ke metrik
+    Return: (readings, checkpoint baru), atau None jika gagal
+    """
+    started = time.monotonic()
+    if POLL_CATCHUP:
+        result = get_new_data(app_name, device_name, checkpoint, limiter=limiter)
+    else:
+        data = get_latest_data(app_name, device_name, limiter=limiter)
+        result = ([data], checkpoint) if data else None
+    fetch_seconds.labels(app_name, device_name).set(time.monotonic() - started)
+    fetch_success.labels(app_name, device_name).set(1 if result else 0)
+    fetch_new.labels(app_name, device_name).set(len(result[0]) if result else 0)
+    return result
+
+def write_sweep_metrics(started, total_devices, successful):
+    sweep_seconds.set(time.monotonic() - started)
+    sweep_devices.set(total_devices)
+    sweep_saved.set(successful)
+    sweep_finished.set(time.time())
+    if SharedConfig.METRICS_DIR:
+        poller_metrics.write_textfile(os.path.join(SharedConfig.METRICS_DIR, "poller.prom"))
+
 def save_to_database(payload, app_name, device_name, retries=3):
+    if save_batch([payload], retries=retries):
+        logging.info(f"Data tersimpan: device_code={payload['device_code']}, data={payload['encoded_data']}")
+        return True
+    logging.error(f"{app_name}/{device_name} - Gagal simpan data ke DB")
+    return False
+
+def insert_skipping_rejected(conn, readings):
+    """
+    insert_readings() dalam savepoint. Jika database menolak datanya (mis. DataError),
+    reading disimpan satu per satu dan yang ditolak dilewati, sehingga satu reading
+    rusak tidak menggagalkan seluruh sweep. Error koneksi diteruskan.
+    """
+    if not readings:
+        return []
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT sweep_insert")
+    try:
+        inserted = insert_readings(conn, readings)
+        cur.execute("RELEASE SAVEPOINT sweep_insert")
+        return inserted
+    except Exception as e:
+        if database_unavailable(e):
+            raise
+        cur.execute("ROLLBACK TO SAVEPOINT sweep_insert")
+        if len(readings) == 1:
+            device_code, encoded_data, timestamp = readings[0]
+            logging.error(f"{device_code} - Reading {timestamp} ditolak database, dilewati: {e}")
+            return []
+        logging.warning(f"Batch {len(readings)} reading ditolak database, disimpan satu per satu: {e}")
+    finally:
+        cur.close()
+
+    inserted = []
+    for reading in readings:
+        inserted.extend(insert_skipping_rejected(conn, [reading]))
+    return inserted
+
+def save_batch(readings, checkpoints=None, retries=3):
+    """
+    Simpan semua data satu sweep dengan satu INSERT multi-row dalam satu transaksi,
+    bersama checkpoint device yang maju ({(app_name, device_code): (last_ct, last_ri)}).
+    Reading yang ditolak database dilewati (lihat insert_skipping_rejected()), jadi
+    checkpoint tetap maju dan sweep berikutnya tidak mengulang error yang sama
+    """
     for attempt in range(retries):
-        conn = None
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
+            with transaction() as conn:
+                # Reading beserta nilai sensor hasil decode (tabel sensor_values)
+                inserted = insert_skipping_rejected(conn, [
+                    (payload['device_code'], payload['encoded_data'], payload['timestamp'])
+                    for payload in readings
+                ])
+                # Gagal commit = checkpoint tidak maju, data yang sama diambil lagi run berikutnya
+                save_checkpoints(conn, checkpoints)
 
-            # Cari device berdasarkan code (device_name sama dengan device_code)
-            cur.execute("SELECT device_id FROM devices WHERE code = %s", (payload['device_code'],))
-            result = cur.fetchone()
-
-            if result:
-                device_id = result["device_id"]
-                cur.execute("""
-                    INSERT INTO sensor_readings (device_id, encoded_data, timestamp)
-                    VALUES (%s, %s, %s)
-                """, (device_id, payload['encoded_data'], payload['timestamp']))
-                conn.commit()
-                cur.close()
-                logging.info(f"Data tersimpan: device_code={payload['device_code']}, data={payload['encoded_data']}")
-                return True
-            else:
-                logging.error(f"{app_name}/{device_name} - Device code tidak ditemukan di database: {payload['device_code']}")
-                cur.close()
-                return False
+            # Setelah commit: perbarui cache reading terbaru (terlihat oleh API jika backend shared aktif)
+            # dan filter duplikat proses ini
+            latest_cache.update(inserted)
+            recent_readings.remember(inserted)
+            duplicates = len(readings) - len(inserted)
+            logging.info(f"Data tersimpan: {len(inserted)} reading dalam satu transaksi"
+                         + (f", {duplicates} sudah ada/dilewati" if duplicates else ""))
+            return len(inserted)
 
         except psycopg2.OperationalError as e:
-            logging.error(f"{app_name}/{device_name} - DB connection error: {e}")
+            # Koneksi rusak sudah dibuang oleh transaction(), percobaan berikut memakai koneksi baru
+            logging.error(f"DB connection error (batch, attempt {attempt+1}): {e}")
             time.sleep(2 * (attempt + 1))
         except Exception as e:
-            logging.error(f"{app_name}/{device_name} - DB Error: {e}")
+            logging.error(f"DB Error (batch): {e}")
             break
-        finally:
-            if conn:
-                conn.close()
-    
-    logging.error(f"{app_name}/{device_name} - Gagal simpan data ke DB setelah {retries} percobaan")
-    return False
+
+    logging.error(f"Gagal simpan {len(readings)} data ke DB setelah {retries} percobaan")
+    return 0
+
+def read_checkpoints():
+    """Checkpoint catch-up semua device (kosong jika POLL_CATCHUP=0)"""
+    if not POLL_CATCHUP:
+        return {}
+    with transaction() as conn:
+        return load_checkpoints(conn)
 
 def run_middleware():
     total_devices = sum(len(device_names) for device_names in APP_DEVICES.values())
     successful = 0
+    fetched = 0
+    started = time.monotonic()
     
     logging.info(f"Memulai middleware - total {total_devices} device")
+    checkpoints = read_checkpoints()
     
+    readings = []
+    advanced = {}  # checkpoint device yang maju pada sweep ini
     for app_name, device_names in APP_DEVICES.items():
         for device_name in device_names:
             logging.info(f"Memproses {app_name}/{device_name}")
-            data = get_latest_data(app_name, device_name)
-            if data and save_to_database(data, app_name, device_name):
-                successful += 1
-                logging.info(f"Berhasil memproses {device_name}: {data['encoded_data']}")
+            checkpoint = checkpoints.get((app_name, device_name))
+            result = fetch_device(app_name, device_name, checkpoint)
+            if result:
+                fetched += 1
+                data, new_checkpoint = result
+                readings.extend(data)
+                if new_checkpoint and new_checkpoint != checkpoint:
+                    advanced[(app_name, device_name)] = new_checkpoint
+                logging.info(f"Berhasil mengambil {device_name}: {len(data)} data baru")
             else:
                 logging.warning(f"Gagal memproses {device_name}")
             time.sleep(3)  # Delay antar request
     
-    logging.info(f"Selesai - {successful}/{total_devices} berhasil diproses")
+    # Semua data satu sweep disimpan dalam satu transaksi; tanpa data baru tidak ada query
+    if readings or advanced:
+        successful = save_batch(readings, advanced)
+    
+    write_sweep_metrics(started, total_devices, successful)
+    logging.info(f"Selesai - {fetched}/{total_devices} device berhasil, {successful} reading baru tersimpan")
+
+def run_middleware_concurrent():
+    """Polling semua device secara paralel; durasi sweep mengikuti device paling lambat"""
+    targets = [(app_name, device_name)
+               for app_name, device_names in APP_DEVICES.items()
+               for device_name in device_names]
+    total_devices = len(targets)
+    if not targets:
+        logging.info("Tidak ada device yang dikonfigurasi")
+        return
+
+    limiter = RequestLimiter(POLL_RATE_PER_SECOND, POLL_BURST, POLL_HOST_CONCURRENCY)
+    started = time.monotonic()
+    readings = []
+    advanced = {}
+    fetched = 0
+
+    logging.info(f"Memulai middleware (concurrent) - total {total_devices} device, "
+                 f"{POLL_MAX_WORKERS} worker, {POLL_HOST_CONCURRENCY} koneksi/host")
+    checkpoints = read_checkpoints()
+
+    with ThreadPoolExecutor(max_workers=min(POLL_MAX_WORKERS, total_devices)) as executor:
+        futures = {
+            executor.submit(fetch_device, app_name, device_name,
+                            checkpoints.get((app_name, device_name)), limiter=limiter): (app_name, device_name)
+            for app_name, device_name in targets
+        }
+        for future in as_completed(futures):
+            app_name, device_name = futures[future]
+            result = future.result()
+            if result:
+                fetched += 1
+                data, new_checkpoint = result
+                readings.extend(data)
+                if new_checkpoint and new_checkpoint != checkpoints.get((app_name, device_name)):
+                    advanced[(app_name, device_name)] = new_checkpoint
+                logging.info(f"Berhasil mengambil {device_name}: {len(data)} data baru")
+            else:
+                logging.warning(f"Gagal memproses {device_name}")
+
+    successful = save_batch(readings, advanced) if readings or advanced else 0
+    write_sweep_metrics(started, total_devices, successful)
+    elapsed = time.monotonic() - started
+    logging.info(f"Selesai - {fetched}/{total_devices} device berhasil, {successful} reading baru tersimpan "
+                 f"dalam {elapsed:.1f} detik")
 
 if __name__ == "__main__":
     try:
-        run_middleware()
+        if POLL_MODE == "concurrent":
+            run_middleware_concurrent()
+        else:
+            run_middleware()
     except KeyboardInterrupt:
         logging.info("Middleware dihentikan oleh user")
     except Exception as e:
         logging.critical(f"Critical error: {e}")
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+        close_connection_pool()
\ No newline at end of file
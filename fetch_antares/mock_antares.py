@@ -0,0 +1,169 @@
+"""
+Mock lokal HTTP API Antares untuk menguji poller tanpa platform asli.
+
+Setiap device menghasilkan satu content instance per --interval detik, mulai
+--history detik sebelum server dijalankan; data baru terus muncul selama server
+hidup. Endpoint yang ditiru (Antares/oneM2M):
+
+  GET {prefix}/{app}/{device}/la
+      -> {"m2m:cin": {...}}  (content instance terbaru)
+  GET {prefix}/{app}/{device}?rcn=4&ty=4&cra=20250913T062914&crb=20250913T072914&lim=100&ofst=0
+      -> {"m2m:cnt": {"rn": device, "m2m:cin": [...]}}  (terbaru dulu, cra < ct < crb)
+
+Request tanpa header X-M2M-Origin ditolak (403), seperti API key yang salah.
+
+Jalankan dari folder fetch_antares:
+    python mock_antares.py [--port 8443] [--devices CABAI:CZ1,CZ2;MELON:MZ1]
+                           [--interval 300] [--history 86400] [--fail-rate 0.1]
+lalu jalankan poller dengan
+    ANTARES_BASE_URL=http://127.0.0.1:8443/~/antares-cse/antares-id ANTARES_API_KEY=test
+"""
+import json
+import math
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+PREFIX = "/~/antares-cse/antares-id"
+
+# Jumlah sensor (nilai 16-bit dalam HEX) per aplikasi, seperti layout di device_sensors
+SENSORS_PER_APP = {"CABAI": 4}
+DEFAULT_SENSORS = 3
+
+class MockAntares:
+    """Content instance deterministik: instance ke-n device dibuat pada start + n * interval"""
+
+    def __init__(self, devices, interval, history, fail_rate=0.0):
+        self.devices = devices  # {(app, device): jumlah sensor}
+        self.interval = interval
+        self.start = time.time() - history
+        self.fail_rate = fail_rate
+        self.requests = 0
+
+    def count(self, now=None):
+        """Jumlah content instance per device yang sudah dibuat sampai sekarang"""
+        return int(((now or time.time()) - self.start) // self.interval) + 1
+
+    def cin(self, app, device, index):
+        created = datetime.fromtimestamp(self.start + index * self.interval, timezone.utc)
+        ct = created.strftime("%Y%m%dT%H%M%S")
+        rng = random.Random(f"{app}/{device}/{index}")
+        data = "".join(f"{rng.randrange(0, 1000):04X}" for _ in range(self.devices[(app, device)]))
+        return {
+            "rn": f"cin_{index}",
+            "ty": 4,
+            "ri": f"/antares-cse/cin-{device}-{index}",
+            "pi": f"/antares-cse/cnt-{device}",
+            "ct": ct,
+            "lt": ct,
+            "cnf": "text/plain:0",
+            "con": json.dumps({"type": "uplink", "port": 1, "data": data, "counter": index, "deviceName": device}),
+        }
+
+    def latest(self, app, device):
+        return {"m2m:cin": self.cin(app, device, self.count() - 1)}
+
+    def created_after(self, app, device, cra, lim, ofst, crb=None):
+        """Content instance dengan ct > cra (dan ct < crb), terbaru dulu, mulai dari ofst"""
+        newest = self.count() - 1
+        if crb:
+            before = datetime.strptime(crb, "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc).timestamp()
+            # Indeks terakhir dengan ct (sampai detik) < crb
+            newest = min(newest, math.floor((before - self.start) / self.interval) + 1)
+            while newest >= 0 and int(self.start + newest * self.interval) >= before:
+                newest -= 1
+        first = 0
+        if cra:
+            after = datetime.strptime(cra, "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc).timestamp()
+            # Indeks pertama dengan ct (sampai detik) > cra
+            first = max(0, math.ceil((after + 1 - self.start) / self.interval))
+            while first > 0 and int(self.start + (first - 1) * self.interval) > after:
+                first -= 1
+            while int(self.start + first * self.interval) <= after:
+                first += 1
+        indexes = range(newest - ofst, max(first, newest - ofst - lim + 1) - 1, -1)
+        return {"m2m:cnt": {"rn": device, "ty": 3,
+                            "m2m:cin": [self.cin(app, device, index) for index in indexes]}}
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, code, body):
+            payload = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            mock.requests += 1
+            url = urlsplit(self.path)
+            if not self.headers.get("X-M2M-Origin"):
+                return self.send_json(403, {"m2m:dbg": "Access denied"})
+            if mock.fail_rate and random.random() < mock.fail_rate:
+                return self.send_json(503, {"m2m:dbg": "Service unavailable (mock)"})
+            if not url.path.startswith(PREFIX + "/"):
+                return self.send_json(404, {"m2m:dbg": "Resource not found"})
+
+            parts = url.path[len(PREFIX) + 1:].split("/")
+            latest = parts[-1] == "la"
+            if latest:
+                parts = parts[:-1]
+            if len(parts) != 2 or tuple(parts) not in mock.devices:
+                return self.send_json(404, {"m2m:dbg": "Resource not found"})
+            app, device = parts
+
+            if latest:
+                return self.send_json(200, mock.latest(app, device))
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                lim = int(query.get("lim", 100))
+                ofst = int(query.get("ofst", 0))
+                body = mock.created_after(app, device, query.get("cra"), lim, ofst, query.get("crb"))
+            except ValueError as e:
+                return self.send_json(400, {"m2m:dbg": f"Bad request: {e}"})
+            self.send_json(200, body)
+
+        def log_message(self, format, *args):
+            logging.info(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+def parse_devices(text):
+    """"CABAI:CZ1,CZ2;MELON:MZ1" -> {(app, device): jumlah sensor}"""
+    devices = {}
+    for group in filter(None, text.split(";")):
+        app, names = group.split(":", 1)
+        for name in filter(None, names.split(",")):
+            devices[(app, name)] = SENSORS_PER_APP.get(app, DEFAULT_SENSORS)
+    return devices
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock lokal HTTP API Antares")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--devices", default="CABAI:CZ1,CZ2,CZ3,CZ4;MELON:MZ1,MZ2;SELADA:SZ12,SZ3,SZ4;GREENHOUSE:GZ1",
+                        help="app:device,device;app:device")
+    parser.add_argument("--interval", type=float, default=300, help="detik antar content instance per device")
+    parser.add_argument("--history", type=float, default=86400, help="detik data yang sudah ada saat start")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="porsi request yang dijawab 503")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    mock = MockAntares(parse_devices(args.devices), args.interval, args.history, args.fail_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    logging.info(f"Mock Antares di http://{args.host}:{args.port}{PREFIX} - {len(mock.devices)} device")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"Mock Antares berhenti setelah {mock.requests} request")
+
+if __name__ == "__main__":
+    main()
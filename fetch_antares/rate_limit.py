@@ -0,0 +1,52 @@
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """Token bucket: rata-rata `rate` token per detik, maksimum `capacity` token"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Ambil satu token, tunggu jika bucket kosong"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestLimiter:
+    """Gabungan token bucket global dan batas koneksi bersamaan per host"""
+
+    def __init__(self, rate, burst, per_host):
+        self.bucket = TokenBucket(rate, burst)
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+    @contextmanager
+    def slot(self, url):
+        """Tunggu token dan slot host sebelum request dikirim"""
+        semaphore = self._semaphore(urlsplit(url).netloc)
+        self.bucket.acquire()
+        with semaphore:
+            yield
@@ -0,0 +1,116 @@
+"""
+Catch-up poller (get_new_data) melawan mock_antares.MockAntares.
+
+Jalankan dari root proyek:
+    python -m pytest fetch_antares/test_catchup.py -q
+"""
+import os
+import sys
+import threading
+import importlib.util
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from mock_antares import MockAntares, PREFIX, make_handler
+
+APP, DEVICE = "CABAI", "CZ1"
+
+@pytest.fixture
+def poller(tmp_path, monkeypatch):
+    """fetch_antares.py sebagai modul; logging-nya menulis ke logs/ di folder sementara"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "logs").mkdir()
+    spec = importlib.util.spec_from_file_location("poller_under_test", os.path.join(HERE, "fetch_antares.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.session.headers["X-M2M-Origin"] = "test"
+    monkeypatch.setattr(module, "antares_get", _no_retry_delay(module.antares_get))
+    return module
+
+def _no_retry_delay(antares_get):
+    def wrapper(*args, **kwargs):
+        kwargs.setdefault("delay", 0)
+        return antares_get(*args, **kwargs)
+    return wrapper
+
+@pytest.fixture
+def mock(poller, monkeypatch):
+    """Mock Antares dengan 51 content instance, satu per menit"""
+    antares = MockAntares({(APP, DEVICE): 4}, interval=60, history=50 * 60)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(antares))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(poller, "ANTARES_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}{PREFIX}")
+    yield antares
+    server.shutdown()
+    server.server_close()
+
+def created(antares, index):
+    return datetime.fromtimestamp(int(antares.start + index * antares.interval), timezone.utc).replace(tzinfo=None)
+
+def poll_until_done(poller, antares, checkpoint, max_runs=50):
+    """Jalankan get_new_data seperti run cron berturut-turut; return (ct semua reading, jumlah run)"""
+    timestamps = []
+    for run in range(1, max_runs + 1):
+        before = antares.requests
+        readings, new_checkpoint = poller.get_new_data(APP, DEVICE, checkpoint)
+        assert antares.requests - before <= poller.POLL_MAX_PAGES
+        timestamps.extend(reading["timestamp"] for reading in readings)
+        if new_checkpoint == checkpoint:
+            return timestamps, run
+        checkpoint = new_checkpoint
+    raise AssertionError(f"Checkpoint masih berubah setelah {max_runs} run")
+
+def expected(antares, first):
+    return [created(antares, index) for index in range(first, antares.count())]
+
+def test_capped_backlog_is_fetched_over_several_runs(poller, mock, monkeypatch):
+    # 50 content instance tertunda, tetapi hanya 2 request x 10 per run
+    monkeypatch.setattr(poller, "POLL_PAGE_SIZE", 10)
+    monkeypatch.setattr(poller, "POLL_MAX_PAGES", 2)
+    checkpoint = (created(mock, 0), f"/antares-cse/cin-{DEVICE}-0")
+
+    timestamps, runs = poll_until_done(poller, mock, checkpoint)
+
+    assert sorted(set(ts.astimezone(timezone.utc).replace(tzinfo=None) for ts in timestamps)) == expected(mock, 1)
+    assert runs > 2
+
+def test_first_run_without_checkpoint(poller, mock, monkeypatch):
+    monkeypatch.setattr(poller, "POLL_PAGE_SIZE", 10)
+    monkeypatch.setattr(poller, "POLL_MAX_PAGES", 20)
+
+    timestamps, _ = poll_until_done(poller, mock, None)
+
+    assert sorted(set(ts.astimezone(timezone.utc).replace(tzinfo=None) for ts in timestamps)) == expected(mock, 0)
+
+def test_idle_run_keeps_checkpoint(poller, mock):
+    newest = mock.count() - 1
+    checkpoint = (created(mock, newest), f"/antares-cse/cin-{DEVICE}-{newest}")
+
+    readings, new_checkpoint = poller.get_new_data(APP, DEVICE, checkpoint)
+
+    assert readings == []
+    assert new_checkpoint == checkpoint
+
+def test_malformed_instance_is_skipped_and_passed(poller, mock, monkeypatch):
+    # Content instance ke-5 terlalu panjang untuk kolom encoded_data (VARCHAR(64))
+    cin = mock.cin
+    def with_malformed(app, device, index):
+        body = cin(app, device, index)
+        if index == 5:
+            body["con"] = body["con"].replace('"data": "', '"data": "' + "01F4" * 16)
+        return body
+    monkeypatch.setattr(mock, "cin", with_malformed)
+    monkeypatch.setattr(poller, "POLL_PAGE_SIZE", 100)
+    checkpoint = (created(mock, 0), f"/antares-cse/cin-{DEVICE}-0")
+
+    readings, new_checkpoint = poller.get_new_data(APP, DEVICE, checkpoint)
+
+    timestamps = sorted(reading["timestamp"].astimezone(timezone.utc).replace(tzinfo=None) for reading in readings)
+    assert timestamps == [ts for ts in expected(mock, 1) if ts != created(mock, 5)]
+    assert new_checkpoint[0] == created(mock, mock.count() - 1)
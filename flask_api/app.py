@@ -2,6 +2,7 @@
 import sys
 import os
 import logging
+from datetime import datetime
 from flask import Flask
 from flask_cors import CORS
 
@@ -14,6 +15,12 @@ from routes import bp
 # Import webhook functionality  
 from webhook import register_webhook_routes
 
+# Request timing and scrape-time gauges for /metrics
+from instrumentation import init_instrumentation
+
+# orjson, MessagePack and gzip/brotli responses
+from serialization import init_serialization
+
 def create_app():
     """Create Flask application with webhook support"""
     app = Flask(__name__)
@@ -29,6 +36,12 @@ def create_app():
         ]
     )
     
+    # Time requests (before any blueprint hook can return early)
+    init_instrumentation(app)
+    
+    # Fast JSON encoder and response compression (timed by the hook above)
+    init_serialization(app)
+    
     # Register existing API routes
     app.register_blueprint(bp)
     app.logger.info("API routes registered")
@@ -46,26 +59,25 @@ app = create_app()
 def health_check():
     """Simple health check for both API and webhook systems"""
     try:
-        from db import get_db_connection, return_db_connection
+        from db import db_connection
         
         # Test database connection
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT 1')
-        cur.close()
-        return_db_connection(conn)
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
         
         return {
             "status": "healthy",
             "database": "connected",
-            "timestamp": "2025-08-25T10:30:25.000Z"
+            "timestamp": datetime.now().isoformat()
         }, 200
         
     except Exception as e:
         return {
             "status": "unhealthy",
             "error": str(e),
-            "timestamp": "2025-08-25T10:30:25.000Z"
+            "timestamp": datetime.now().isoformat()
         }, 500
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+# flask_api/conditional.py
+import hashlib
+from datetime import datetime, timezone
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+
+def make_etag(*parts):
+    """ETag value from whatever identifies one version of a representation"""
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+def to_utc(value):
+    """HTTP dates are UTC; naive TIMESTAMP columns hold server local time"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def cache_control(max_age):
+    # private: responses depend on the API key, shared proxies must not keep them
+    return f"private, max-age={max_age}" if max_age > 0 else "private, no-cache"
+
+def with_validators(response, etag, last_modified=None, max_age=0):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = cache_control(max_age)
+    return response
+
+def not_modified(etag, last_modified=None, max_age=0):
+    """
+    304 response when the client's copy (If-None-Match / If-Modified-Since)
+    is still current, otherwise None. Call before building the body.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return with_validators(Response(status=304), etag, last_modified, max_age)
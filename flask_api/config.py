@@ -11,4 +11,20 @@ class Config:
     # Database connection pool settings
     DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
     DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
-    
+    # Seconds to wait for a free connection, and max connection age before it is replaced
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+    # Rows fetched per round trip by the streaming export's server-side cursor
+    EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+
+    # Cache-Control max-age (seconds) for metadata (devices, sensors, plants) and latest readings.
+    # 0 = clients revalidate on every request; unchanged data is answered with 304
+    METADATA_MAX_AGE = int(os.getenv("METADATA_MAX_AGE", "60"))
+    LATEST_MAX_AGE = int(os.getenv("LATEST_MAX_AGE", "0"))
+
+    # Responses smaller than this (bytes) are sent uncompressed
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    # Low levels keep compression cheap on the Raspberry Pi (gzip 1-9, brotli 0-11)
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+    BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
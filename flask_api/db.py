@@ -1,45 +1,218 @@
 # flask_api/db.py
+import time
+import threading
 import psycopg2
+from contextlib import contextmanager
 from psycopg2.extras import RealDictCursor
-from psycopg2 import pool
+from psycopg2 import pool, extensions
 from config import Config
 import logging
 
+class ConnectionPool:
+    """
+    Thread-safe connection pool with overflow, checkout timeout and recycling.
+
+    Keeps up to `size` idle connections. When all of them are checked out, up
+    to `max_overflow` extra connections are opened and closed again on return.
+    Beyond that, callers wait up to `timeout` seconds for a connection to come
+    back before PoolError is raised. Connections older than `recycle` seconds
+    are replaced on checkout and on return.
+    """
+
+    def __init__(self, dsn, size, max_overflow, timeout, recycle, **kwargs):
+        self.dsn = dsn
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.kwargs = kwargs
+
+        self._lock = threading.Condition()
+        self._idle = []       # connections ready for checkout, most recently used last
+        self._created = {}    # id(conn) -> creation time (monotonic) of every open connection
+        self._opening = 0     # connections being opened outside the lock
+        self._checked_out = 0
+
+        # Counters since startup
+        self._checkouts = 0
+        self._overflow_opened = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._discarded = 0
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn):
+        return self.recycle and time.monotonic() - self._created[id(conn)] > self.recycle
+
+    def getconn(self, timeout=None):
+        # timeout: checkout wait for this call instead of the pool default
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+        with self._lock:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        self._discarded += 1
+                        self._discard(conn)
+                        continue
+                    if self._expired(conn):
+                        self._recycled += 1
+                        self._discard(conn)
+                        continue
+                    break
+                opened = len(self._created) + self._opening
+                if opened < self.size + self.max_overflow:
+                    if opened >= self.size:
+                        self._overflow_opened += 1
+                    # Reserve the slot while connecting outside the lock
+                    self._opening += 1
+                    conn = None
+                    break
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise pool.PoolError(
+                        f"connection pool exhausted ({self.size} + {self.max_overflow} overflow "
+                        f"checked out, waited {timeout}s)")
+                waited = True
+                self._lock.wait(remaining)
+
+            self._checked_out += 1
+            self._checkouts += 1
+            if waited:
+                elapsed = time.monotonic() - started
+                self._waits += 1
+                self._wait_seconds += elapsed
+                self._max_wait_seconds = max(self._max_wait_seconds, elapsed)
+
+        if conn is None:
+            try:
+                conn = psycopg2.connect(dsn=self.dsn, **self.kwargs)
+            except Exception:
+                with self._lock:
+                    self._opening -= 1
+                    self._checked_out -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._opening -= 1
+                self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def putconn(self, conn):
+        # Roll back whatever the caller left open, so the next user starts clean
+        if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                conn.close()
+
+        with self._lock:
+            self._checked_out -= 1
+            if conn.closed:
+                self._discarded += 1
+                self._discard(conn)
+            elif self._expired(conn):
+                self._recycled += 1
+                self._discard(conn)
+            elif len(self._created) > self.size:
+                # Overflow connection: close it instead of keeping it idle
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            for conn in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    def stats(self):
+        """Pool counters for /api/db/stats"""
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - created for created in self._created.values()]
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": len(ages),
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+                "overflow": max(len(self._created) + self._opening - self.size, 0),
+                "checkouts": self._checkouts,
+                "overflow_opened": self._overflow_opened,
+                "waits": self._waits,
+                "wait_seconds_total": round(self._wait_seconds, 3),
+                "wait_seconds_max": round(self._max_wait_seconds, 3),
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "discarded": self._discarded,
+                "connection_age_max": round(max(ages), 1) if ages else 0,
+                "connection_age_avg": round(sum(ages) / len(ages), 1) if ages else 0
+            }
+
 # Connection pool for better performance
 connection_pool = None
+_pool_lock = threading.Lock()
 
 def init_connection_pool():
     """Initialize database connection pool"""
     global connection_pool
     try:
-        connection_pool = psycopg2.pool.ThreadedConnectionPool(
-            1, Config.DB_POOL_SIZE,
-            dsn=Config.DATABASE_URL,
+        new_pool = ConnectionPool(
+            Config.DATABASE_URL,
+            size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            timeout=Config.DB_POOL_TIMEOUT,
+            recycle=Config.DB_POOL_RECYCLE,
             cursor_factory=RealDictCursor
         )
+        # Open one connection up front so a bad DATABASE_URL fails here
+        new_pool.putconn(new_pool.getconn())
+        connection_pool = new_pool
         logging.info("Database connection pool initialized")
     except Exception as e:
         logging.error(f"Error initializing connection pool: {e}")
         raise
 
-def get_db_connection():
-    """Get database connection from pool"""
-    global connection_pool
+def get_db_connection(timeout=None):
+    """Get database connection from pool (prefer `with db_connection() as conn`)"""
     if connection_pool is None:
-        init_connection_pool()
-    
-    try:
-        return connection_pool.getconn()
-    except Exception as e:
-        logging.error(f"Error getting database connection: {e}")
-        # Fallback to direct connection
-        return psycopg2.connect(
-            dsn=Config.DATABASE_URL,
-            cursor_factory=RealDictCursor
-        )
+        with _pool_lock:
+            if connection_pool is None:
+                init_connection_pool()
+    return connection_pool.getconn(timeout)
 
 def return_db_connection(conn):
     """Return database connection to pool"""
-    global connection_pool
     if connection_pool and conn:
-        connection_pool.putconn(conn)
\ No newline at end of file
+        connection_pool.putconn(conn)
+
+@contextmanager
+def db_connection(timeout=None):
+    """
+    Borrow a pooled connection for the duration of a with-block. It always goes
+    back to the pool; an uncommitted transaction is rolled back on the way.
+    `timeout` overrides DB_POOL_TIMEOUT, the wait when every connection is in use.
+    """
+    conn = get_db_connection(timeout)
+    try:
+        yield conn
+    finally:
+        return_db_connection(conn)
+
+def pool_stats():
+    """Connection pool counters, None before the first connection"""
+    return connection_pool.stats() if connection_pool else None
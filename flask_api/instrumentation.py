@@ -0,0 +1,68 @@
+# flask_api/instrumentation.py
+import time
+from flask import g, request
+from db import pool_stats
+from shared.metrics import metrics
+from shared.latest_cache import latest_cache
+
+http_request_seconds = metrics.histogram(
+    "greenhouse_http_request_duration_seconds",
+    "Request latency by route (time until the response starts for streamed exports)",
+    ["method", "route", "status"]
+)
+
+# Pool counters read from pool_stats() at scrape time
+POOL_GAUGES = {
+    "open": "Open pooled connections",
+    "idle": "Idle pooled connections",
+    "checked_out": "Connections currently checked out",
+    "overflow": "Connections open beyond DB_POOL_SIZE",
+    "connection_age_max": "Age of the oldest pooled connection in seconds (oldest across workers)"
+}
+POOL_COUNTERS = {
+    "checkouts": "Connections handed out",
+    "overflow_opened": "Overflow connections opened beyond DB_POOL_SIZE",
+    "waits": "Checkouts that had to wait for a free connection",
+    "wait_seconds_total": "Total time spent waiting for a free connection",
+    "timeouts": "Checkouts that gave up after DB_POOL_TIMEOUT",
+    "recycled": "Connections replaced after DB_POOL_RECYCLE"
+}
+
+def _pool_value(key):
+    return lambda: (pool_stats() or {}).get(key, 0)
+
+def _cache_value(key):
+    return lambda: latest_cache.stats()[key] or 0
+
+def register_callbacks():
+    for key, documentation in POOL_GAUGES.items():
+        merge = "max" if key == "connection_age_max" else "sum"
+        metrics.gauge(f"greenhouse_db_pool_{key}", documentation, merge=merge).set_function(_pool_value(key))
+    for key, documentation in POOL_COUNTERS.items():
+        name = f"greenhouse_db_pool_{key}" if key.endswith("_total") else f"greenhouse_db_pool_{key}_total"
+        metrics.counter(name, documentation).set_function(_pool_value(key))
+
+    cache_lookups = metrics.counter("greenhouse_latest_cache_lookups_total",
+                                    "Latest-reading cache lookups by result", ["result"])
+    for result in ("hits", "shared_hits", "misses"):
+        cache_lookups.labels(result).set_function(_cache_value(result))
+    metrics.gauge("greenhouse_latest_cache_entries",
+                  "Devices in the local latest-reading cache").set_function(_cache_value("entries"))
+
+def init_instrumentation(app):
+    """Time every request and register the scrape-time gauges"""
+    register_callbacks()
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            # The URL rule, not the path, so device codes do not become labels
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            http_request_seconds.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - started)
+        return response
@@ -1,9 +1,21 @@
 # flask_api/routes.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import re
+import csv
+import io
 import logging
+from datetime import datetime
 from functools import wraps
-from db import get_db_connection
+from contextlib import nullcontext
+import psycopg2.extensions
+from db import db_connection, get_db_connection, return_db_connection, pool_stats
 from config import Config
+from shared.device_registry import device_registry
+from shared.decoder import reading_decoder
+from shared.latest_cache import latest_cache
+from shared.metrics import metrics, execute_timed
+from conditional import make_etag, to_utc, with_validators, not_modified
+from serialization import wants_columnar, to_columns, negotiated, representation, dumps_line
 
 bp = Blueprint("api", __name__)
 
@@ -14,6 +26,9 @@ def require_api_key(f):
     def decorated(*args, **kwargs):
         if request.endpoint not in ("api.ping", "api.health"):
             client_key = request.headers.get("X-API-KEY")
+            if client_key is None and request.headers.get("Authorization", "").startswith("Bearer "):
+                # Scrapers such as Prometheus can only send the key as a bearer token
+                client_key = request.headers["Authorization"][len("Bearer "):]
             if client_key != Config.API_KEY:
                 logging.warning(f"Unauthorized access attempt from {request.remote_addr}")
                 return jsonify({"status": "error", "message": "Unauthorized"}), 401
@@ -31,6 +46,56 @@ def handle_db_error(f):
             return jsonify({"status": "error", "message": "Internal server error"}), 500
     return decorated
 
+# History durations: <n>h, <n>d or <n>w (rollups are hourly, so 1h is the finest bucket)
+DURATION_UNITS = {"h": 3600, "d": 86400, "w": 604800}
+MAX_HISTORY_BUCKETS = 2000
+
+def parse_duration(value):
+    """'4h' -> 14400 seconds, None when invalid"""
+    match = re.fullmatch(r"(\d+)([hdw])", value or "")
+    if not match or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+def wants_decoded():
+    """True when the client asked for server-side decoding (?decoded=1)"""
+    return request.args.get("decoded", "").lower() in ("1", "true", "yes")
+
+def registry_connection():
+    """
+    Pool connection for device registry lookups, or None (no checkout) while
+    the in-memory snapshot is still fresh, so registry-served responses and
+    their 304s do not take a connection from the pool
+    """
+    return db_connection() if device_registry.reload_due() else nullcontext()
+
+def attach_decoded_values(rows, device_code=None):
+    """Decode rows that did not come with a connection (e.g. cache hits)"""
+    with registry_connection() as conn:
+        reading_decoder.attach_values(conn, rows, device_code)
+
+def latest_validators(kind, rows):
+    """
+    ETag from the reading id of each device (plus the sensor layout when
+    decoding, and the negotiated format), Last-Modified from the newest
+    reading. Both come from the latest-reading cache and the device registry
+    when they are warm, so a 304 needs no query and no pool connection.
+    """
+    parts = [representation()] + [f"{row['device_code']}:{row['reading_id']}" for row in rows]
+    if wants_decoded():
+        with registry_connection() as conn:
+            parts.append(device_registry.fingerprint(conn))
+    newest = max((row["timestamp"] for row in rows if row["timestamp"] is not None), default=None)
+    return make_etag(kind, *parts), to_utc(newest)
+
+def metadata_etag(conn, kind, *extra):
+    """
+    ETag from the device registry fingerprint (the same in every worker).
+    No Last-Modified: the metadata tables carry no change time, and a load time
+    would differ per worker and break revalidation across them.
+    """
+    return make_etag(kind, device_registry.fingerprint(conn), *extra)
+
 # Health Check
 @bp.route("/api/ping")
 def ping():
@@ -39,214 +104,520 @@ def ping():
 @bp.route("/health")
 def health():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.close()
-        conn.close()
-        return jsonify({"status": "healthy", "database": "connected", "tunnel": "active"}), 200
+        with db_connection() as conn:
+            cur = conn.cursor()
+            execute_timed(cur, "health", "SELECT 1")
+            cur.close()
+        return jsonify({"status": "healthy", "database": "connected", "tunnel": "active",
+                        "timestamp": datetime.now().isoformat()}), 200
     except Exception as e:
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        return jsonify({"status": "unhealthy", "error": str(e),
+                        "timestamp": datetime.now().isoformat()}), 500
+
+def fetch_latest(conn, device_ids=None):
+    """Latest reading of every device (or of device_ids), devices without readings are left out"""
+    cur = conn.cursor()
+    # One top-1 index lookup per device on (device_id, timestamp DESC)
+    # instead of sorting the whole sensor_readings table
+    execute_timed(cur, "latest_readings", """
+        SELECT
+            lr.reading_id,
+            d.code AS device_code,
+            z.zone_code,
+            lr.encoded_data,
+            lr.timestamp
+        FROM devices d
+        JOIN zones z ON d.zone_id = z.zone_id
+        CROSS JOIN LATERAL (
+            SELECT sr.reading_id, sr.encoded_data, sr.timestamp
+            FROM sensor_readings sr
+            WHERE sr.device_id = d.device_id
+            ORDER BY sr.timestamp DESC
+            LIMIT 1
+        ) lr
+        WHERE %(device_ids)s::int[] IS NULL OR d.device_id = ANY(%(device_ids)s::int[])
+        ORDER BY d.device_id;
+    """, {"device_ids": device_ids})
+    rows = cur.fetchall()
+    cur.close()
+    return rows
 
 # Latest Readings (All Devices)
 @bp.route("/api/latest-readings", methods=["GET"])
 @require_api_key
 @handle_db_error
 def latest_readings():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT DISTINCT ON (d.device_id)
-            sr.reading_id,
-            z.zone_code,
-            sr.encoded_data,
-            sr.timestamp
-        FROM sensor_readings sr
-        JOIN devices d ON sr.device_id = d.device_id
-        JOIN zones z ON d.zone_id = z.zone_id
-        ORDER BY d.device_id, sr.timestamp DESC;
-    """)
-    data = cur.fetchall()
-    conn.close()
+    # Served from the latest-reading cache when every device is warm
+    data = latest_cache.get_all()
+    if data is None:
+        with db_connection() as conn:
+            data = fetch_latest(conn)
+        latest_cache.fill_all(data)
 
-    return jsonify({
+    etag, last_modified = latest_validators("latest", data)
+    cached = not_modified(etag, last_modified, Config.LATEST_MAX_AGE)
+    if cached:
+        return cached
+
+    # Copies, so decoding never touches cached entries
+    data = [dict(row) for row in data]
+    if wants_decoded():
+        attach_decoded_values(data)
+
+    return with_validators(negotiated({
         "status": "success",
         "count": len(data),
-        "readings": data
-    }), 200
+        "readings": to_columns(data) if wants_columnar() else data
+    }), etag, last_modified, Config.LATEST_MAX_AGE), 200
 
 # Latest Reading (Single Device)
 @bp.route("/api/latest-readings/<device_code>", methods=["GET"])
 @require_api_key
 @handle_db_error
 def latest_reading_device(device_code):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT sr.encoded_data, sr.timestamp
-        FROM sensor_readings sr
-        JOIN devices d ON sr.device_id = d.device_id
-        WHERE d.code = %s
-        ORDER BY sr.timestamp DESC
-        LIMIT 1;
-    """, (device_code,))
-    row = cur.fetchone()
-    conn.close()
+    found, row = latest_cache.get(device_code)
+    if not found:
+        with db_connection() as conn:
+            device = device_registry.get_device(conn, device_code)
+            if device is None:
+                return jsonify({"status": "error", "message": "Device not found"}), 404
+
+            cur = conn.cursor()
+            execute_timed(cur, "latest_reading_device", """
+                SELECT reading_id, encoded_data, timestamp
+                FROM sensor_readings
+                WHERE device_id = %s
+                ORDER BY timestamp DESC
+                LIMIT 1;
+            """, (device["device_id"],))
+            row = cur.fetchone()
+
+        if row:
+            row = dict(row, device_code=device_code, zone_code=device["zone_code"])
+        latest_cache.fill(device_code, row)
 
     if not row:
         return jsonify({"status": "error", "message": "Device not found"}), 404
 
-    return jsonify({"status": "success", "device_code": device_code, "reading": row}), 200
+    etag, last_modified = latest_validators("latest-device", [row])
+    cached = not_modified(etag, last_modified, Config.LATEST_MAX_AGE)
+    if cached:
+        return cached
+
+    reading = {"encoded_data": row["encoded_data"], "timestamp": row["timestamp"]}
+    if wants_decoded():
+        attach_decoded_values([reading], device_code)
+
+    return with_validators(negotiated({"status": "success", "device_code": device_code, "reading": reading}),
+                           etag, last_modified, Config.LATEST_MAX_AGE), 200
+
+# Sensor history from the hourly/daily rollup tables
+@bp.route("/api/<device_code>/history", methods=["GET"])
+@require_api_key
+@handle_db_error
+def readings_history(device_code):
+    return history_response(device_code,
+                            request.args.get("bucket", "1h"),
+                            request.args.get("range", "24h"))
 
-# 24-Hour Interval (4 Hours Step)
+# 24-Hour Interval (4 Hours Step) - same as /history?bucket=4h&range=24h
 @bp.route("/api/<device_code>/24", methods=["GET"])
 @require_api_key
 @handle_db_error
 def readings_24h(device_code):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT sr.encoded_data, sr.timestamp
-        FROM sensor_readings sr
-        JOIN devices d ON sr.device_id = d.device_id
-        WHERE d.code = %s
-          AND sr.timestamp >= NOW() - INTERVAL '24 HOURS'
-        ORDER BY date_trunc('hour', sr.timestamp)::timestamp / INTERVAL '4 HOURS', sr.timestamp DESC;
-    """, (device_code,))
-    data = cur.fetchall()
-    conn.close()
-
-    return jsonify({"status": "success", "device_code": device_code, "interval": "4h", "readings": data}), 200
-
-# 7-Day Average (Daily)
+    return history_response(device_code, "4h", "24h", interval="4h")
+
+# 7-Day Average (Daily) - same as /history?bucket=1d&range=7d
 @bp.route("/api/<device_code>/7", methods=["GET"])
 @require_api_key
 @handle_db_error
 def readings_7d(device_code):
-    conn = get_db_connection()
+    return history_response(device_code, "1d", "7d", interval="1d")
+
+def parse_history_args(bucket, range_):
+    """(bucket_seconds, range_seconds, error_response); error_response is None when valid"""
+    bucket_seconds = parse_duration(bucket)
+    range_seconds = parse_duration(range_)
+    if not bucket_seconds or not range_seconds:
+        return None, None, (jsonify({"status": "error", "message": "Invalid bucket or range (use e.g. 1h, 4h, 1d, 7d, 2w)"}), 400)
+    if range_seconds // bucket_seconds > MAX_HISTORY_BUCKETS:
+        return None, None, (jsonify({"status": "error", "message": f"Too many buckets (max {MAX_HISTORY_BUCKETS})"}), 400)
+    return bucket_seconds, range_seconds, None
+
+def fetch_history(conn, devices, bucket_seconds, range_seconds):
+    """
+    Rollup buckets for several devices with one query.
+    devices: {device_id: DecodePlan}; returns {device_id: [bucket, ...]} newest first
+    """
+    # Whole-day buckets read the daily rollup, everything else the hourly one
+    if bucket_seconds % 86400 == 0:
+        table, unit = "sensor_rollup_daily", "day"
+    else:
+        table, unit = "sensor_rollup_hourly", "hour"
+
+    history = {device_id: [] for device_id in devices}
+    if not devices:
+        return history
+
     cur = conn.cursor()
-    cur.execute("""
-        SELECT 
-            to_char(date_trunc('day', sr.timestamp), 'YYYY-MM-DD') AS day,
-            AVG((sr.encoded_data)::numeric) AS avg_encoded,
-            MIN(sr.timestamp) AS sample_time
-        FROM sensor_readings sr
-        JOIN devices d ON sr.device_id = d.device_id
-        WHERE d.code = %s
-          AND sr.timestamp >= NOW() - INTERVAL '7 DAYS'
-        GROUP BY date_trunc('day', sr.timestamp)
-        ORDER BY day DESC;
-    """, (device_code,))
-    data = cur.fetchall()
-    conn.close()
-
-    return jsonify({"status": "success", "device_code": device_code, "interval": "1d", "readings": data}), 200
+    execute_timed(cur, "history", f"""
+        SELECT
+            device_id,
+            to_timestamp(floor(extract(epoch FROM bucket_start) / %(bucket)s) * %(bucket)s)
+                AT TIME ZONE 'UTC' AS bucket_start,
+            device_sensor_id,
+            MIN(min_value) AS min,
+            MAX(max_value) AS max,
+            SUM(sum_value) / SUM(sample_count) AS avg,
+            SUM(sample_count) AS count
+        FROM {table}
+        WHERE device_id = ANY(%(device_ids)s)
+          AND bucket_start >= date_trunc(%(unit)s, (NOW() - make_interval(secs => %(range)s))::timestamp)
+        GROUP BY device_id, 2, device_sensor_id
+        ORDER BY device_id, 2 DESC, device_sensor_id;
+    """, {"bucket": bucket_seconds, "range": range_seconds, "unit": unit, "device_ids": list(devices)})
+
+    keys = {device_id: dict(zip(plan.device_sensor_ids, plan.keys)) for device_id, plan in devices.items()}
+    current = {}
+    for row in cur.fetchall():
+        device_id = row["device_id"]
+        entry = current.get(device_id)
+        if entry is None or entry["bucket_start"] != row["bucket_start"]:
+            entry = current[device_id] = {"bucket_start": row["bucket_start"], "sensors": {}}
+            history[device_id].append(entry)
+        sensor = row["device_sensor_id"]
+        entry["sensors"][keys[device_id].get(sensor, str(sensor))] = {
+            "min": row["min"],
+            "max": row["max"],
+            "avg": row["avg"],
+            "count": row["count"]
+        }
+    cur.close()
+    return history
+
+def history_response(device_code, bucket, range_, **extra):
+    bucket_seconds, range_seconds, error = parse_history_args(bucket, range_)
+    if error:
+        return error
+
+    with db_connection() as conn:
+        buckets = []
+        device_id = device_registry.get_device_id(conn, device_code)
+        plan = reading_decoder.plan_for(conn, device_code)
+        if device_id is not None and plan is not None:
+            buckets = fetch_history(conn, {device_id: plan}, bucket_seconds, range_seconds)[device_id]
+
+    return negotiated({
+        "status": "success",
+        "device_code": device_code,
+        "bucket": bucket,
+        "range": range_,
+        **extra,
+        "buckets": to_columns(buckets) if wants_columnar() else buckets
+    }), 200
+
+def split_arg(name):
+    """?devices=CZ1,CZ2&devices=MZ1 -> ['CZ1', 'CZ2', 'MZ1']"""
+    return [item.strip() for value in request.args.getlist(name) for item in value.split(",") if item.strip()]
+
+# Latest reading and history of many devices in one request (dashboard)
+@bp.route("/api/batch", methods=["GET"])
+@require_api_key
+@handle_db_error
+def batch_readings():
+    codes = set(split_arg("devices"))
+    zones = set(split_arg("zones"))
+    try:
+        plants = {int(plant_id) for plant_id in split_arg("plants")}
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid plants (use plant ids)"}), 400
+
+    include = set(split_arg("include") or ["latest", "history"])
+    if not include <= {"latest", "history"}:
+        return jsonify({"status": "error", "message": "Invalid include (use latest, history)"}), 400
+
+    bucket = request.args.get("bucket", "4h")
+    range_ = request.args.get("range", "24h")
+    if "history" in include:
+        bucket_seconds, range_seconds, error = parse_history_args(bucket, range_)
+        if error:
+            return error
+
+    with db_connection() as conn:
+        # Selection is resolved from the registry; no selector means every device
+        selected = [
+            device for device in device_registry.devices(conn)
+            if not (codes or zones or plants)
+            or device["code"] in codes
+            or device["zone_code"] in zones
+            or device["plant_id"] in plants
+        ]
+
+        latest = {}
+        if "latest" in include:
+            missing = []
+            for device in selected:
+                found, row = latest_cache.get(device["code"])
+                if found:
+                    latest[device["code"]] = row
+                else:
+                    missing.append(device)
+            if missing:
+                rows = {row["device_code"]: row for row in fetch_latest(conn, [d["device_id"] for d in missing])}
+                for device in missing:
+                    row = rows.get(device["code"])
+                    latest[device["code"]] = row
+                    latest_cache.fill(device["code"], row)
+
+            # Copies, so decoding never touches cached entries
+            latest = {code: dict(row) if row else None for code, row in latest.items()}
+            if wants_decoded():
+                reading_decoder.attach_values(conn, [row for row in latest.values() if row])
+
+        history = {}
+        if "history" in include:
+            plans = {}
+            for device in selected:
+                plan = reading_decoder.plan_for(conn, device["code"])
+                if plan is not None:
+                    plans[device["device_id"]] = plan
+            history = fetch_history(conn, plans, bucket_seconds, range_seconds)
+
+    results = []
+    for device in selected:
+        entry = {
+            "device_code": device["code"],
+            "zone_code": device["zone_code"],
+            "plant_id": device["plant_id"]
+        }
+        if "latest" in include:
+            entry["latest"] = latest.get(device["code"])
+        if "history" in include:
+            buckets = history.get(device["device_id"], [])
+            entry["buckets"] = to_columns(buckets) if wants_columnar() else buckets
+        results.append(entry)
+
+    response = {"status": "success", "count": len(results)}
+    if "history" in include:
+        response.update(bucket=bucket, range=range_)
+    response["devices"] = results
+    return negotiated(response), 200
+
+def parse_export_cursor(value):
+    """'2025-01-01T10:00:00,12345' -> (timestamp, reading_id), None when invalid"""
+    timestamp, _, reading_id = (value or "").rpartition(",")
+    try:
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except ValueError:
+        return None
+
+def export_rows(conn, device_id, start, end, after, limit):
+    """
+    Yield lists of (reading_id, timestamp, encoded_data) in (timestamp, reading_id)
+    order from a server-side cursor, so memory use does not depend on the range
+    """
+    # Named cursor: Postgres keeps the result set, we fetch EXPORT_FETCH_SIZE rows at a time
+    cur = conn.cursor(name="export_readings", cursor_factory=psycopg2.extensions.cursor)
+    try:
+        execute_timed(cur, "export", """
+            SELECT reading_id, timestamp, encoded_data
+            FROM sensor_readings
+            WHERE device_id = %(device_id)s
+              AND timestamp >= COALESCE(%(start)s::timestamp, '-infinity')
+              AND timestamp < COALESCE(%(end)s::timestamp, 'infinity')
+              AND (timestamp, reading_id) > (COALESCE(%(after_ts)s::timestamp, '-infinity'), %(after_id)s)
+            ORDER BY timestamp, reading_id
+            LIMIT %(limit)s;
+        """, {"device_id": device_id, "start": start, "end": end,
+              "after_ts": after[0], "after_id": after[1], "limit": limit})
+        while True:
+            rows = cur.fetchmany(Config.EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+# Streaming export of raw readings (NDJSON or CSV), resumable with ?after=
+@bp.route("/api/<device_code>/export", methods=["GET"])
+@require_api_key
+@handle_db_error
+def export_readings(device_code):
+    export_format = request.args.get("format", "ndjson").lower()
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"status": "error", "message": "Invalid format (use ndjson or csv)"}), 400
+
+    try:
+        start = datetime.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        end = datetime.fromisoformat(request.args["to"]) if request.args.get("to") else None
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid from, to or limit"}), 400
+    if limit is not None and limit <= 0:
+        return jsonify({"status": "error", "message": "Invalid from, to or limit"}), 400
+
+    after = (None, 0)
+    if request.args.get("after"):
+        after = parse_export_cursor(request.args["after"])
+        if after is None:
+            return jsonify({"status": "error", "message": "Invalid after (use <timestamp>,<reading_id>)"}), 400
+
+    # Held until the response has been streamed, so not a with-block
+    conn = get_db_connection()
+    try:
+        device_id = device_registry.get_device_id(conn, device_code)
+        plan = reading_decoder.plan_for(conn, device_code) if wants_decoded() else None
+    except Exception:
+        return_db_connection(conn)
+        raise
+    if device_id is None:
+        return_db_connection(conn)
+        return jsonify({"status": "error", "message": "Device not found"}), 404
+
+    keys = plan.keys if plan else ()
+
+    def generate():
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["reading_id", "timestamp", "encoded_data", *keys])
+        for rows in export_rows(conn, device_id, start, end, after, limit):
+            values = plan.unpack_many([row[2] for row in rows]) if plan else [None] * len(rows)
+            if export_format == "csv":
+                for (reading_id, timestamp, encoded_data), decoded in zip(rows, values):
+                    writer.writerow([reading_id, timestamp.isoformat(), encoded_data,
+                                     *(decoded or [""] * len(keys))])
+                chunk = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                lines = []
+                for (reading_id, timestamp, encoded_data), decoded in zip(rows, values):
+                    line = {"reading_id": reading_id, "timestamp": timestamp.isoformat(),
+                            "encoded_data": encoded_data}
+                    if plan:
+                        line["values"] = dict(zip(keys, decoded)) if decoded else None
+                    lines.append(dumps_line(line))
+                chunk = "\n".join(lines) + "\n"
+            yield chunk
+        if export_format == "csv" and buffer.tell():
+            yield buffer.getvalue()
+
+    if export_format == "csv":
+        response = Response(stream_with_context(generate()), mimetype="text/csv")
+        response.headers["Content-Disposition"] = f'attachment; filename="{device_code}_export.csv"'
+    else:
+        response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    # Runs when the response is finished or the client disconnects
+    response.call_on_close(lambda: return_db_connection(conn))
+    return response
 
 # Get all devices with their zone information
 @bp.route("/api/devices", methods=["GET"])
 @require_api_key
 @handle_db_error
 def get_devices():
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        query = """
-            SELECT 
-                d.device_id,
-                d.dev_eui,
-                d.code,
-                d.description,
-                z.zone_code,
-                z.zone_label,
-                p.name as plant_name
-            FROM devices d
-            JOIN zones z ON d.zone_id = z.zone_id
-            LEFT JOIN plants p ON z.plant_id = p.plant_id
-            ORDER BY d.code;
-        """
-        
-        cur.execute(query)
-        results = cur.fetchall()
+    with registry_connection() as conn:
+        # Served from the registry cache, which already joins zones and plants
+        etag = metadata_etag(conn, "devices")
+        cached = not_modified(etag, max_age=Config.METADATA_MAX_AGE)
+        if cached:
+            return cached
+
+        results = [
+            {key: device[key] for key in ("device_id", "code", "description",
+                                          "zone_code", "zone_label", "plant_name")}
+            for device in device_registry.devices(conn)
+        ]
         
-        return jsonify({
+        return with_validators(jsonify({
             "devices": results,
             "count": len(results)
-        }), 200
-        
-    finally:
-        conn.close()
+        }), etag, max_age=Config.METADATA_MAX_AGE), 200
 
 #Get sensors for a specific device
 @bp.route("/api/devices/<device_code>/sensors", methods=["GET"])
 @require_api_key
 @handle_db_error
 def get_device_sensors(device_code):
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        query = """
-            SELECT 
-                ds.device_sensor_id,
-                ds.sensor_label,
-                ds.sensor_order,
-                s.sensor_type,
-                s.unit,
-                s.sensor_model
-            FROM device_sensors ds
-            JOIN devices d ON ds.device_id = d.device_id
-            JOIN sensors s ON ds.sensor_id = s.sensor_id
-            WHERE d.code = %s
-            ORDER BY ds.sensor_order;
-        """
-        
-        cur.execute(query, (device_code,))
-        results = cur.fetchall()
-        
-        if not results:
-            return jsonify({"error": "Device not found or no sensors"}), 404
-        
-        return jsonify({
-            "device_code": device_code,
-            "sensors": results
-        }), 200
-        
-    finally:
-        conn.close()
+    with registry_connection() as conn:
+        # Sensor layout comes from the registry cache
+        sensors = device_registry.get_sensors(conn, device_code)
+    if not sensors and conn is None:
+        # Unknown code: the registry may reload to look for a newly added device
+        with db_connection() as conn:
+            sensors = device_registry.get_sensors(conn, device_code)
+
+    results = [
+        {key: sensor[key] for key in ("device_sensor_id", "sensor_label", "sensor_order",
+                                      "sensor_type", "unit", "sensor_model")}
+        for sensor in sensors
+    ]
+    
+    if not results:
+        return jsonify({"error": "Device not found or no sensors"}), 404
+
+    # The registry was just loaded above, so its snapshot needs no connection
+    etag = metadata_etag(None, "sensors", device_code)
+    cached = not_modified(etag, max_age=Config.METADATA_MAX_AGE)
+    if cached:
+        return cached
+    
+    return with_validators(jsonify({
+        "device_code": device_code,
+        "sensors": results
+    }), etag, max_age=Config.METADATA_MAX_AGE), 200
+
+# Reload the device registry after devices, zones or sensors change
+@bp.route("/api/devices/refresh", methods=["POST"])
+@require_api_key
+@handle_db_error
+def refresh_devices():
+    with db_connection() as conn:
+        device_registry.invalidate()
+        devices = device_registry.devices(conn)
+
+    return jsonify({
+        "status": "success",
+        "version": device_registry.version,
+        "count": len(devices)
+    }), 200
 
 @bp.route("/api/plants", methods=["GET"])
 @require_api_key
 @handle_db_error
 def get_plants():
     """Get all plants"""
-    conn = get_db_connection()
-    try:
-        cur = conn.cursor()
-        
-        query = """
-            SELECT 
-                p.plant_id,
-                p.name,
-                p.media_type,
-                p.description,
-                COUNT(z.zone_id) as zone_count
-            FROM plants p
-            LEFT JOIN zones z ON p.plant_id = z.plant_id
-            GROUP BY p.plant_id, p.name, p.media_type, p.description
-            ORDER BY p.name;
-        """
-        
-        cur.execute(query)
-        results = cur.fetchall()
+    with registry_connection() as conn:
+        etag = metadata_etag(conn, "plants")
+        cached = not_modified(etag, max_age=Config.METADATA_MAX_AGE)
+        if cached:
+            return cached
+
+        results = device_registry.plants(conn)
         
-        return jsonify({
+        return with_validators(jsonify({
             "plants": results,
             "count": len(results)
-        }), 200
-        
-    finally:
-        conn.close()
+        }), etag, max_age=Config.METADATA_MAX_AGE), 200
+
+# Latest-reading cache counters for tuning LATEST_CACHE_* settings
+@bp.route("/api/cache/stats", methods=["GET"])
+@require_api_key
+def cache_stats():
+    return jsonify({"status": "success", "latest_readings": latest_cache.stats()}), 200
+
+# Connection pool counters for tuning DB_POOL_* settings and spotting leaks
+@bp.route("/api/db/stats", methods=["GET"])
+@require_api_key
+def db_stats():
+    return jsonify({"status": "success", "pool": pool_stats()}), 200
+
+# Prometheus scrape endpoint (send the API key as X-API-KEY or a bearer token)
+@bp.route("/metrics", methods=["GET"])
+@require_api_key
+def prometheus_metrics():
+    return Response(metrics.render_all(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 # Error handlers
 @bp.errorhandler(404)
@@ -0,0 +1,195 @@
+# flask_api/serialization.py
+import json
+import zlib
+import decimal
+from datetime import date, datetime, timezone
+from flask import Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from config import Config
+
+# Optional accelerators: without them responses fall back to stdlib JSON and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# Flask formats datetimes as HTTP dates; building them directly is much cheaper than http_date()
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# Compressing anything else (images, already compressed data) only costs CPU
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", MSGPACK_MIMETYPE, "text/csv", "text/plain")
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify() through orjson. Output matches Flask's provider (sorted keys,
+    HTTP dates, Decimal as string) so clients see no difference.
+    """
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, datetime):
+            # Naive values are taken as UTC, like http_date() does
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc)
+            return (f"{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} "
+                    f"{value.year:04d} {value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+        return DefaultJSONProvider.default(value)
+
+    def _options(self, indent=False, sort_keys=None):
+        # Datetimes go through self.default, which formats them like Flask does
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        option = self._options(kwargs.get("indent"), kwargs.get("sort_keys"))
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent=pretty))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+def dumps_line(obj):
+    """One compact JSON document, keys in insertion order (NDJSON export lines)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+def _msgpack_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+def wants_columnar():
+    """True when the client asked for one array per field (?columnar=1)"""
+    return request.args.get("columnar", "").lower() in ("1", "true", "yes")
+
+def to_columns(rows):
+    """
+    [{"a": 1, "b": {"c": 2}}, {"a": 3, "b": None}] -> {"a": [1, 3], "b": {"c": [2, None]}}
+    Nested objects become nested columns; missing fields are None.
+    """
+    keys = {}
+    for row in rows:
+        keys.update(dict.fromkeys(row or ()))
+    columns = {}
+    for key in keys:
+        values = [row.get(key) if row else None for row in rows]
+        if any(isinstance(value, dict) for value in values) and all(
+                value is None or isinstance(value, dict) for value in values):
+            columns[key] = to_columns(values)
+        else:
+            columns[key] = values
+    return columns
+
+def response_format():
+    """Negotiated body format of the readings routes: "json" or "msgpack" (Accept header)"""
+    if msgpack is None:
+        return "json"
+    best = request.accept_mimetypes.best_match(("application/json",) + MSGPACK_ALIASES)
+    return "msgpack" if best in MSGPACK_ALIASES else "json"
+
+def representation():
+    """Identifies the negotiated variant, for ETags"""
+    return f"{response_format()}{'-columnar' if wants_columnar() else ''}"
+
+def negotiated(payload):
+    """Response in the format the client accepts (JSON unless it asks for MessagePack)"""
+    if response_format() == "msgpack":
+        response = Response(msgpack.packb(payload, default=_msgpack_default, use_bin_type=True),
+                            mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(payload)
+    response.vary.add("Accept")
+    return response
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def _compressor(encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=Config.BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits=31: gzip container
+    compressor = zlib.compressobj(Config.GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+class _CompressedStream:
+    """Compresses a streamed body chunk by chunk; each chunk is flushed so the client keeps receiving data"""
+
+    def __init__(self, iterable, encoding):
+        self.iterable = iterable
+        self.encoding = encoding
+
+    def __iter__(self):
+        compress, flush, finish = _compressor(self.encoding)
+        for chunk in self.iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+
+    def close(self):
+        # Let the original iterable run its cleanup, even when streaming never started
+        close = getattr(self.iterable, "close", None)
+        if close is not None:
+            close()
+
+def compress_response(response):
+    """gzip/brotli for large responses when the client accepts it (after_request)"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "Content-Encoding" in response.headers or request.method == "HEAD"):
+        return response
+    if not response.is_streamed and response.content_length is not None \
+            and response.content_length < Config.COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _CompressedStream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        compress, _, finish = _compressor(encoding)
+        response.set_data(compress(response.get_data()) + finish())
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+def init_serialization(app):
+    """orjson for jsonify() when installed, and response compression"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.after_request(compress_response)
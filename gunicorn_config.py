@@ -1,10 +1,95 @@
 # gunicorn_config.py
-bind = "127.0.0.1:5000"
-workers = 2
-worker_class = "sync"
-worker_connections = 1000
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Serving profile (GUNICORN_WORKER_CLASS):
+#   sync    - one request at a time per worker (baseline)
+#   gthread - GUNICORN_THREADS requests per worker, one pooled DB connection per thread
+#   gevent  - up to GUNICORN_WORKER_CONNECTIONS greenlets per worker, needs `pip install gevent`
+# See benchmark/README.md for measured throughput and latency of each profile.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+
+if worker_class == "gevent":
+    # The master hooks below import shared/, whose singletons create their
+    # locks at import time. Patch first, or the forked workers inherit real
+    # OS locks that block every greenlet while one of them waits on a query.
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8")) if worker_class == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
 timeout = 30
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
-preload_app = True
+
+# gevent must patch the stdlib before the app is imported, so it cannot preload
+preload_app = worker_class != "gevent"
+
+# Size the per-worker DB pool to the requests a worker can run at once,
+# unless DB_POOL_SIZE is set explicitly
+if worker_class == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+elif worker_class == "gevent":
+    # Greenlets beyond this plus DB_MAX_OVERFLOW wait up to DB_POOL_TIMEOUT for a connection
+    os.environ.setdefault("DB_POOL_SIZE", os.getenv("GEVENT_DB_POOL_SIZE", "20"))
+
+
+def _gevent_wait_callback(conn, timeout=None):
+    """Let other greenlets run while psycopg2 waits on the socket"""
+    from psycopg2 import OperationalError, extensions
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state}")
+
+
+def on_starting(server):
+    # Worker snapshots of a previous run would be added to the new totals
+    from shared.metrics import metrics
+    metrics.clear_published()
+
+
+def post_worker_init(worker):
+    if worker_class == "gevent":
+        from psycopg2 import extensions
+        extensions.set_wait_callback(_gevent_wait_callback)
+
+    # Share this worker's metrics with the others through METRICS_DIR
+    from shared.metrics import metrics
+    metrics.start_publisher()
+
+    # Replay readings spooled while the database was unavailable (one worker at a time)
+    from webhook.webhook_spool import reading_spool
+    reading_spool.start()
+
+
+def worker_exit(server, worker):
+    # Flush readings still buffered by the webhook ingest queue
+    from webhook.webhook_queue import ingest_queue
+    ingest_queue.shutdown()
+
+    # After the queue: a failed final flush still goes to the spool
+    from webhook.webhook_spool import reading_spool
+    reading_spool.stop()
+
+    from shared.metrics import metrics
+    metrics.publish()
+
+
+def child_exit(server, worker):
+    # Keep the exited worker's counters in /metrics without keeping its file
+    from shared.metrics import metrics
+    metrics.archive_worker(worker.pid)
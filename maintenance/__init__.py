@@ -0,0 +1,12 @@
+"""
+Python maintenance jobs for the Smart Greenhouse database.
+Run from the project root, e.g. `python -m maintenance.backfill_sensor_values`.
+
+Components:
+- config.py: Database settings (same .env variables as the shell scripts)
+- backfill_sensor_values.py: Decode existing readings into sensor_values
+- rollups.py: Rebuild hourly/daily rollups from sensor_values
+- compaction.py: Batched, resumable downsampling of old sensor_readings
+- partitions.py: Create upcoming and expire old sensor data partitions
+- partition_migration.py: Online move of existing data into partitioned tables
+"""
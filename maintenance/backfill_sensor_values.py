@@ -0,0 +1,80 @@
+"""
+Decode readings stored before sensor_values existed.
+
+Walks sensor_readings by reading_id in keyset-paginated batches, one commit
+per batch, so it can run next to the webhook and be stopped and resumed
+(--start-after) at any time.
+
+Usage (from the project root):
+    python -m maintenance.backfill_sensor_values [--batch-size 5000] [--sleep 0.1]
+"""
+import time
+import logging
+import argparse
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from shared.ingest import insert_sensor_values
+from .config import DB_CONFIG
+
+def backfill(conn, batch_size: int, pause: float, start_after: int = 0) -> int:
+    """Decode every reading without sensor_values; returns readings processed"""
+    last_id = start_after
+    total = 0
+    started = time.monotonic()
+
+    while True:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("""
+            SELECT
+                sr.reading_id,
+                sr.device_id,
+                d.code AS device_code,
+                sr.encoded_data,
+                sr.timestamp
+            FROM sensor_readings sr
+            JOIN devices d ON sr.device_id = d.device_id
+            WHERE sr.reading_id > %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM sensor_values sv WHERE sv.reading_id = sr.reading_id
+              )
+            ORDER BY sr.reading_id
+            LIMIT %s;
+        """, (last_id, batch_size))
+        batch = cur.fetchall()
+        cur.close()
+
+        if not batch:
+            break
+
+        values = insert_sensor_values(conn, batch)
+        conn.commit()
+
+        last_id = batch[-1]['reading_id']
+        total += len(batch)
+        rate = total / max(time.monotonic() - started, 1e-6)
+        logging.info(f"Backfilled {total} readings ({values} values in last batch), "
+                     f"last reading_id={last_id}, {rate:.0f} readings/s")
+
+        if pause:
+            time.sleep(pause)
+
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill sensor_values from sensor_readings")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--sleep", type=float, default=0.1, help="pause between batches (seconds)")
+    parser.add_argument("--start-after", type=int, default=0, help="resume after this reading_id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        total = backfill(conn, args.batch_size, args.sleep, args.start_after)
+        logging.info(f"Backfill complete: {total} readings decoded")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Downsample old sensor_readings in small batches.
+
+Retention policy (same as the old greenhouse_maintenance.sh):
+- older than 7 days: keep the first reading per device per hour
+- older than 90 days: keep the first reading per device per day
+- older than 365 days: keep the first reading per device per week
+
+Each tier walks sensor_readings in (timestamp, reading_id) keyset order up to
+its cutoff and deletes, one short transaction per batch, every reading that
+is not the first reading of its device in its bucket. The position is
+stored in maintenance_checkpoints in the same transaction, so the next run
+continues where the last one stopped and only looks at newly aged data.
+Readings inserted later with a timestamp behind that position (poller
+catch-up, spool replay, backfills) are found by a second checkpoint on
+reading_id, i.e. insertion order: each run first compacts the buckets of
+readings inserted since the previous run that landed behind the position.
+sensor_values rows go with their readings (ON DELETE CASCADE); the rollup
+tables are left alone and keep the full-resolution aggregates.
+
+Usage (from the project root):
+    python -m maintenance.compaction [--tier hourly] [--batch-size 2000] [--sleep 0.1]
+                                     [--max-rate 5000] [--max-runtime 1800] [--restart]
+"""
+import time
+import logging
+import argparse
+import psycopg2
+import psycopg2.errors
+from .config import DB_CONFIG
+
+# Tier name, bucket (date_trunc unit) and age in days after which it applies
+TIERS = (
+    ("hourly", "hour", 7),
+    ("daily", "day", 90),
+    ("weekly", "week", 365),
+)
+
+# Give way to the webhook instead of queueing behind (or in front of) its writes
+LOCK_TIMEOUT = "2s"
+STATEMENT_TIMEOUT = "60s"
+MAX_RETRIES = 5
+
+def checkpoint_name(tier: str) -> str:
+    return f"compaction:{tier}"
+
+def late_checkpoint_name(tier: str) -> str:
+    return f"compaction:{tier}:late"
+
+def load_checkpoint(conn, job: str):
+    """(last_timestamp, last_reading_id) of the previous run, None if there is none"""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT last_timestamp, last_reading_id
+            FROM maintenance_checkpoints
+            WHERE job = %s;
+        """, (job,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    conn.commit()
+    return (row[0], row[1]) if row else None
+
+def save_checkpoint(cur, job: str, last_ts, last_id: int, scanned: int) -> None:
+    cur.execute("""
+        INSERT INTO maintenance_checkpoints (job, last_timestamp, last_reading_id, rows_processed, updated_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (job) DO UPDATE SET
+            last_timestamp = EXCLUDED.last_timestamp,
+            last_reading_id = EXCLUDED.last_reading_id,
+            rows_processed = maintenance_checkpoints.rows_processed + EXCLUDED.rows_processed,
+            updated_at = EXCLUDED.updated_at;
+    """, (job, last_ts, last_id, scanned))
+
+def reset_checkpoints(conn) -> None:
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM maintenance_checkpoints WHERE job LIKE %s;", (checkpoint_name('%'),))
+        conn.commit()
+    finally:
+        cur.close()
+
+def compact_batch(cur, unit: str, cutoff, last_ts, last_id: int, batch_size: int):
+    """
+    Scan the next batch_size readings older than cutoff and delete the ones that
+    are not the first of their device/bucket. Returns (scanned, deleted,
+    last_timestamp, last_reading_id), or None when the tier is done.
+    """
+    cur.execute(f"""
+        WITH batch AS (
+            SELECT reading_id, device_id, timestamp
+            FROM sensor_readings
+            WHERE timestamp < %(cutoff)s
+              AND (timestamp, reading_id) > (COALESCE(%(last_ts)s::timestamp, '-infinity'), %(last_id)s)
+            ORDER BY timestamp, reading_id
+            LIMIT %(limit)s
+        ),
+        deleted AS (
+            DELETE FROM sensor_readings sr
+            USING batch b
+            WHERE sr.reading_id = b.reading_id
+              AND sr.timestamp = b.timestamp
+              -- First reading of the bucket: one (device_id, timestamp) index probe
+              AND b.reading_id <> (
+                  SELECT e.reading_id
+                  FROM sensor_readings e
+                  WHERE e.device_id = b.device_id
+                    AND e.timestamp >= date_trunc('{unit}', b.timestamp)
+                  ORDER BY e.timestamp, e.reading_id
+                  LIMIT 1
+              )
+            RETURNING sr.reading_id
+        )
+        SELECT
+            (SELECT COUNT(*) FROM batch),
+            (SELECT COUNT(*) FROM deleted),
+            last.timestamp,
+            last.reading_id
+        FROM (
+            SELECT timestamp, reading_id FROM batch
+            ORDER BY timestamp DESC, reading_id DESC
+            LIMIT 1
+        ) last;
+    """, {"cutoff": cutoff, "last_ts": last_ts, "last_id": last_id, "limit": batch_size})
+    return cur.fetchone()
+
+def compact_late_batch(cur, unit: str, cutoff, behind, after_id: int, until_id: int, batch_size: int):
+    """
+    Scan the next batch_size readings inserted after after_id (up to until_id)
+    with a timestamp at or before `behind`, the tier checkpoint they arrived
+    behind, and compact their whole device/buckets again: a late reading can be
+    the new first reading of its bucket. Returns (scanned, deleted, None,
+    last_reading_id), or None when there are no more.
+    """
+    cur.execute(f"""
+        WITH batch AS (
+            SELECT reading_id, device_id, timestamp
+            FROM sensor_readings
+            WHERE reading_id > %(after_id)s AND reading_id <= %(until_id)s
+              AND timestamp <= %(behind)s
+            ORDER BY reading_id
+            LIMIT %(limit)s
+        ),
+        buckets AS (
+            SELECT DISTINCT device_id, date_trunc('{unit}', timestamp) AS bucket FROM batch
+        ),
+        deleted AS (
+            DELETE FROM sensor_readings sr
+            USING buckets k
+            WHERE sr.device_id = k.device_id
+              AND sr.timestamp >= k.bucket
+              AND sr.timestamp < k.bucket + interval '1 {unit}'
+              AND sr.timestamp < %(cutoff)s
+              AND sr.reading_id <> (
+                  SELECT e.reading_id
+                  FROM sensor_readings e
+                  WHERE e.device_id = k.device_id
+                    AND e.timestamp >= k.bucket
+                  ORDER BY e.timestamp, e.reading_id
+                  LIMIT 1
+              )
+            RETURNING sr.reading_id
+        )
+        SELECT
+            (SELECT COUNT(*) FROM batch),
+            (SELECT COUNT(*) FROM deleted),
+            NULL::timestamp,
+            MAX(reading_id)
+        FROM batch
+        HAVING COUNT(*) > 0;
+    """, {"cutoff": cutoff, "behind": behind, "after_id": after_id, "until_id": until_id,
+          "limit": batch_size})
+    return cur.fetchone()
+
+def run_batches(conn, label: str, job: str, step, position, pause: float,
+                max_rate: float, deadline: float = None):
+    """
+    Call step(cur, last_ts, last_id) batch by batch, saving its position under
+    `job` in the same transaction, until it returns None or the deadline passes.
+    Returns (readings deleted, True when step finished).
+    """
+    last_ts, last_id = position
+    scanned_total = 0
+    deleted_total = 0
+    retries = 0
+    finished = False
+    started = time.monotonic()
+
+    while deadline is None or time.monotonic() < deadline:
+        batch_started = time.monotonic()
+        cur = conn.cursor()
+        try:
+            result = step(cur, last_ts, last_id)
+            if result is None:
+                conn.commit()
+                finished = True
+                break
+            scanned, deleted, last_ts, last_id = result
+            save_checkpoint(cur, job, last_ts, last_id, scanned)
+            conn.commit()
+            retries = 0
+        except (psycopg2.errors.LockNotAvailable, psycopg2.errors.QueryCanceled) as e:
+            # Busy rows or a slow batch: back off and retry the same batch
+            conn.rollback()
+            retries += 1
+            if retries > MAX_RETRIES:
+                raise
+            logging.warning(f"[{label}] Batch after reading_id={last_id} gave way ({e.pgcode}), retry {retries}")
+            time.sleep(min(2 ** retries, 30))
+            continue
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+        scanned_total += scanned
+        deleted_total += deleted
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logging.info(f"[{label}] {scanned_total} scanned, {deleted_total} deleted "
+                     f"({scanned_total / elapsed:.0f} rows/s), at {last_ts or ''} #{last_id}")
+
+        # Throttle: fixed pause, stretched to stay under max_rate rows/s
+        delay = pause
+        if max_rate:
+            delay = max(delay, scanned / max_rate - (time.monotonic() - batch_started))
+        if delay > 0:
+            time.sleep(delay)
+    else:
+        logging.info(f"[{label}] Time budget used up, will resume from reading_id={last_id}")
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logging.info(f"[{label}] Done: {scanned_total} scanned, {deleted_total} deleted "
+                 f"in {elapsed:.1f}s ({scanned_total / elapsed:.0f} rows/s)")
+    return deleted_total, finished
+
+def compact_tier(conn, tier: str, unit: str, days: int, batch_size: int,
+                 pause: float, max_rate: float, deadline: float = None) -> int:
+    """
+    Run one tier: first the readings inserted since the last run behind its
+    checkpoint (backfills, replays), then from its checkpoint to its cutoff.
+    Returns readings deleted.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT (NOW() - make_interval(days => %s))::timestamp, "
+                "(SELECT COALESCE(MAX(reading_id), 0) FROM sensor_readings);", (days,))
+    cutoff, newest_id = cur.fetchone()
+    cur.close()
+    conn.commit()
+
+    last_ts, last_id = load_checkpoint(conn, checkpoint_name(tier)) or (None, 0)
+    late = load_checkpoint(conn, late_checkpoint_name(tier))
+    deleted_total = 0
+
+    if last_ts is not None and (late is None or late[1] < newest_id):
+        # Without a late checkpoint (first run of this version) every reading behind
+        # the checkpoint is looked at once
+        late_id = late[1] if late else 0
+        logging.info(f"[{tier}] Compacting readings inserted after #{late_id} "
+                     f"with a timestamp up to {last_ts:%Y-%m-%d %H:%M}")
+        deleted, finished = run_batches(
+            conn, f"{tier} late", late_checkpoint_name(tier),
+            lambda cur, _, after_id: compact_late_batch(cur, unit, cutoff, last_ts, after_id,
+                                                        newest_id, batch_size),
+            (None, late_id), pause, max_rate, deadline)
+        deleted_total += deleted
+        if not finished:
+            return deleted_total
+    if late is None or late[1] < newest_id:
+        # Everything up to newest_id is now either behind the checkpoint and
+        # compacted, or ahead of it and left to the walk below
+        cur = conn.cursor()
+        try:
+            save_checkpoint(cur, late_checkpoint_name(tier), None, newest_id, 0)
+            conn.commit()
+        finally:
+            cur.close()
+
+    logging.info(f"[{tier}] Compacting readings older than {cutoff:%Y-%m-%d %H:%M} "
+                 f"to one per {unit}, starting after {last_ts or 'the beginning'}")
+    deleted, _ = run_batches(
+        conn, tier, checkpoint_name(tier),
+        lambda cur, ts, reading_id: compact_batch(cur, unit, cutoff, ts, reading_id, batch_size),
+        (last_ts, last_id), pause, max_rate, deadline)
+    return deleted_total + deleted
+
+def main():
+    parser = argparse.ArgumentParser(description="Downsample old sensor_readings in small batches")
+    parser.add_argument("--tier", choices=[name for name, _, _ in TIERS], action="append",
+                        help="tier to run (repeatable, default: all)")
+    parser.add_argument("--batch-size", type=int, default=2000, help="readings scanned per transaction")
+    parser.add_argument("--sleep", type=float, default=0.1, help="pause between batches (seconds)")
+    parser.add_argument("--max-rate", type=float, default=0, help="max readings scanned per second (0 = no limit)")
+    parser.add_argument("--max-runtime", type=float, default=0, help="stop after this many seconds (0 = no limit)")
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and rescan from the beginning")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    deadline = time.monotonic() + args.max_runtime if args.max_runtime else None
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'; SET statement_timeout = '{STATEMENT_TIMEOUT}';")
+        cur.close()
+        conn.commit()
+
+        if args.restart:
+            reset_checkpoints(conn)
+
+        total = 0
+        for name, unit, days in TIERS:
+            if args.tier and name not in args.tier:
+                continue
+            total += compact_tier(conn, name, unit, days, args.batch_size,
+                                  args.sleep, args.max_rate, deadline)
+        logging.info(f"Compaction complete: {total} readings deleted")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Same variables as greenhouse_maintenance.sh and fetch_antares/config.py
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT")
+}
+
+# sensor_readings/sensor_values partitions (maintenance.partitions)
+PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "month")    # month | week
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", 3))       # future partitions kept ready
+PARTITION_RETENTION_DAYS = int(os.getenv("PARTITION_RETENTION_DAYS", 0))  # 0 = keep everything
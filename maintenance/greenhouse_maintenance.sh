@@ -18,6 +18,7 @@ set +a
 
 LOG_FILE="/var/log/greenhouse_cleanup.log"
 BACKUP_DIR="/opt/greenhouse/backups"
+PYTHON_BIN="$WORK_DIR/venv/bin/python"
 
 # Create backup directory
 sudo mkdir -p "$BACKUP_DIR"
@@ -29,82 +30,37 @@ log_message() {
 }
 
 # Cleanup sensor data with retention policy
+# Hourly (>7 days), daily (>90 days) and weekly (>1 year) downsampling runs in
+# small resumable batches (maintenance/compaction.py) instead of one big DELETE
 cleanup_sensor_data() {
-    log_message "Starting sensor data cleanup..."
+    log_message "Starting sensor data compaction..."
     
-    # Count total records before cleanup
-    total_before=$(PGPASSWORD="$DB_PASSWORD" psql -U "$DB_USER" -h "$DB_HOST" -d "$DB_NAME" -t -c \
-        "SELECT COUNT(*) FROM sensor_readings;" | xargs)
-    
-    log_message "Total records before cleanup: $total_before"
-    
-    # STRATEGY 1: Keep only 1 record per hour for data > 7 days old
-    log_message "Applying hourly retention for data > 7 days..."
-    PGPASSWORD="$DB_PASSWORD" psql -U "$DB_USER" -h "$DB_HOST" -d "$DB_NAME" -c "
-    WITH ranked_data AS (
-        SELECT reading_id,
-               ROW_NUMBER() OVER (
-                   PARTITION BY device_id, DATE_TRUNC('hour', timestamp) 
-                   ORDER BY timestamp
-               ) AS rn
-        FROM sensor_readings
-        WHERE timestamp < NOW() - INTERVAL '7 days'
-    )
-    DELETE FROM sensor_readings
-    WHERE reading_id IN (
-        SELECT reading_id FROM ranked_data WHERE rn > 1
-    );
-    " 2>/dev/null
-    
-    # STRATEGY 2: Keep only 1 record per day for data > 90 days old
-    log_message "Applying daily retention for data > 90 days..."
-    PGPASSWORD="$DB_PASSWORD" psql -U "$DB_USER" -h "$DB_HOST" -d "$DB_NAME" -c "
-    WITH ranked_daily AS (
-        SELECT reading_id,
-               ROW_NUMBER() OVER (
-                   PARTITION BY device_id, DATE_TRUNC('day', timestamp) 
-                   ORDER BY timestamp
-               ) AS rn
-        FROM sensor_readings
-        WHERE timestamp < NOW() - INTERVAL '90 days'
-    )
-    DELETE FROM sensor_readings
-    WHERE reading_id IN (
-        SELECT reading_id FROM ranked_daily WHERE rn > 1
-    );
-    " 2>/dev/null
+    if ! (cd "$WORK_DIR" && "$PYTHON_BIN" -m maintenance.compaction \
+            --max-runtime "${COMPACTION_MAX_RUNTIME:-3600}" >> "$LOG_FILE" 2>&1); then
+        log_message "ERROR: Compaction failed, will resume from checkpoint on next run"
+        return 1
+    fi
     
-    # STRATEGY 3: Keep only 1 record per week for data > 1 year old
-    log_message "Applying weekly retention for data > 1 year..."
-    PGPASSWORD="$DB_PASSWORD" psql -U "$DB_USER" -h "$DB_HOST" -d "$DB_NAME" -c "
-    WITH ranked_weekly AS (
-        SELECT reading_id,
-               ROW_NUMBER() OVER (
-                   PARTITION BY device_id, DATE_TRUNC('week', timestamp) 
-                   ORDER BY timestamp
-               ) AS rn
-        FROM sensor_readings
-        WHERE timestamp < NOW() - INTERVAL '365 days'
-    )
-    DELETE FROM sensor_readings
-    WHERE reading_id IN (
-        SELECT reading_id FROM ranked_weekly WHERE rn > 1
-    );
-    " 2>/dev/null
+    log_message "Compaction completed"
+}
+
+# Create upcoming partitions and expire old ones (PARTITION_RETENTION_DAYS)
+manage_partitions() {
+    log_message "Managing sensor data partitions..."
     
-    # Count total records after cleanup
-    total_after=$(PGPASSWORD="$DB_PASSWORD" psql -U "$DB_USER" -h "$DB_HOST" -d "$DB_NAME" -t -c \
-        "SELECT COUNT(*) FROM sensor_readings;" | xargs)
+    if ! (cd "$WORK_DIR" && "$PYTHON_BIN" -m maintenance.partitions >> "$LOG_FILE" 2>&1); then
+        log_message "ERROR: Partition maintenance failed"
+        return 1
+    fi
     
-    deleted=$((total_before - total_after))
-    log_message "Cleanup completed: $deleted records deleted, $total_after remaining"
+    log_message "Partition maintenance completed"
 }
 
-# Vacuum database
+# Vacuum database (plain VACUUM, does not block the webhook's inserts)
 vacuum_database() {
     log_message "Running VACUUM ANALYZE..."
     PGPASSWORD="$DB_PASSWORD" psql -U "$DB_USER" -h "$DB_HOST" -d "$DB_NAME" -c \
-        "VACUUM ANALYZE sensor_readings;" 2>/dev/null
+        "VACUUM ANALYZE sensor_readings, sensor_values;" 2>/dev/null
     log_message "VACUUM completed"
 }
 
@@ -160,6 +116,7 @@ main() {
     
     # Run maintenance tasks
     check_disk_usage
+    manage_partitions
     cleanup_sensor_data
     vacuum_database
     cleanup_logs
@@ -181,6 +138,7 @@ case "${1:-auto}" in
         ;;
     "data-only")
         log_message "Mode: data cleanup only"
+        manage_partitions
         cleanup_sensor_data
         vacuum_database
         ;;
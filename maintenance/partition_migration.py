@@ -0,0 +1,321 @@
+"""
+Move an existing database to the partitioned sensor_readings/sensor_values
+while the webhook and the poller keep writing.
+
+Steps (run in order; each can be rerun after an interruption):
+    prepare  Create sensor_readings_new/sensor_values_new (partitioned, with
+             partitions covering all existing data) and triggers that mirror
+             every new INSERT/DELETE on the old tables into them.
+    copy     Copy existing rows in reading_id keyset batches, one commit per
+             batch; the position is kept in maintenance_checkpoints, so the
+             copy can be stopped and resumed.
+    cutover  In one short transaction: copy what is left, drop the triggers
+             and swap the table names. The old tables stay as *_legacy.
+    cleanup  Drop the *_legacy tables once the new ones are checked.
+
+Do not run maintenance.compaction between prepare and cutover: a reading it
+deletes while its batch is being copied could survive in the new table.
+Readings without a timestamp cannot be partitioned and are not copied.
+
+Usage (from the project root):
+    python -m maintenance.partition_migration prepare
+    python -m maintenance.partition_migration copy [--batch-size 5000] [--sleep 0.1]
+    python -m maintenance.partition_migration cutover
+    python -m maintenance.partition_migration cleanup
+"""
+import time
+import logging
+import argparse
+import psycopg2
+from .config import DB_CONFIG, PARTITION_INTERVAL, PARTITION_PREMAKE
+from .partitions import ensure_partitions, is_partitioned, next_period, period_start
+
+CHECKPOINT = "partition_migration"
+
+READING_COLUMNS = "reading_id, device_id, timestamp, encoded_data"
+VALUE_COLUMNS = "reading_id, device_sensor_id, device_id, timestamp, value"
+
+# Indexes of the old tables and the temporary names of their replacements;
+# cutover renames the old ones to *_legacy and gives the new ones the original
+# names (renaming a primary key index renames its constraint too)
+RENAMES = (
+    ("sensor_readings_pkey", "sensor_readings_new_pkey"),
+    ("idx_readings_timestamp", "idx_readings_timestamp_new"),
+    ("idx_readings_device_time", "idx_readings_device_time_new"),
+    ("sensor_values_pkey", "sensor_values_new_pkey"),
+    ("idx_sensor_values_device_time", "idx_sensor_values_device_time_new"),
+    ("idx_sensor_values_sensor_time", "idx_sensor_values_sensor_time_new"),
+)
+
+# Foreign keys of the new tables, renamed to the names a fresh install gets
+CONSTRAINT_RENAMES = (
+    ("sensor_readings", "sensor_readings_new_device_id_fkey", "sensor_readings_device_id_fkey"),
+    ("sensor_values", "sensor_values_new_reading_id_timestamp_fkey", "sensor_values_reading_id_timestamp_fkey"),
+    ("sensor_values", "sensor_values_new_device_sensor_id_fkey", "sensor_values_device_sensor_id_fkey"),
+)
+
+TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS sensor_readings_new (
+        reading_id BIGINT NOT NULL DEFAULT nextval('sensor_readings_reading_id_seq'),
+        device_id INT NOT NULL,
+        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        encoded_data VARCHAR(64) NOT NULL,
+        PRIMARY KEY (reading_id, timestamp),
+        FOREIGN KEY (device_id) REFERENCES devices(device_id) ON DELETE CASCADE
+    ) PARTITION BY RANGE (timestamp);
+
+    CREATE TABLE IF NOT EXISTS sensor_values_new (
+        reading_id BIGINT NOT NULL,
+        device_sensor_id INT NOT NULL,
+        device_id INT NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        value DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (reading_id, device_sensor_id, timestamp),
+        FOREIGN KEY (reading_id, timestamp) REFERENCES sensor_readings_new(reading_id, timestamp) ON DELETE CASCADE,
+        FOREIGN KEY (device_sensor_id) REFERENCES device_sensors(device_sensor_id) ON DELETE CASCADE
+    ) PARTITION BY RANGE (timestamp);
+
+    CREATE TABLE IF NOT EXISTS sensor_readings_default PARTITION OF sensor_readings_new DEFAULT;
+    CREATE TABLE IF NOT EXISTS sensor_values_default PARTITION OF sensor_values_new DEFAULT;
+
+    CREATE INDEX IF NOT EXISTS idx_readings_timestamp_new ON sensor_readings_new(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_readings_device_time_new ON sensor_readings_new(device_id, timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_sensor_values_device_time_new ON sensor_values_new(device_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_sensor_values_sensor_time_new ON sensor_values_new(device_sensor_id, timestamp);
+"""
+
+TRIGGERS_SQL = """
+    CREATE OR REPLACE FUNCTION sensor_readings_mirror() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            IF NEW.timestamp IS NOT NULL THEN
+                INSERT INTO sensor_readings_new (reading_id, device_id, timestamp, encoded_data)
+                VALUES (NEW.reading_id, NEW.device_id, NEW.timestamp, NEW.encoded_data)
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NEW;
+        END IF;
+        DELETE FROM sensor_readings_new WHERE reading_id = OLD.reading_id AND timestamp = OLD.timestamp;
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION sensor_values_mirror() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            -- Values of a reading that is not copied yet arrive with its batch
+            INSERT INTO sensor_values_new (reading_id, device_sensor_id, device_id, timestamp, value)
+            SELECT NEW.reading_id, NEW.device_sensor_id, NEW.device_id, NEW.timestamp, NEW.value
+            WHERE EXISTS (
+                SELECT 1 FROM sensor_readings_new
+                WHERE reading_id = NEW.reading_id AND timestamp = NEW.timestamp
+            )
+            ON CONFLICT DO NOTHING;
+            RETURN NEW;
+        END IF;
+        DELETE FROM sensor_values_new
+        WHERE reading_id = OLD.reading_id AND device_sensor_id = OLD.device_sensor_id AND timestamp = OLD.timestamp;
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS sensor_readings_mirror ON sensor_readings;
+    DROP TRIGGER IF EXISTS sensor_values_mirror ON sensor_values;
+    CREATE TRIGGER sensor_readings_mirror AFTER INSERT OR DELETE ON sensor_readings
+        FOR EACH ROW EXECUTE FUNCTION sensor_readings_mirror();
+    CREATE TRIGGER sensor_values_mirror AFTER INSERT OR DELETE ON sensor_values
+        FOR EACH ROW EXECUTE FUNCTION sensor_values_mirror();
+"""
+
+def _fetch_one(conn, sql: str, params: tuple = ()):
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.fetchone()
+    finally:
+        cur.close()
+
+def _save_checkpoint(cur, last_id: int, copied: int) -> None:
+    cur.execute("""
+        INSERT INTO maintenance_checkpoints (job, last_reading_id, rows_processed, updated_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (job) DO UPDATE SET
+            last_reading_id = EXCLUDED.last_reading_id,
+            rows_processed = maintenance_checkpoints.rows_processed + EXCLUDED.rows_processed,
+            updated_at = EXCLUDED.updated_at;
+    """, (CHECKPOINT, last_id, copied))
+
+def _copy_range(cur, low: int, high: int) -> int:
+    """Copy readings (low, high] and their values; returns readings copied"""
+    cur.execute(f"""
+        INSERT INTO sensor_readings_new ({READING_COLUMNS})
+        SELECT {READING_COLUMNS} FROM sensor_readings
+        WHERE reading_id > %s AND reading_id <= %s AND timestamp IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    """, (low, high))
+    copied = cur.rowcount
+    cur.execute(f"""
+        INSERT INTO sensor_values_new ({VALUE_COLUMNS})
+        SELECT {VALUE_COLUMNS} FROM sensor_values
+        WHERE reading_id > %s AND reading_id <= %s
+        ON CONFLICT DO NOTHING;
+    """, (low, high))
+    return copied
+
+def _execute(conn, sql: str, params: tuple = ()) -> None:
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def prepare(conn, interval: str, premake: int) -> None:
+    if is_partitioned(conn, "sensor_readings"):
+        logging.info("sensor_readings is already partitioned, nothing to prepare")
+        return
+
+    first, now = _fetch_one(conn, "SELECT MIN(timestamp), NOW()::timestamp FROM sensor_readings;")
+    conn.commit()
+    _execute(conn, TABLES_SQL)
+
+    # Partitions must exist before mirroring starts, or new rows land in DEFAULT
+    until = period_start(now, interval)
+    for _ in range(premake + 1):
+        until = next_period(until, interval)
+    created = ensure_partitions(conn, first or now, until, interval, parent_suffix="_new")
+
+    # Creating the triggers waits for in-flight inserts; later ones are mirrored
+    _execute(conn, TRIGGERS_SQL)
+    _execute(conn, "DELETE FROM maintenance_checkpoints WHERE job = %s;", (CHECKPOINT,))
+    logging.info(f"Prepared sensor_readings_new/sensor_values_new ({created} partitions created), "
+                 f"mirror triggers installed")
+
+def copy(conn, batch_size: int, pause: float) -> int:
+    """Copy existing rows up to the highest reading_id seen at start; returns readings copied"""
+    row = _fetch_one(conn, "SELECT last_reading_id FROM maintenance_checkpoints WHERE job = %s;", (CHECKPOINT,))
+    last_id = row[0] if row else 0
+    # Everything above this was inserted after prepare and is mirrored by the trigger
+    high = _fetch_one(conn, "SELECT COALESCE(MAX(reading_id), 0) FROM sensor_readings;")[0]
+    conn.commit()
+
+    total = 0
+    started = time.monotonic()
+    while last_id < high:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT MAX(reading_id) FROM (
+                    SELECT reading_id FROM sensor_readings
+                    WHERE reading_id > %s AND reading_id <= %s
+                    ORDER BY reading_id
+                    LIMIT %s
+                ) batch;
+            """, (last_id, high, batch_size))
+            batch_end = cur.fetchone()[0]
+            if batch_end is None:
+                conn.commit()
+                break
+            copied = _copy_range(cur, last_id, batch_end)
+            _save_checkpoint(cur, batch_end, copied)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+        last_id = batch_end
+        total += copied
+        rate = total / max(time.monotonic() - started, 1e-6)
+        logging.info(f"Copied {total} readings, last reading_id={last_id}/{high}, {rate:.0f} readings/s")
+        if pause:
+            time.sleep(pause)
+
+    logging.info(f"Copy complete up to reading_id={last_id}; run cutover next")
+    return total
+
+def cutover(conn, batch_size: int) -> None:
+    # Catch up without locks first, so the locked part only sees the last few seconds
+    copy(conn, batch_size, 0)
+    row = _fetch_one(conn, "SELECT last_reading_id FROM maintenance_checkpoints WHERE job = %s;", (CHECKPOINT,))
+    conn.commit()
+    if row is None:
+        raise SystemExit("No copy checkpoint found, run prepare and copy first")
+
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL lock_timeout = '5s';")
+        cur.execute("""
+            LOCK TABLE sensor_readings, sensor_values, sensor_readings_new, sensor_values_new
+            IN ACCESS EXCLUSIVE MODE;
+        """)
+        cur.execute("SELECT COALESCE(MAX(reading_id), 0) FROM sensor_readings;")
+        high = cur.fetchone()[0]
+        # Rows mirrored by the trigger are skipped by ON CONFLICT
+        leftover = _copy_range(cur, row[0], high)
+
+        cur.execute("DROP TRIGGER sensor_readings_mirror ON sensor_readings;")
+        cur.execute("DROP TRIGGER sensor_values_mirror ON sensor_values;")
+        cur.execute("DROP FUNCTION sensor_readings_mirror();")
+        cur.execute("DROP FUNCTION sensor_values_mirror();")
+
+        for name, new_name in RENAMES:
+            cur.execute(f"ALTER INDEX {name} RENAME TO {name}_legacy;")
+            cur.execute(f"ALTER INDEX {new_name} RENAME TO {name};")
+        cur.execute("ALTER TABLE sensor_values RENAME TO sensor_values_legacy;")
+        cur.execute("ALTER TABLE sensor_readings RENAME TO sensor_readings_legacy;")
+        cur.execute("ALTER TABLE sensor_readings_new RENAME TO sensor_readings;")
+        cur.execute("ALTER TABLE sensor_values_new RENAME TO sensor_values;")
+        for table, name, new_name in CONSTRAINT_RENAMES:
+            cur.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {name} TO {new_name};")
+        cur.execute("ALTER SEQUENCE sensor_readings_reading_id_seq OWNED BY sensor_readings.reading_id;")
+        cur.execute("DELETE FROM maintenance_checkpoints WHERE job = %s;", (CHECKPOINT,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    logging.info(f"Cutover complete ({leftover} readings copied during cutover); "
+                 f"old tables kept as sensor_readings_legacy/sensor_values_legacy")
+
+def cleanup(conn) -> None:
+    cur = conn.cursor()
+    try:
+        cur.execute("DROP TABLE IF EXISTS sensor_values_legacy;")
+        cur.execute("DROP TABLE IF EXISTS sensor_readings_legacy;")
+        conn.commit()
+    finally:
+        cur.close()
+    logging.info("Legacy tables dropped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Online migration to partitioned sensor tables")
+    parser.add_argument("step", choices=["prepare", "copy", "cutover", "cleanup"])
+    parser.add_argument("--interval", choices=["month", "week"], default=PARTITION_INTERVAL)
+    parser.add_argument("--premake", type=int, default=PARTITION_PREMAKE)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--sleep", type=float, default=0.1, help="pause between batches (seconds)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.step == "prepare":
+            prepare(conn, args.interval, args.premake)
+        elif args.step == "copy":
+            copy(conn, args.batch_size, args.sleep)
+        elif args.step == "cutover":
+            cutover(conn, args.batch_size)
+        else:
+            cleanup(conn)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Partition manager for the time-partitioned sensor_readings and sensor_values.
+
+Both tables are range-partitioned on timestamp with identical bounds
+(monthly by default, PARTITION_INTERVAL=week for weekly), plus a DEFAULT
+partition that only catches out-of-range timestamps. Each run:
+- creates the partitions for the current period and the next
+  PARTITION_PREMAKE periods, so inserts never land in DEFAULT; rows that
+  reached DEFAULT anyway (late or backfilled readings) are moved into the
+  partition created for their range;
+- with a retention set, detaches (or drops) every partition whose range ended
+  before the retention cutoff. This replaces row-level DELETEs of old data
+  with a metadata-only operation.
+
+sensor_values partitions are handled before sensor_readings partitions,
+because sensor_values references sensor_readings.
+
+Usage (from the project root):
+    python -m maintenance.partitions [--premake 3] [--retention-days 730] [--detach-only] [--dry-run]
+"""
+import re
+import time
+import logging
+import argparse
+import psycopg2
+import psycopg2.errors
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from .config import DB_CONFIG, PARTITION_INTERVAL, PARTITION_PREMAKE, PARTITION_RETENTION_DAYS
+
+# Partitioned tables, referenced table first (create order; expire runs reversed)
+PARTITIONED_TABLES = ("sensor_readings", "sensor_values")
+
+LOCK_TIMEOUT = "2s"
+MAX_RETRIES = 5
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+def period_start(ts: datetime, interval: str) -> datetime:
+    """Start of the month/week (Monday, like date_trunc) containing ts"""
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def next_period(start: datetime, interval: str) -> datetime:
+    if interval == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+def is_partitioned(conn, table: str) -> bool:
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    conn.commit()
+    return bool(row and row[0])
+
+def list_partitions(conn, parent: str) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """(name, lower, upper) of every partition; bounds are None for DEFAULT"""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname;
+        """, (parent,))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1)),
+                               datetime.fromisoformat(match.group(2))))
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+def _run_ddl(conn, statements: List[Tuple[str, tuple]]) -> None:
+    """Run DDL in one short transaction, retrying when a lock is not granted in time"""
+    for attempt in range(1, MAX_RETRIES + 1):
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+            for sql, params in statements:
+                cur.execute(sql, params)
+            conn.commit()
+            return
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            if attempt == MAX_RETRIES:
+                raise
+            logging.warning(f"Lock not granted, retry {attempt}")
+            time.sleep(min(2 ** attempt, 30))
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+def _default_rows(conn, table: str, start: datetime, end: datetime) -> int:
+    """Rows of [start, end) sitting in the DEFAULT partition of table"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"{table}_default",))
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute(f"SELECT COUNT(*) FROM {table}_default WHERE timestamp >= %s AND timestamp < %s;",
+                    (start, end))
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+
+def _create_partitions(conn, tables: List[str], parent_suffix: str, start: datetime, end: datetime) -> None:
+    """
+    Create the [start, end) partition of every table in one transaction. Rows of
+    that range already in DEFAULT (late or backfilled readings) would make a
+    plain CREATE ... PARTITION OF fail, so then the partitions are built as
+    standalone tables, the rows are moved out of DEFAULT and the tables attached.
+    """
+    moving = {table: _default_rows(conn, table, start, end) for table in tables}
+    conn.commit()
+    if not any(moving.values()):
+        _run_ddl(conn, [(f"CREATE TABLE {partition_name(table, start)} PARTITION OF {table}{parent_suffix} "
+                         f"FOR VALUES FROM (%s) TO (%s);", (start, end)) for table in tables])
+        return
+
+    if len(tables) != len(PARTITIONED_TABLES):
+        # Deleting moved readings would cascade into the existing sensor_values partition
+        raise RuntimeError(f"only {', '.join(tables)} missing, cannot move rows out of DEFAULT")
+    logging.warning(f"Moving {', '.join(f'{count} {table}' for table, count in moving.items())} "
+                    f"rows of [{start:%Y-%m-%d}, {end:%Y-%m-%d}) out of DEFAULT")
+    statements = []
+    for table in tables:
+        statements.append((f"CREATE TABLE {partition_name(table, start)} "
+                           f"(LIKE {table}{parent_suffix} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);", ()))
+    # Referencing tables first: deleting a reading cascades to its sensor_values
+    for table in reversed(tables):
+        statements.append((f"WITH moved AS (DELETE FROM {table}_default WHERE timestamp >= %s AND timestamp < %s "
+                           f"RETURNING *) INSERT INTO {partition_name(table, start)} SELECT * FROM moved;",
+                           (start, end)))
+    for table in tables:
+        statements.append((f"ALTER TABLE {table}{parent_suffix} ATTACH PARTITION {partition_name(table, start)} "
+                           f"FOR VALUES FROM (%s) TO (%s);", (start, end)))
+    _run_ddl(conn, statements)
+
+def ensure_partitions(conn, since: datetime, until: datetime, interval: str = PARTITION_INTERVAL,
+                      parent_suffix: str = "", dry_run: bool = False) -> int:
+    """
+    Create the missing partitions covering [since, until) for every table,
+    moving rows of their range out of DEFAULT. parent_suffix lets the online
+    migration fill sensor_readings_new; partition names never carry the
+    suffix. A period that fails is logged and skipped, so the caller's other
+    work (expiry) still runs. Returns partitions created.
+    """
+    existing = {table: [(lower, upper) for _, lower, upper in list_partitions(conn, table + parent_suffix) if lower]
+                for table in PARTITIONED_TABLES}
+    conn.commit()
+    created = 0
+    start = period_start(since, interval)
+    while start < until:
+        end = next_period(start, interval)
+        missing = [table for table in PARTITIONED_TABLES
+                   if not any(lower < end and start < upper for lower, upper in existing[table])]
+        for table in missing:
+            logging.info(f"Creating {partition_name(table, start)} [{start:%Y-%m-%d}, {end:%Y-%m-%d})")
+        if missing and not dry_run:
+            try:
+                _create_partitions(conn, missing, parent_suffix, start, end)
+            except (psycopg2.Error, RuntimeError) as e:
+                logging.error(f"Creating partitions for [{start:%Y-%m-%d}, {end:%Y-%m-%d}) failed: {e}")
+                missing = []
+        created += len(missing)
+        start = end
+    return created
+
+def check_default(conn) -> None:
+    """Rows left in a DEFAULT partition, i.e. outside every partition created so far"""
+    cur = conn.cursor()
+    try:
+        for table in PARTITIONED_TABLES:
+            cur.execute(f"SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM {table}_default;")
+            first, last, count = cur.fetchone()
+            if count:
+                logging.warning(f"{table}_default holds {count} rows ({first} .. {last}); "
+                                f"they move into the partition once ensure_partitions() creates one for their range")
+    finally:
+        cur.close()
+    conn.commit()
+
+def _foreign_keys(conn, table: str) -> List[str]:
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid = 'sensor_readings'::regclass;
+        """, (table,))
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+def expire_partitions(conn, before: datetime, drop: bool = True, dry_run: bool = False) -> int:
+    """
+    Detach every partition whose range ends at or before `before`, then drop it
+    unless drop is False. Detached sensor_values partitions lose their foreign
+    key so the matching sensor_readings partition can be detached too.
+    """
+    expired = 0
+    for table in reversed(PARTITIONED_TABLES):
+        for name, lower, upper in list_partitions(conn, table):
+            if upper is None or upper > before:
+                continue
+            action = "Dropping" if drop else "Detaching"
+            logging.info(f"{action} {name} [{lower:%Y-%m-%d}, {upper:%Y-%m-%d})")
+            expired += 1
+            if dry_run:
+                continue
+
+            statements = [(f"ALTER TABLE {table} DETACH PARTITION {name};", ())]
+            if drop:
+                statements.append((f"DROP TABLE {name};", ()))
+            _run_ddl(conn, statements)
+            if not drop:
+                for fk in _foreign_keys(conn, name):
+                    _run_ddl(conn, [(f"ALTER TABLE {name} DROP CONSTRAINT {fk};", ())])
+    return expired
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and expire sensor data partitions")
+    parser.add_argument("--interval", choices=["month", "week"], default=PARTITION_INTERVAL)
+    parser.add_argument("--premake", type=int, default=PARTITION_PREMAKE,
+                        help="future periods to create ahead (default: PARTITION_PREMAKE)")
+    parser.add_argument("--retention-days", type=int, default=PARTITION_RETENTION_DAYS,
+                        help="expire partitions that ended more than this many days ago (0 = never)")
+    parser.add_argument("--detach-only", action="store_true",
+                        help="detach expired partitions and keep them as standalone tables")
+    parser.add_argument("--dry-run", action="store_true", help="only log what would change")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if not is_partitioned(conn, "sensor_readings"):
+            logging.error("sensor_readings is not partitioned yet, run maintenance.partition_migration first")
+            return
+
+        cur = conn.cursor()
+        cur.execute("SELECT NOW()::timestamp;")
+        now = cur.fetchone()[0]
+        cur.close()
+        conn.commit()
+
+        until = period_start(now, args.interval)
+        for _ in range(args.premake + 1):
+            until = next_period(until, args.interval)
+        created = ensure_partitions(conn, now, until, args.interval, dry_run=args.dry_run)
+
+        expired = 0
+        if args.retention_days:
+            expired = expire_partitions(conn, now - timedelta(days=args.retention_days),
+                                        drop=not args.detach_only, dry_run=args.dry_run)
+
+        check_default(conn)
+        logging.info(f"Partition maintenance complete: {created} created, {expired} expired")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
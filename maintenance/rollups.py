@@ -0,0 +1,96 @@
+"""
+Rebuild hourly/daily rollups from sensor_values.
+
+Ingest keeps the rollups current incrementally; this job recomputes them for
+a date range, one day per transaction, to fill history or repair drift
+(e.g. after readings were deleted). The default range is the last two
+complete days, which makes it suitable as a nightly cron job.
+
+Usage (from the project root):
+    python -m maintenance.rollups [--since 2025-01-01] [--until 2025-02-01] [--sleep 0.2]
+"""
+import time
+import logging
+import argparse
+import psycopg2
+from datetime import datetime, timedelta
+from .config import DB_CONFIG
+
+# Rollup table and the date_trunc unit of its buckets
+ROLLUPS = (
+    ("sensor_rollup_hourly", "hour"),
+    ("sensor_rollup_daily", "day"),
+)
+
+def rebuild_window(conn, start: datetime, end: datetime) -> int:
+    """Recompute every rollup bucket in [start, end); returns buckets written"""
+    written = 0
+    cur = conn.cursor()
+    try:
+        for table, unit in ROLLUPS:
+            # Block concurrent ingest upserts on this table while the window is replaced
+            cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute(f"DELETE FROM {table} WHERE bucket_start >= %s AND bucket_start < %s", (start, end))
+            cur.execute(f"""
+                INSERT INTO {table}
+                    (device_sensor_id, bucket_start, device_id, min_value, max_value, sum_value, sample_count)
+                SELECT
+                    device_sensor_id,
+                    date_trunc('{unit}', timestamp),
+                    MIN(device_id),
+                    MIN(value),
+                    MAX(value),
+                    SUM(value),
+                    COUNT(*)
+                FROM sensor_values
+                WHERE timestamp >= %s AND timestamp < %s
+                GROUP BY device_sensor_id, date_trunc('{unit}', timestamp);
+            """, (start, end))
+            written += cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return written
+
+def rebuild(conn, since: datetime, until: datetime, pause: float) -> int:
+    """Rebuild day by day so each transaction (and lock) stays short"""
+    total = 0
+    day = since
+    started = time.monotonic()
+    while day < until:
+        next_day = min(day + timedelta(days=1), until)
+        buckets = rebuild_window(conn, day, next_day)
+        total += buckets
+        rate = total / max(time.monotonic() - started, 1e-6)
+        logging.info(f"Rollups rebuilt for {day:%Y-%m-%d}: {buckets} buckets ({rate:.0f} buckets/s)")
+        day = next_day
+        if pause:
+            time.sleep(pause)
+    return total
+
+def main():
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    parser = argparse.ArgumentParser(description="Rebuild sensor rollups from sensor_values")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=today - timedelta(days=2),
+                        help="first day to rebuild (default: two days ago)")
+    parser.add_argument("--until", type=datetime.fromisoformat, default=today,
+                        help="end of the range, exclusive (default: today 00:00)")
+    parser.add_argument("--sleep", type=float, default=0.2, help="pause between days (seconds)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    since = args.since.replace(hour=0, minute=0, second=0, microsecond=0)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        total = rebuild(conn, since, args.until, args.sleep)
+        logging.info(f"Rollup rebuild complete: {total} buckets")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Shared components used by the Flask API, the webhook and the Antares poller.
+
+Components:
+- antares.py: Antares timestamp and content instance parsing (webhook and poller)
+- config.py: Settings for the shared components
+- device_registry.py: Cached device/zone/plant/sensor-layout lookups
+- decoder.py: HEX reading decoder driven by device_sensors layouts
+- ingest.py: Shared, idempotent writer for sensor_readings and decoded sensor_values
+- latest_cache.py: Latest reading per device, updated on write
+- metrics.py: In-process counters, gauges and histograms in Prometheus text format
+- rate_limiter.py: Token-bucket rate limiter with memory, SQLite and Redis backends
+"""
+
+from .device_registry import DeviceRegistry, device_registry
+from .decoder import DecodePlan, ReadingDecoder, reading_decoder
+from .ingest import RecentReadings, recent_readings
+from .latest_cache import LatestReadingCache, latest_cache
+from .metrics import MetricsRegistry, metrics
+from .rate_limiter import RateLimit, RateLimiter, rate_limiter
+
+__all__ = [
+    'DeviceRegistry',
+    'device_registry',
+    'DecodePlan',
+    'ReadingDecoder',
+    'reading_decoder',
+    'RecentReadings',
+    'recent_readings',
+    'LatestReadingCache',
+    'latest_cache',
+    'MetricsRegistry',
+    'metrics',
+    'RateLimit',
+    'RateLimiter',
+    'rate_limiter'
+]
@@ -0,0 +1,96 @@
+# shared/antares.py
+import re
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+# Optional accelerator for the JSON string nested in m2m:cin.con
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# ISO 8601, extended (2025-09-13T06:29:14.000Z) or basic like the Antares
+# ct/lt attributes (20250913T062914), optional fraction and UTC offset
+TIMESTAMP_PATTERN = re.compile(
+    r'\s*(\d{4})-?(\d{2})-?(\d{2})[Tt ](\d{2}):?(\d{2}):?(\d{2})(?:[.,](\d+))?\s*(Z|z|[+-]\d{2}(?::?\d{2})?)?\s*'
+)
+
+# UTC offset text -> tzinfo, filled as offsets are seen
+_OFFSETS = {'Z': timezone.utc, 'z': timezone.utc}
+
+def _offset(text: str) -> timezone:
+    tz = _OFFSETS.get(text)
+    if tz is None:
+        digits = text[1:].replace(':', '')
+        delta = timedelta(hours=int(digits[:2]), minutes=int(digits[2:4] or 0))
+        tz = timezone(-delta if text[0] == '-' else delta)
+        _OFFSETS[text] = tz
+    return tz
+
+def cin_content(cin: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The device message inside a content instance; con is usually a JSON string"""
+    con = cin.get('con')
+    if isinstance(con, dict):
+        return con
+    if not isinstance(con, str):
+        return None
+    try:
+        content = _loads(con)
+    except ValueError:
+        return None
+    return content if isinstance(content, dict) else None
+
+def _match_timestamp(timestamp_str: str) -> Optional[datetime]:
+    match = TIMESTAMP_PATTERN.fullmatch(timestamp_str)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                    int(fraction[:6].ljust(6, '0')) if fraction else 0,
+                    _offset(offset) if offset else None)
+
+def parse_timestamp(timestamp_str: Optional[str], assume_tz: Optional[timezone] = None) -> datetime:
+    """
+    ISO 8601 or Antares timestamp -> datetime. A Z or UTC offset is kept as
+    tzinfo (PostgreSQL converts it on insert); values without one get
+    `assume_tz`, or stay naive local time. Falls back to the current time.
+    """
+    if not timestamp_str:
+        return datetime.now()
+
+    timestamp = None
+    if isinstance(timestamp_str, str):
+        try:
+            # C parser; reads Z and the basic format (Antares ct) since Python 3.11
+            timestamp = datetime.fromisoformat(timestamp_str)
+        except ValueError:
+            try:
+                timestamp = _match_timestamp(timestamp_str)
+            except ValueError as e:
+                logger.debug(f"Timestamp parse error: {e}")
+
+    if timestamp is None:
+        logger.debug(f"Unrecognised timestamp: {timestamp_str!r}")
+        # Fallback to current time
+        return datetime.now()
+    if timestamp.tzinfo is None and assume_tz is not None:
+        # Several times cheaper than timestamp.replace(tzinfo=...)
+        return datetime(timestamp.year, timestamp.month, timestamp.day, timestamp.hour,
+                        timestamp.minute, timestamp.second, timestamp.microsecond, assume_tz)
+    return timestamp
+
+def reading_time(device_timestamp: Optional[str], created: Optional[str]) -> datetime:
+    """
+    Time of a reading: the device's own timestamp when it sent one, else the
+    Antares creation time of the content instance (ct, UTC like all oneM2M
+    times). Both are stable across deliveries, so the webhook and the poller
+    give the same reading the same timestamp.
+    """
+    if device_timestamp:
+        return parse_timestamp(device_timestamp)
+    return parse_timestamp(created, assume_tz=timezone.utc)
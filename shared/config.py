@@ -0,0 +1,38 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class SharedConfig:
+    """Settings for components shared by the API, webhook and poller"""
+    
+    # Device registry: full reload interval, and minimum gap between
+    # reloads triggered by lookups of unknown device codes
+    REGISTRY_TTL = int(os.getenv("REGISTRY_TTL", "300"))  # seconds
+    REGISTRY_MISS_REFRESH = int(os.getenv("REGISTRY_MISS_REFRESH", "30"))  # seconds
+    # File touched by POST /api/devices/refresh so every worker reloads on its
+    # next lookup; empty = a file in the temp directory, shared by all workers
+    REGISTRY_GENERATION_FILE = os.getenv("REGISTRY_GENERATION_FILE", "")
+    
+    # Latest-reading cache: local entry lifetime, optional shared backend
+    # (e.g. sqlite:////home/elektro1/smart_greenhouse/cache/latest.db) and
+    # lifetime of entries in the shared backend
+    LATEST_CACHE_TTL = float(os.getenv("LATEST_CACHE_TTL", "5"))  # seconds
+    LATEST_CACHE_BACKEND = os.getenv("LATEST_CACHE_BACKEND", "")
+    LATEST_CACHE_SHARED_TTL = int(os.getenv("LATEST_CACHE_SHARED_TTL", "300"))  # seconds
+    
+    # Metrics: directory where gunicorn workers publish their snapshots (so
+    # /metrics adds up all workers) and the poller writes poller.prom;
+    # empty = every process reports only its own metrics
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))  # seconds
+    
+    # Rate limiter token buckets: memory:// (this process only),
+    # sqlite:////path/to/rate_limit.db or redis://host:6379/0;
+    # empty = a SQLite file in the temp directory, shared by all workers
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "")
+    
+    # Ingest duplicate filter: reading keys (device, timestamp) each process
+    # remembers after storing them; repeats are dropped before the database
+    # (whose unique index catches the rest). 0 = off
+    INGEST_DEDUPE_CACHE_SIZE = int(os.getenv("INGEST_DEDUPE_CACHE_SIZE", "50000"))
@@ -0,0 +1,134 @@
+# shared/decoder.py
+import re
+import struct
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .device_registry import DeviceRegistry, device_registry
+
+# Raw register value is divided by this to get the physical value
+# (see "Format Data" in API-documentation.md)
+SENSOR_SCALES = {
+    "pH": 100,
+    "Soil Moisture": 10,
+    "EC": 100,
+    "Temperature": 10,
+    "Humidity": 10,
+    "Light": 1
+}
+
+# Each sensor is one big-endian unsigned 16-bit word (4 HEX characters)
+WORD_FORMAT = "H"
+WORD_HEX_LENGTH = 4
+
+def sensor_key(sensor_type: str) -> str:
+    """'Soil Moisture' -> 'soil_moisture'"""
+    return re.sub(r'[^0-9a-z]+', '_', sensor_type.lower()).strip('_')
+
+class DecodePlan:
+    """Precompiled unpack plan for one device layout"""
+    __slots__ = ('keys', 'device_sensor_ids', 'divisors', 'unpacker', 'hex_length')
+
+    def __init__(self, sensors: List[Dict[str, Any]]):
+        keys = []
+        for sensor in sensors:
+            key = sensor_key(sensor['sensor_type'])
+            # Two sensors of the same type on one device: temperature, temperature_<order>
+            if key in keys:
+                key = f"{key}_{sensor['sensor_order']}"
+            keys.append(key)
+
+        self.keys = tuple(keys)
+        self.device_sensor_ids = tuple(s['device_sensor_id'] for s in sensors)
+        self.divisors = tuple(SENSOR_SCALES.get(s['sensor_type'], 1) for s in sensors)
+        self.unpacker = struct.Struct(">" + WORD_FORMAT * len(sensors))
+        self.hex_length = WORD_HEX_LENGTH * len(sensors)
+
+    def _scaled(self, raw) -> Tuple[float, ...]:
+        return tuple(value / divisor for value, divisor in zip(raw, self.divisors))
+
+    def decode(self, encoded_data: str) -> Optional[Dict[str, float]]:
+        """Decode one HEX string, None if it does not match the layout"""
+        values = self.unpack(encoded_data)
+        return dict(zip(self.keys, values)) if values is not None else None
+
+    def unpack(self, encoded_data: str) -> Optional[Tuple[float, ...]]:
+        """Scaled values of one HEX string in sensor_order, None if it does not match"""
+        if not encoded_data or len(encoded_data) != self.hex_length:
+            return None
+        try:
+            return self._scaled(self.unpacker.unpack(bytes.fromhex(encoded_data)))
+        except ValueError:
+            return None
+
+    def unpack_many(self, encoded: List[str]) -> List[Optional[Tuple[float, ...]]]:
+        """
+        Unpack a batch: all well-formed strings are converted with a single
+        bytes.fromhex() call and unpacked with struct.iter_unpack()
+        """
+        results = [None] * len(encoded)
+        if not self.keys:
+            return results
+
+        positions = [i for i, data in enumerate(encoded) if data and len(data) == self.hex_length]
+        try:
+            buffer = bytes.fromhex("".join(encoded[i] for i in positions))
+        except ValueError:
+            # A bad character somewhere in the batch, fall back to one at a time
+            for i in positions:
+                results[i] = self.unpack(encoded[i])
+            return results
+
+        for i, raw in zip(positions, self.unpacker.iter_unpack(buffer)):
+            results[i] = self._scaled(raw)
+        return results
+
+    def decode_many(self, encoded: List[str]) -> List[Optional[Dict[str, float]]]:
+        """Batch version of decode()"""
+        return [dict(zip(self.keys, values)) if values is not None else None
+                for values in self.unpack_many(encoded)]
+
+class ReadingDecoder:
+    """Caches one DecodePlan per device, rebuilt when the registry changes"""
+
+    def __init__(self, registry: DeviceRegistry):
+        self.registry = registry
+        self._plans = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def plan_for(self, conn, device_code: str) -> Optional[DecodePlan]:
+        sensors = self.registry.get_sensors(conn, device_code)
+        with self._lock:
+            if self._version != self.registry.version:
+                self._plans = {}
+                self._version = self.registry.version
+            plan = self._plans.get(device_code)
+            if plan is None and sensors:
+                plan = self._plans[device_code] = DecodePlan(sensors)
+        return plan
+
+    def decode(self, conn, device_code: str, encoded_data: str) -> Optional[Dict[str, float]]:
+        plan = self.plan_for(conn, device_code)
+        return plan.decode(encoded_data) if plan else None
+
+    def attach_values(self, conn, rows: Iterable[Dict[str, Any]], device_code: str = None) -> None:
+        """
+        Add a "values" dict to each reading row. Rows are grouped per device
+        (row["device_code"] unless device_code is given) and decoded in batches.
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(device_code or row.get('device_code'), []).append(row)
+
+        for code, group in groups.items():
+            plan = self.plan_for(conn, code) if code else None
+            if plan is None:
+                for row in group:
+                    row['values'] = None
+                continue
+            decoded = plan.decode_many([row['encoded_data'] for row in group])
+            for row, values in zip(group, decoded):
+                row['values'] = values
+
+# Global instance
+reading_decoder = ReadingDecoder(device_registry)
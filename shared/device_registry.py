@@ -0,0 +1,199 @@
+# shared/device_registry.py
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+from psycopg2.extras import RealDictCursor
+from .config import SharedConfig
+from .metrics import execute_timed
+
+logger = logging.getLogger(__name__)
+
+class _Snapshot:
+    """Immutable view of the device tables at one point in time"""
+    __slots__ = ('devices_by_code', 'devices_by_id', 'sensors_by_device', 'plants', 'fingerprint',
+                 'loaded_at', 'generation')
+
+    def __init__(self, devices: List[Dict[str, Any]], sensors: List[Dict[str, Any]],
+                 plants: List[Dict[str, Any]], loaded_at: float, generation: int):
+        self.devices_by_code = {d['code']: d for d in devices}
+        self.devices_by_id = {d['device_id']: d for d in devices}
+        self.sensors_by_device = {}
+        for sensor in sensors:
+            self.sensors_by_device.setdefault(sensor['device_id'], []).append(sensor)
+        self.plants = plants
+        # Same tables give the same fingerprint in every process (used as the metadata ETag)
+        content = json.dumps([devices, sensors, plants], sort_keys=True, default=str)
+        self.fingerprint = hashlib.sha1(content.encode()).hexdigest()[:16]
+        self.loaded_at = loaded_at
+        self.generation = generation
+
+class DeviceRegistry:
+    """
+    In-memory cache of devices, zones, plants and sensor layouts.
+    Loaded once, reloaded after `ttl` seconds or after invalidate(). Every
+    process has its own copy; invalidate() also touches `generation_path`,
+    and a process whose copy predates that file's mtime reloads too.
+    Lookups take the caller's connection, which is only used when a reload is due.
+    With conn=None they are served from the loaded snapshot; check reload_due()
+    first to know whether a connection is needed.
+    """
+
+    def __init__(self, ttl: int = SharedConfig.REGISTRY_TTL,
+                 miss_refresh: int = SharedConfig.REGISTRY_MISS_REFRESH,
+                 generation_path: str = SharedConfig.REGISTRY_GENERATION_FILE):
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self.generation_path = generation_path or os.path.join(tempfile.gettempdir(), "greenhouse_registry.generation")
+        self.version = 0
+        self._snapshot = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def refresh(self, conn) -> None:
+        """Reload all device and plant metadata with three queries"""
+        # Read first: an invalidate() during the queries triggers another reload
+        generation = self._shared_generation()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            execute_timed(cur, "registry_devices", """
+                SELECT
+                    d.device_id,
+                    d.code,
+                    d.description,
+                    d.zone_id,
+                    z.zone_code,
+                    z.zone_label,
+                    z.plant_id,
+                    p.name AS plant_name
+                FROM devices d
+                JOIN zones z ON d.zone_id = z.zone_id
+                LEFT JOIN plants p ON z.plant_id = p.plant_id
+                ORDER BY d.code;
+            """)
+            devices = [dict(row) for row in cur.fetchall()]
+
+            execute_timed(cur, "registry_sensors", """
+                SELECT
+                    ds.device_id,
+                    ds.device_sensor_id,
+                    ds.sensor_label,
+                    ds.sensor_order,
+                    s.sensor_type,
+                    s.unit,
+                    s.sensor_model
+                FROM device_sensors ds
+                JOIN sensors s ON ds.sensor_id = s.sensor_id
+                ORDER BY ds.device_id, ds.sensor_order;
+            """)
+            sensors = [dict(row) for row in cur.fetchall()]
+
+            execute_timed(cur, "registry_plants", """
+                SELECT
+                    p.plant_id,
+                    p.name,
+                    p.media_type,
+                    p.description,
+                    COUNT(z.zone_id) AS zone_count
+                FROM plants p
+                LEFT JOIN zones z ON p.plant_id = z.plant_id
+                GROUP BY p.plant_id, p.name, p.media_type, p.description
+                ORDER BY p.name;
+            """)
+            plants = [dict(row) for row in cur.fetchall()]
+        finally:
+            cur.close()
+
+        snapshot = _Snapshot(devices, sensors, plants, time.monotonic(), generation)
+        previous = self._snapshot
+        if previous is None or previous.fingerprint != snapshot.fingerprint:
+            self.version += 1
+        self._snapshot = snapshot
+        self._stale = False
+        logger.info(f"Device registry loaded: {len(devices)} devices, {len(sensors)} sensors (v{self.version})")
+
+    def _shared_generation(self) -> int:
+        """mtime of the generation file (0 while it does not exist)"""
+        try:
+            return os.stat(self.generation_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def invalidate(self) -> None:
+        """Force a reload on the next lookup, in this and every process sharing generation_path"""
+        self._stale = True
+        try:
+            with open(self.generation_path, "w") as f:
+                f.write(str(os.getpid()))
+            # Explicit time: file systems may store a coarse mtime for writes
+            now = time.time_ns()
+            os.utime(self.generation_path, ns=(now, now))
+        except OSError as e:
+            logger.warning(f"Device registry generation file not updated, other processes reload after the TTL: {e}")
+
+    def _expired(self, snapshot: Optional[_Snapshot]) -> bool:
+        return (snapshot is None or self._stale or time.monotonic() - snapshot.loaded_at >= self.ttl
+                or snapshot.generation != self._shared_generation())
+
+    def reload_due(self) -> bool:
+        """True when the next lookup has to query the database"""
+        return self._expired(self._snapshot)
+
+    def _current(self, conn) -> _Snapshot:
+        snapshot = self._snapshot
+        if not self._expired(snapshot):
+            return snapshot
+        if conn is None and snapshot is not None:
+            # Expired between reload_due() and the lookup: the next request reloads
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited
+            if self._expired(self._snapshot):
+                self.refresh(conn)
+            return self._snapshot
+
+    def get_device(self, conn, device_code: str) -> Optional[Dict[str, Any]]:
+        """Device row (device_id, zone and plant ids) by code, or None"""
+        snapshot = self._current(conn)
+        device = snapshot.devices_by_code.get(device_code)
+
+        # Unknown code: the device may have been added since the last load
+        if device is None and conn is not None and time.monotonic() - snapshot.loaded_at >= self.miss_refresh:
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self.refresh(conn)
+            device = self._snapshot.devices_by_code.get(device_code)
+
+        return device
+
+    def get_device_id(self, conn, device_code: str) -> Optional[int]:
+        """device_id for a device code, or None"""
+        device = self.get_device(conn, device_code)
+        return device['device_id'] if device else None
+
+    def get_sensors(self, conn, device_code: str) -> List[Dict[str, Any]]:
+        """Sensor layout of a device ordered by sensor_order"""
+        device = self.get_device(conn, device_code)
+        if device is None:
+            return []
+        return self._snapshot.sensors_by_device.get(device['device_id'], [])
+
+    def devices(self, conn) -> List[Dict[str, Any]]:
+        """All devices ordered by code"""
+        return list(self._current(conn).devices_by_code.values())
+
+    def plants(self, conn) -> List[Dict[str, Any]]:
+        """All plants ordered by name, with the number of zones of each"""
+        return self._current(conn).plants
+
+    def fingerprint(self, conn) -> str:
+        """Hash of all loaded metadata; changes whenever devices, sensors or plants change"""
+        return self._current(conn).fingerprint
+
+# Global instance
+device_registry = DeviceRegistry()
@@ -0,0 +1,259 @@
+# shared/ingest.py
+import re
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple, Union
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2.extras import RealDictCursor, execute_values
+from .config import SharedConfig
+from .device_registry import device_registry
+from .decoder import reading_decoder
+from .metrics import metrics, db_query_seconds
+
+logger = logging.getLogger(__name__)
+
+# (device_code, encoded_data, timestamp)
+Reading = Tuple[str, str, datetime]
+
+# reading_outcomes() value for a reading that was already stored
+DUPLICATE = "duplicate"
+
+# sensor_readings.encoded_data is VARCHAR(64)
+ENCODED_DATA_MAX_LENGTH = 64
+# HEX digits only (the length is checked separately: two digits per byte)
+HEX_DATA_PATTERN = re.compile(r'[0-9A-Fa-f]+')
+
+ingest_duplicates = metrics.counter(
+    "greenhouse_ingest_duplicates_total",
+    "Readings not stored because they already were, by where the repeat was caught",
+    ["stage"]
+)
+
+# Rollup table and the bucket each timestamp falls into
+ROLLUP_TABLES = (
+    ("sensor_rollup_hourly", lambda ts: ts.replace(minute=0, second=0, microsecond=0)),
+    ("sensor_rollup_daily", lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0)),
+)
+
+def valid_encoded_data(data: Any) -> bool:
+    """Even-length HEX string that fits sensor_readings.encoded_data, checked without converting it"""
+    return (isinstance(data, str) and len(data) % 2 == 0 and len(data) <= ENCODED_DATA_MAX_LENGTH
+            and HEX_DATA_PATTERN.fullmatch(data) is not None)
+
+def database_unavailable(error: Exception) -> bool:
+    """
+    True when a write failed because the database is down, unreachable or too
+    slow (connection errors, statement timeouts, an exhausted pool), so the
+    same readings can succeed later. False for errors about the readings
+    themselves (DataError, IntegrityError, ...), which no retry will fix.
+    """
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError))
+
+def reading_key(device_code: str, timestamp: datetime) -> Tuple[str, datetime]:
+    """
+    Natural key of a reading, matching UNIQUE (device_id, timestamp): times
+    with a UTC offset become naive local time, as the column stores them
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return device_code, timestamp
+
+class RecentReadings:
+    """
+    LRU of the keys of recently stored readings, so repeated deliveries (the
+    webhook retrying, the poller fetching what the webhook already stored)
+    are dropped before they reach the database. Per process; keys are only
+    added after commit, and the unique index catches whatever this misses.
+    """
+
+    def __init__(self, max_keys: int = SharedConfig.INGEST_DEDUPE_CACHE_SIZE):
+        self.max_keys = max_keys
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key: Tuple[str, datetime]) -> bool:
+        """True (and counted as a duplicate) when the reading was stored recently"""
+        if not self.max_keys:
+            return False
+        with self._lock:
+            if key not in self._keys:
+                return False
+            self._keys.move_to_end(key)
+        ingest_duplicates.labels("cache").inc()
+        return True
+
+    def remember(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Called by ingest paths after commit with the rows they inserted"""
+        if not self.max_keys:
+            return
+        with self._lock:
+            for row in rows:
+                key = (row['device_code'], row['timestamp'])
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+def insert_readings(conn, readings: List[Reading]) -> List[Dict[str, Any]]:
+    """
+    Insert readings and their decoded sensor_values inside the caller's
+    transaction (the caller commits, then calls recent_readings.remember()).
+    Unknown devices are skipped, and so are readings already stored: those
+    in recent_readings, repeats within the batch and, through ON CONFLICT,
+    any other (device, timestamp) already in sensor_readings.
+    Returns the inserted rows (reading_id, device_id, device_code, zone_code,
+    encoded_data, timestamp), e.g. for latest_cache.update() after commit.
+    """
+    rows = []
+    devices = {}
+    keys = set()
+    for device_code, encoded_data, timestamp in readings:
+        key = reading_key(device_code, timestamp)
+        if key in keys:
+            ingest_duplicates.labels("batch").inc()
+            continue
+        if recent_readings.seen(key):
+            continue
+        device = device_registry.get_device(conn, device_code)
+        if device is None:
+            logger.error(f"Device not found: {device_code}")
+            continue
+        keys.add(key)
+        devices[device['device_id']] = device
+        rows.append((device['device_id'], encoded_data, key[1]))
+
+    if not rows:
+        return []
+
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        with db_query_seconds.labels("insert_readings").time():
+            inserted = execute_values(cur, """
+                INSERT INTO sensor_readings (device_id, encoded_data, timestamp)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                RETURNING reading_id, device_id, encoded_data, timestamp
+            """, rows, page_size=len(rows), fetch=True)
+    finally:
+        cur.close()
+
+    if len(inserted) < len(rows):
+        ingest_duplicates.labels("database").inc(len(rows) - len(inserted))
+    for row in inserted:
+        device = devices[row['device_id']]
+        row['device_code'] = device['code']
+        row['zone_code'] = device['zone_code']
+    insert_sensor_values(conn, inserted)
+    return inserted
+
+def reading_outcomes(conn, readings: List[Reading],
+                     inserted: List[Dict[str, Any]]) -> List[Union[int, str, None]]:
+    """
+    What insert_readings() did with each reading: the reading_id of its new
+    row, DUPLICATE when it was already stored, or None when its device is
+    not in the database
+    """
+    reading_ids = {(row['device_code'], row['timestamp']): row['reading_id'] for row in inserted}
+    outcomes = []
+    for device_code, _, timestamp in readings:
+        # pop: a repeat within the batch is a duplicate of the first one
+        reading_id = reading_ids.pop(reading_key(device_code, timestamp), None)
+        if reading_id is not None:
+            outcomes.append(reading_id)
+        elif device_registry.get_device(conn, device_code) is None:
+            outcomes.append(None)
+        else:
+            outcomes.append(DUPLICATE)
+    return outcomes
+
+def sensor_value_rows(conn, readings: List[Dict[str, Any]]) -> List[Tuple]:
+    """
+    Decode stored readings (reading_id, device_id, device_code, encoded_data,
+    timestamp) into sensor_values rows, one per reading per device sensor
+    """
+    groups = {}
+    for reading in readings:
+        groups.setdefault(reading['device_code'], []).append(reading)
+
+    rows = []
+    for device_code, group in groups.items():
+        plan = reading_decoder.plan_for(conn, device_code)
+        if plan is None:
+            continue
+        decoded = plan.unpack_many([reading['encoded_data'] for reading in group])
+        for reading, values in zip(group, decoded):
+            if values is None:
+                logger.warning(f"Reading {reading['reading_id']} ({device_code}) does not match the sensor layout")
+                continue
+            for device_sensor_id, value in zip(plan.device_sensor_ids, values):
+                rows.append((reading['reading_id'], device_sensor_id, reading['device_id'],
+                             reading['timestamp'], value))
+    return rows
+
+def insert_sensor_values(conn, readings: List[Dict[str, Any]]) -> int:
+    """
+    Insert decoded values for already stored readings and fold them into the
+    hourly/daily rollups. Values that already exist are skipped (and not
+    counted again in the rollups).
+    """
+    rows = sensor_value_rows(conn, readings)
+    if not rows:
+        return 0
+
+    cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        with db_query_seconds.labels("insert_sensor_values").time():
+            inserted = execute_values(cur, """
+                INSERT INTO sensor_values (reading_id, device_sensor_id, device_id, timestamp, value)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                RETURNING device_sensor_id, device_id, timestamp, value
+            """, rows, page_size=1000, fetch=True)
+        with db_query_seconds.labels("update_rollups").time():
+            update_rollups(cur, inserted)
+    finally:
+        cur.close()
+    return len(inserted)
+
+def _rollup_rows(values: List[Tuple], truncate) -> List[Tuple]:
+    """Aggregate (device_sensor_id, device_id, timestamp, value) into bucket rows"""
+    buckets = {}
+    for device_sensor_id, device_id, timestamp, value in values:
+        key = (device_sensor_id, truncate(timestamp))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [device_id, value, value, value, 1]
+        else:
+            bucket[1] = min(bucket[1], value)
+            bucket[2] = max(bucket[2], value)
+            bucket[3] += value
+            bucket[4] += 1
+    # Sorted so concurrent writers lock bucket rows in the same order
+    return [(device_sensor_id, bucket_start, *bucket)
+            for (device_sensor_id, bucket_start), bucket in sorted(buckets.items())]
+
+def update_rollups(cur, values: List[Tuple]) -> None:
+    """Merge new sensor values into sensor_rollup_hourly and sensor_rollup_daily"""
+    if not values:
+        return
+
+    for table, truncate in ROLLUP_TABLES:
+        execute_values(cur, f"""
+            INSERT INTO {table}
+                (device_sensor_id, bucket_start, device_id, min_value, max_value, sum_value, sample_count)
+            VALUES %s
+            ON CONFLICT (device_sensor_id, bucket_start) DO UPDATE SET
+                min_value = LEAST({table}.min_value, EXCLUDED.min_value),
+                max_value = GREATEST({table}.max_value, EXCLUDED.max_value),
+                sum_value = {table}.sum_value + EXCLUDED.sum_value,
+                sample_count = {table}.sample_count + EXCLUDED.sample_count
+        """, _rollup_rows(values, truncate), page_size=1000)
+
+# Global instance
+recent_readings = RecentReadings()
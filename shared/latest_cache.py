@@ -0,0 +1,285 @@
+# shared/latest_cache.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .config import SharedConfig
+
+logger = logging.getLogger(__name__)
+
+# Fields kept per device; routes pick the ones they return
+CACHED_FIELDS = ('reading_id', 'device_code', 'zone_code', 'encoded_data', 'timestamp')
+
+def _entry(reading: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: reading.get(field) for field in CACHED_FIELDS}
+
+def _is_newer(candidate: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]) -> bool:
+    if current is None:
+        return True
+    if candidate is None:
+        return False
+    if current['timestamp'] is None or candidate['timestamp'] is None:
+        return candidate['timestamp'] is not None
+    return candidate['timestamp'] >= current['timestamp']
+
+class SQLiteLatestBackend:
+    """
+    Shared latest-reading store in a local SQLite file, so every gunicorn
+    worker and the poller see the same entries. Only newer readings replace
+    stored ones.
+    """
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (workers fork after import)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS latest_readings (
+                    device_code TEXT PRIMARY KEY,
+                    ts TEXT,
+                    payload TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _dump(entry: Optional[Dict[str, Any]]) -> Tuple[Optional[str], str]:
+        if entry is None:
+            return None, 'null'
+        data = dict(entry)
+        if isinstance(data['timestamp'], datetime):
+            data['timestamp'] = data['timestamp'].isoformat()
+        return data['timestamp'], json.dumps(data)
+
+    @staticmethod
+    def _load(payload: str) -> Optional[Dict[str, Any]]:
+        data = json.loads(payload)
+        if data and data.get('timestamp'):
+            data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+        return data
+
+    def get_many(self, codes: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        codes = list(codes)
+        if not codes:
+            return {}
+        placeholders = ",".join("?" * len(codes))
+        rows = self._conn().execute(
+            f"SELECT device_code, payload FROM latest_readings "
+            f"WHERE device_code IN ({placeholders}) AND updated_at >= ?",
+            (*codes, time.time() - self.ttl)
+        ).fetchall()
+        return {code: self._load(payload) for code, payload in rows}
+
+    def put_many(self, entries: Dict[str, Optional[Dict[str, Any]]], newer_only: bool) -> None:
+        rows = []
+        now = time.time()
+        for code, entry in entries.items():
+            ts, payload = self._dump(entry)
+            rows.append((code, ts, payload, now))
+        # ISO timestamps compare correctly as text
+        condition = "WHERE excluded.ts >= latest_readings.ts OR latest_readings.ts IS NULL" if newer_only else ""
+        self._conn().executemany(f"""
+            INSERT INTO latest_readings (device_code, ts, payload, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(device_code) DO UPDATE SET
+                ts = excluded.ts, payload = excluded.payload, updated_at = excluded.updated_at
+            {condition}
+        """, rows)
+
+    def get_all(self) -> Optional[Dict[str, Optional[Dict[str, Any]]]]:
+        """Every entry, or None unless a full fill happened and no entry has expired"""
+        conn = self._conn()
+        cutoff = time.time() - self.ttl
+        complete = conn.execute(
+            "SELECT 1 FROM cache_meta WHERE key = 'complete' AND updated_at >= ?", (cutoff,)
+        ).fetchone()
+        if not complete:
+            return None
+        rows = conn.execute("SELECT device_code, payload, updated_at FROM latest_readings").fetchall()
+        if any(updated_at < cutoff for _, _, updated_at in rows):
+            return None
+        return {code: self._load(payload) for code, payload, _ in rows}
+
+    def mark_complete(self) -> None:
+        """Record that every device has an entry (after a full latest-readings query)"""
+        self._conn().execute("""
+            INSERT INTO cache_meta (key, value, updated_at) VALUES ('complete', '1', ?)
+            ON CONFLICT(key) DO UPDATE SET updated_at = excluded.updated_at
+        """, (time.time(),))
+
+def create_backend(url: str):
+    """Backend from a URL such as sqlite:////var/lib/greenhouse/latest.db"""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteLatestBackend(url[len("sqlite:///"):], SharedConfig.LATEST_CACHE_SHARED_TTL)
+    raise ValueError(f"Unsupported latest cache backend: {url}")
+
+class LatestReadingCache:
+    """
+    Latest reading per device code. Ingest paths call update() after commit;
+    read routes call get()/get_all() and fall back to Postgres on a miss,
+    then fill() the cache with what they read.
+
+    Local entries expire after `ttl` seconds so writes made by other processes
+    become visible; with a shared backend those writes are visible at once.
+    """
+
+    def __init__(self, ttl: float = SharedConfig.LATEST_CACHE_TTL, backend=None):
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = {}     # device_code -> (expires_at, entry or None)
+        self._all_codes = None  # (expires_at, [device_code, ...])
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _local(self, code: str, now: float):
+        cached = self._entries.get(code)
+        if cached is None or cached[0] < now:
+            return False, None
+        return True, cached[1]
+
+    def _store_local(self, entries: Dict[str, Optional[Dict[str, Any]]], newer_only: bool, now: float):
+        expires_at = now + self.ttl
+        with self._lock:
+            for code, entry in entries.items():
+                current = self._entries.get(code)
+                # An expired entry is always replaced
+                if newer_only and current is not None and current[0] >= now and not _is_newer(entry, current[1]):
+                    continue
+                self._entries[code] = (expires_at, entry)
+
+    def _backend_call(self, method: str, *args):
+        """Backend errors never break a request; they only cost a cache miss"""
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            logger.warning(f"Latest cache backend {method} failed: {e}")
+            return None
+
+    def get(self, device_code: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(found, reading); reading is None for a device known to have no readings"""
+        now = time.monotonic()
+        found, entry = self._local(device_code, now)
+        if found:
+            self.hits += 1
+            return True, entry
+
+        if self.backend is not None:
+            shared = self._backend_call('get_many', [device_code]) or {}
+            if device_code in shared:
+                self.shared_hits += 1
+                self._store_local(shared, newer_only=False, now=now)
+                return True, shared[device_code]
+
+        self.misses += 1
+        return False, None
+
+    def get_all(self) -> Optional[List[Dict[str, Any]]]:
+        """Latest reading of every device, or None when any entry is missing"""
+        now = time.monotonic()
+        all_codes = self._all_codes
+        if all_codes is not None and all_codes[0] >= now:
+            entries = []
+            for code in all_codes[1]:
+                found, entry = self._local(code, now)
+                if not found:
+                    break
+                entries.append(entry)
+            else:
+                self.hits += 1
+                return [entry for entry in entries if entry is not None]
+
+        if self.backend is not None:
+            shared = self._backend_call('get_all')
+            if shared is not None:
+                self.shared_hits += 1
+                self._store_local(shared, newer_only=False, now=now)
+                self._all_codes = (now + self.ttl, sorted(shared))
+                return [shared[code] for code in sorted(shared) if shared[code] is not None]
+
+        self.misses += 1
+        return None
+
+    def fill(self, device_code: str, reading: Optional[Dict[str, Any]]) -> None:
+        """Store what a route read from Postgres (None = device has no readings)"""
+        entries = {device_code: _entry(reading) if reading else None}
+        self._store_local(entries, newer_only=True, now=time.monotonic())
+        if self.backend is not None:
+            self._backend_call('put_many', entries, True)
+
+    def fill_all(self, readings: List[Dict[str, Any]]) -> None:
+        """Store the result of a full latest-readings query"""
+        now = time.monotonic()
+        entries = {reading['device_code']: _entry(reading) for reading in readings}
+        codes = list(entries)
+        self._store_local(entries, newer_only=True, now=now)
+        self._all_codes = (now + self.ttl, codes)
+        if self.backend is not None:
+            self._backend_call('put_many', entries, True)
+            self._backend_call('mark_complete')
+
+    def update(self, readings: Iterable[Dict[str, Any]]) -> None:
+        """Called by ingest paths after commit with the rows they inserted"""
+        entries = {}
+        for reading in readings:
+            entry = _entry(reading)
+            if _is_newer(entry, entries.get(entry['device_code'])):
+                entries[entry['device_code']] = entry
+        if not entries:
+            return
+
+        now = time.monotonic()
+        self._store_local(entries, newer_only=True, now=now)
+        with self._lock:
+            if self._all_codes is not None:
+                new_codes = [code for code in entries if code not in self._all_codes[1]]
+                if new_codes:
+                    self._all_codes = (self._all_codes[0], self._all_codes[1] + new_codes)
+        if self.backend is not None:
+            self._backend_call('put_many', entries, True)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._all_codes = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "backend": type(self.backend).__name__ if self.backend is not None else None
+        }
+
+# Global instance
+latest_cache = LatestReadingCache(backend=create_backend(SharedConfig.LATEST_CACHE_BACKEND))
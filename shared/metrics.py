@@ -0,0 +1,441 @@
+# shared/metrics.py
+import os
+import json
+import glob
+import math
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+from .config import SharedConfig
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow export
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Pending updates a writer may leave behind before it folds them itself
+FOLD_THRESHOLD = 1024
+
+class _DeferredChild:
+    """
+    Writers only append to a deque (atomic under the GIL, never blocks).
+    Appended updates are folded into the totals when the metric is collected,
+    or by a writer that finds FOLD_THRESHOLD pending and the fold lock free.
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._function = None
+
+    def _add(self, value) -> None:
+        self._pending.append(value)
+        if len(self._pending) >= FOLD_THRESHOLD and self._lock.acquire(blocking=False):
+            try:
+                self._fold_pending()
+            finally:
+                self._lock.release()
+
+    def _fold_pending(self) -> None:
+        pending = self._pending
+        while True:
+            try:
+                value = pending.popleft()
+            except IndexError:
+                return
+            self._fold(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from function() at collection time instead"""
+        self._function = function
+
+    def collect(self):
+        if self._function is not None:
+            return float(self._function())
+        with self._lock:
+            self._fold_pending()
+            return self._state()
+
+class CounterChild(_DeferredChild):
+    def __init__(self):
+        super().__init__()
+        self._value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self._add(amount)
+
+    def _fold(self, amount) -> None:
+        self._value += amount
+
+    def _state(self) -> float:
+        return self._value
+
+class GaugeChild:
+    """Last value wins; a plain attribute store is already atomic"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def collect(self) -> float:
+        if self._function is not None:
+            return float(self._function())
+        return self._value
+
+class HistogramChild(_DeferredChild):
+    def __init__(self, buckets: Sequence[float]):
+        super().__init__()
+        self._bounds = list(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)  # last slot is +Inf
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._add(value)
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of a with-block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(time.perf_counter() - started)
+
+    def _fold(self, value) -> None:
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+
+    def _state(self) -> Dict[str, Any]:
+        return {"counts": list(self._counts), "sum": self._sum}
+
+class Metric:
+    """A metric family; labels(...) returns the child for one label combination"""
+
+    def __init__(self, kind: str, name: str, documentation: str,
+                 labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 merge: str = "sum"):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if kind == "histogram" else None
+        self.merge = merge
+        self._children = {}
+        if not self.labelnames:
+            # Expose 0 before the first update instead of no sample at all
+            self.labels()
+
+    def _new_child(self):
+        if self.kind == "counter":
+            return CounterChild()
+        if self.kind == "gauge":
+            return GaugeChild()
+        return HistogramChild(self.buckets)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            # Two threads may race here; setdefault keeps exactly one child
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = []
+        for key, child in list(self._children.items()):
+            try:
+                samples.append([list(key), child.collect()])
+            except Exception as e:
+                logger.warning(f"Metric {self.name}{key} could not be collected: {e}")
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "buckets": list(self.buckets) if self.buckets else None,
+            "merge": self.merge,
+            "samples": samples
+        }
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add up samples with the same name and labels (counters, gauges and histograms)"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, dict(family, samples={}))
+            for labels, value in family["samples"]:
+                key = tuple(labels)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif family.get("merge") == "max":
+                    target["samples"][key] = max(current, value)
+                elif family["type"] == "histogram":
+                    target["samples"][key] = {
+                        "counts": [a + b for a, b in zip(current["counts"], value["counts"])],
+                        "sum": current["sum"] + value["sum"]
+                    }
+                else:
+                    target["samples"][key] = current + value
+    for family in merged.values():
+        family["samples"] = [[list(key), value] for key, value in family["samples"].items()]
+    return merged
+
+def render(snapshot: Dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name in sorted(snapshot):
+        family = snapshot[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in sorted(family["samples"], key=lambda sample: sample[0]):
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(family['labels'], labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            bounds = [_format_value(bound) for bound in family["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, value["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(family['labels'], labels, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(family['labels'], labels)} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(family['labels'], labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path: str, content: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MetricsRegistry:
+    """
+    In-process metrics. With a metrics_dir, every process (gunicorn worker)
+    also publishes its snapshot there every flush_interval seconds, and
+    render_all() adds up the snapshots of all workers plus any *.prom
+    textfiles (e.g. from the poller), so a scrape does not depend on which
+    worker answers it.
+    """
+
+    def __init__(self, metrics_dir: str = "", flush_interval: float = 5.0):
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _register(self, kind: str, name: str, documentation: str, labelnames: Sequence[str],
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, merge: str = "sum") -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, documentation, labelnames, buckets, merge)
+            elif metric.kind != kind or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}{metric.labelnames}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register("counter", name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              merge: str = "sum") -> Metric:
+        """merge: how render_all() combines workers, "sum" (open connections) or "max" (oldest connection)"""
+        return self._register("gauge", name, documentation, labelnames, merge=merge)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        return self._register("histogram", name, documentation, labelnames, buckets)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def render(self) -> str:
+        """This process only"""
+        return render(self.snapshot())
+
+    # --- multi-process publishing -------------------------------------------------
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.metrics_dir, f"worker-{pid}.json")
+
+    def start_publisher(self) -> None:
+        """Publish every flush_interval seconds (call in each worker, e.g. post_worker_init)"""
+        if not self.metrics_dir or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._publish_loop, name="metrics-publisher", daemon=True)
+            self._thread.start()
+
+    def _publish_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.publish()
+
+    def publish(self) -> None:
+        """Write this process's snapshot to metrics_dir"""
+        if not self.metrics_dir:
+            return
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            _write_atomic(self._snapshot_path(os.getpid()),
+                          json.dumps({"pid": os.getpid(), "metrics": self.snapshot()}))
+        except Exception as e:
+            logger.warning(f"Could not publish metrics to {self.metrics_dir}: {e}")
+
+    def _archive_path(self) -> str:
+        return os.path.join(self.metrics_dir, "archive.json")
+
+    def clear_published(self) -> None:
+        """Remove worker snapshots of a previous server run (call in the master at startup)"""
+        if not self.metrics_dir:
+            return
+        for path in glob.glob(self._snapshot_path("*")) + [self._archive_path()]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def archive_worker(self, pid: int) -> None:
+        """
+        Fold an exited worker's counters and histograms into archive.json and
+        remove its snapshot, so recycled workers do not pile up files (call in
+        the master, e.g. gunicorn's child_exit).
+        """
+        if not self.metrics_dir:
+            return
+        try:
+            with open(self._snapshot_path(pid)) as f:
+                families = json.load(f)["metrics"]
+        except (OSError, ValueError, KeyError):
+            return
+        snapshots = [{name: family for name, family in families.items() if family["type"] != "gauge"}]
+        try:
+            with open(self._archive_path()) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+        try:
+            _write_atomic(self._archive_path(), json.dumps(merge_snapshots(snapshots)))
+            os.remove(self._snapshot_path(pid))
+        except Exception as e:
+            logger.warning(f"Could not archive metrics of worker {pid}: {e}")
+
+    def render_all(self) -> str:
+        """
+        This process plus the published snapshots of the other workers and the
+        *.prom textfiles in metrics_dir. Counters and histograms of exited
+        workers keep counting (so totals never go backwards, see
+        archive_worker); their gauges are dropped.
+        """
+        if not self.metrics_dir:
+            return self.render()
+
+        snapshots = [self.snapshot()]
+        try:
+            with open(self._archive_path()) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+        for path in glob.glob(self._snapshot_path("*")):
+            try:
+                with open(path) as f:
+                    published = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if published["pid"] == os.getpid():
+                continue
+            families = published["metrics"]
+            if not _pid_alive(published["pid"]):
+                families = {name: family for name, family in families.items() if family["type"] != "gauge"}
+            snapshots.append(families)
+
+        text = render(merge_snapshots(snapshots))
+        for path in sorted(glob.glob(os.path.join(self.metrics_dir, "*.prom"))):
+            try:
+                with open(path) as f:
+                    text += f.read()
+            except OSError:
+                continue
+        return text
+
+    def write_textfile(self, path: str) -> None:
+        """Write this registry as a *.prom file (for short-lived jobs like the poller)"""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _write_atomic(path, self.render())
+        except Exception as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+
+# Global instance
+metrics = MetricsRegistry(SharedConfig.METRICS_DIR, SharedConfig.METRICS_FLUSH_INTERVAL)
+
+# Query time by name, shared by the API, the webhook and the ingest writer
+db_query_seconds = metrics.histogram(
+    "greenhouse_db_query_duration_seconds",
+    "Time spent in named database queries",
+    ["query"]
+)
+
+def execute_timed(cur, query: str, sql, params=None) -> None:
+    """cur.execute() recorded in greenhouse_db_query_duration_seconds{query=...}"""
+    with db_query_seconds.labels(query).time():
+        cur.execute(sql, params)
@@ -0,0 +1,200 @@
+# shared/rate_limiter.py
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from .config import SharedConfig
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+rate_limit_decisions = metrics.counter(
+    "greenhouse_rate_limit_decisions_total",
+    "Rate limiter decisions by policy and result",
+    ["policy", "result"]
+)
+rate_limit_backend_errors = metrics.counter(
+    "greenhouse_rate_limit_backend_errors_total",
+    "Rate limiter backend failures (the request is allowed)"
+)
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    # Clamped, so a wall clock stepping backwards never removes tokens
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+def _take(tokens: float, rate: float, cost: float) -> Tuple[bool, float, float]:
+    """(allowed, tokens left, seconds until `cost` tokens are available)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+class MemoryBucketBackend:
+    """
+    Token buckets in this process only (development server, single worker).
+    Least recently used keys are dropped beyond `max_keys`; a dropped key
+    simply starts again with a full bucket.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, rate: float, capacity: float, cost: float, now: float) -> Tuple[bool, float, float]:
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            allowed, tokens, retry_after = _take(_refill(tokens, updated, now, rate, capacity), rate, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens, retry_after
+
+class SQLiteBucketBackend:
+    """
+    Token buckets in a local SQLite file, shared by every gunicorn worker.
+    Each decision is one short write transaction; idle buckets are deleted
+    every `prune_every` decisions instead of being scanned per request.
+    """
+
+    def __init__(self, path: str, prune_every: int = 1000, idle_after: int = 3600):
+        self.path = path
+        self.prune_every = prune_every
+        self.idle_after = idle_after
+        self._calls = 0
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (workers fork after import)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key: str, rate: float, capacity: float, cost: float, now: float) -> Tuple[bool, float, float]:
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, so two workers cannot both spend the same tokens
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = _refill(row[0], row[1], now, rate, capacity) if row else capacity
+            allowed, tokens, retry_after = _take(tokens, rate, cost)
+            conn.execute("""
+                INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated
+            """, (key, tokens, now))
+
+            self._calls += 1
+            if self._calls % self.prune_every == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.idle_after,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens, retry_after
+
+class RedisBucketBackend:
+    """Token buckets in Redis (or a compatible server), updated atomically by a Lua script"""
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local capacity = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local now = tonumber(ARGV[4])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str, prefix: str = "greenhouse:rate:"):
+        # Optional dependency, only needed when RATE_LIMIT_BACKEND is a redis:// URL
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=1.0)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key: str, rate: float, capacity: float, cost: float, now: float) -> Tuple[bool, float, float]:
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[rate, capacity, cost, now])
+        tokens = float(tokens)
+        if allowed:
+            return True, tokens, 0.0
+        return False, tokens, (cost - tokens) / rate
+
+def create_backend(url: str):
+    """
+    Backend from a URL: memory://, sqlite:////path/to/file.db or
+    redis://host:6379/0. Empty = a SQLite file in the temp directory.
+    """
+    if not url:
+        return SQLiteBucketBackend(os.path.join(tempfile.gettempdir(), "greenhouse_rate_limit.db"))
+    if url == "memory://":
+        return MemoryBucketBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBucketBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketBackend(url)
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+class RateLimit:
+    """Policy: `limit` requests per `period` seconds, bursts of up to `burst` (default `limit`)"""
+
+    def __init__(self, name: str, limit: float, period: float = 60, burst: Optional[float] = None):
+        self.name = name
+        self.limit = limit
+        self.rate = limit / period if limit > 0 else 0.0
+        self.capacity = burst or limit
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+class RateLimiter:
+    """
+    Token-bucket limiter. hit() costs O(1) in every backend; with a shared
+    backend the limits hold across all workers.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hit(self, policy: RateLimit, key: str, cost: float = 1) -> Tuple[bool, float]:
+        """(allowed, retry_after seconds); backend errors allow the request"""
+        if not policy.enabled:
+            return True, 0.0
+        try:
+            allowed, _, retry_after = self.backend.consume(
+                f"{policy.name}:{key}", policy.rate, policy.capacity, cost, time.time())
+        except Exception as e:
+            rate_limit_backend_errors.inc()
+            logger.warning(f"Rate limit backend failed for {policy.name}: {e}")
+            return True, 0.0
+
+        rate_limit_decisions.labels(policy.name, "allowed" if allowed else "limited").inc()
+        return allowed, retry_after
+
+# Global instance
+rate_limiter = RateLimiter(create_backend(SharedConfig.RATE_LIMIT_BACKEND))
@@ -6,6 +6,9 @@ Components:
 - webhook_config.py: Webhook-specific configuration
 - webhook_auth.py: Authentication and security
 - webhook_utils.py: Utility functions and helpers
+- webhook_metrics.py: Ingest and rejection counters for /metrics
+- webhook_queue.py: Bounded ingest queue flushed to the database in batches
+- webhook_spool.py: Durable local spool and replayer for readings the database could not take
 """
 
 __version__ = "1.0.0"
@@ -1,8 +1,18 @@
 # webhook/webhook_auth.py (Simplified)
+import sys
+import os
+import math
+import hashlib
 import logging
 from flask import request, jsonify
 from functools import wraps
 from .webhook_config import WebhookConfig
+from .webhook_metrics import webhook_rejections
+
+# Add parent directories to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from shared.rate_limiter import RateLimit, rate_limiter
 
 logger = logging.getLogger('webhook')
 
@@ -13,6 +23,7 @@ def webhook_auth_required(f):
         # Check API key
         api_key = request.headers.get('X-API-KEY')
         if api_key != WebhookConfig.API_KEY:
+            webhook_rejections.labels("unauthorized").inc()
             logger.warning(f"Unauthorized webhook attempt from {request.remote_addr}")
             return jsonify({"status": "error", "message": "Unauthorized"}), 401
         
@@ -27,26 +38,32 @@ def validate_payload_size():
         return False
     return True
 
-# Simple rate limiting (very basic, in-memory)
-request_counts = {}
+# Rate limit policies (token buckets in the shared rate limiter backend)
+CLIENT_LIMIT = RateLimit("webhook_client", WebhookConfig.RATE_LIMIT_PER_MINUTE,
+                         burst=WebhookConfig.RATE_LIMIT_BURST)
+KEY_LIMIT = RateLimit("webhook_key", WebhookConfig.KEY_RATE_LIMIT_PER_MINUTE)
+DEVICE_LIMIT = RateLimit("webhook_device", WebhookConfig.DEVICE_RATE_LIMIT_PER_MINUTE,
+                         burst=WebhookConfig.DEVICE_RATE_LIMIT_BURST)
 
 def check_rate_limit():
-    """Very simple rate limiting"""
-    import time
-    
-    client_ip = request.remote_addr
-    current_minute = int(time.time() // 60)
-    key = f"{client_ip}:{current_minute}"
-    
-    # Clean old entries
-    old_keys = [k for k in request_counts if int(k.split(':')[1]) < current_minute - 2]
-    for k in old_keys:
-        del request_counts[k]
-    
-    # Check current count
-    current_count = request_counts.get(key, 0)
-    if current_count >= WebhookConfig.RATE_LIMIT_PER_MINUTE:
-        return False
-    
-    request_counts[key] = current_count + 1
-    return True
\ No newline at end of file
+    """
+    Limits per client address and per API key
+    Returns: (allowed, retry_after seconds)
+    """
+    allowed, retry_after = rate_limiter.hit(CLIENT_LIMIT, request.remote_addr)
+    api_key = request.headers.get('X-API-KEY')
+    # Only the valid key gets a bucket, so random keys cannot fill the backend
+    if allowed and api_key and api_key == WebhookConfig.API_KEY:
+        key_id = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        allowed, retry_after = rate_limiter.hit(KEY_LIMIT, key_id)
+    return allowed, retry_after
+
+def check_device_rate_limit(device_code):
+    """Limit per device, checked once the payload has been parsed"""
+    return rate_limiter.hit(DEVICE_LIMIT, device_code)
+
+def rate_limited_response(message, retry_after):
+    """429 with a Retry-After header"""
+    response = jsonify({"status": "error", "message": message})
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response, 429
\ No newline at end of file
@@ -9,12 +9,38 @@ class WebhookConfig:
     # Authentication
     API_KEY = os.getenv("API_KEY", "")
     
-    # Rate limiting (very permissive)
+    # Rate limiting (token buckets shared by all workers, see RATE_LIMIT_BACKEND)
+    # Per client address (very permissive), per API key and per device; 0 = off
     RATE_LIMIT_PER_MINUTE = int(os.getenv("WEBHOOK_RATE_LIMIT", "1000"))
+    RATE_LIMIT_BURST = int(os.getenv("WEBHOOK_RATE_LIMIT_BURST", "0")) or RATE_LIMIT_PER_MINUTE
+    KEY_RATE_LIMIT_PER_MINUTE = int(os.getenv("WEBHOOK_KEY_RATE_LIMIT", "0"))
+    DEVICE_RATE_LIMIT_PER_MINUTE = int(os.getenv("WEBHOOK_DEVICE_RATE_LIMIT", "120"))
+    DEVICE_RATE_LIMIT_BURST = int(os.getenv("WEBHOOK_DEVICE_RATE_LIMIT_BURST", "0")) or DEVICE_RATE_LIMIT_PER_MINUTE
     
     # Payload size limit (generous)
     MAX_PAYLOAD_SIZE = int(os.getenv("WEBHOOK_MAX_PAYLOAD_SIZE", "5242880"))  # 5MB
     
+    # Ingest mode: "sync" writes each reading inside the request,
+    # "queue" buffers readings and writes them in batches
+    INGEST_MODE = os.getenv("WEBHOOK_INGEST_MODE", "sync")
+    QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_MAX_SIZE", "10000"))
+    QUEUE_BATCH_SIZE = int(os.getenv("WEBHOOK_QUEUE_BATCH_SIZE", "500"))
+    QUEUE_FLUSH_INTERVAL = float(os.getenv("WEBHOOK_QUEUE_FLUSH_INTERVAL", "1.0"))  # seconds
+    QUEUE_SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_QUEUE_SHUTDOWN_TIMEOUT", "10"))  # seconds
+    
+    # Local spool (SQLite file) for readings the database cannot take: it is
+    # down, or a direct write exceeds the latency budget. After a failure,
+    # readings go straight to the spool for SPOOL_BYPASS_SECONDS while a
+    # background replayer drains it into sensor_readings; empty path = off
+    SPOOL_PATH = os.getenv("WEBHOOK_SPOOL_PATH", "/home/elektro1/smart_greenhouse/spool/webhook_spool.db")
+    SPOOL_LATENCY_BUDGET = float(os.getenv("WEBHOOK_SPOOL_LATENCY_BUDGET", "2.0"))  # seconds
+    SPOOL_BYPASS_SECONDS = float(os.getenv("WEBHOOK_SPOOL_BYPASS_SECONDS", "30"))
+    SPOOL_REPLAY_BATCH = int(os.getenv("WEBHOOK_SPOOL_REPLAY_BATCH", "1000"))
+    SPOOL_REPLAY_INTERVAL = float(os.getenv("WEBHOOK_SPOOL_REPLAY_INTERVAL", "5"))  # seconds
+    
+    # Batch endpoint (/webhook/antares/batch): most items per request
+    BATCH_MAX_ITEMS = int(os.getenv("WEBHOOK_BATCH_MAX_ITEMS", "5000"))
+    
     # Logging
     LOG_FILE = os.getenv("WEBHOOK_LOG_FILE", "/home/elektro1/smart_greenhouse/logs/webhook.log")
     
@@ -27,18 +53,16 @@ class WebhookConfig:
         "DRTPM-Hidroponik": ["Monitoring_Hidroponik"]
     }
     
+    # Lookups derived from DEVICE_MAPPING: every device, and device -> application
+    DEVICES = frozenset(device for devices in DEVICE_MAPPING.values() for device in devices)
+    DEVICE_APPS = {device: app_name for app_name, devices in DEVICE_MAPPING.items() for device in devices}
+    
     @classmethod
     def validate_device(cls, device_name):
         """Check if device name is valid"""
-        all_devices = []
-        for devices in cls.DEVICE_MAPPING.values():
-            all_devices.extend(devices)
-        return device_name in all_devices
+        return isinstance(device_name, str) and device_name in cls.DEVICES
     
     @classmethod
     def get_app_for_device(cls, device_name):
         """Get application name for a device"""
-        for app_name, devices in cls.DEVICE_MAPPING.items():
-            if device_name in devices:
-                return app_name
-        return None
\ No newline at end of file
+        return cls.DEVICE_APPS.get(device_name)
@@ -2,105 +2,225 @@ import sys
 import os
 import logging
 from datetime import datetime
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Union
 
 # Add parent directories to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# The API imports its modules flat (see flask_api/wsgi.py); import db the same
+# way, so the webhook uses the API's connection pool instead of a second copy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "flask_api"))
 
-from flask_api.db import get_db_connection, return_db_connection
+from db import db_connection
+from shared.ingest import (Reading, DUPLICATE, database_unavailable, insert_readings, reading_key,
+                           reading_outcomes, recent_readings)
+from shared.latest_cache import latest_cache
+from shared.metrics import execute_timed
 from .webhook_config import WebhookConfig
-from .webhook_utils import parse_webhook_payload, validate_hex_data
+from .webhook_utils import parse_webhook_payload, validate_hex_data, device_formats
+from .webhook_metrics import webhook_readings, webhook_rejections
+from .webhook_spool import reading_spool
 
 logger = logging.getLogger('webhook')
 
 class WebhookDataHandler:
     """Simplified webhook data handler"""
     
+    def validate_payload(self, payload: Dict[str, Any]) -> Tuple[bool, str, Optional[Reading]]:
+        """
+        Parse and validate a webhook payload without touching the database
+        Returns: (valid, message, (device_code, encoded_data, timestamp))
+        """
+        parsed_data = parse_webhook_payload(payload)
+        if not parsed_data:
+            webhook_rejections.labels("unparseable").inc()
+            return False, "Could not parse webhook data", None
+        
+        device_name, encoded_data, timestamp = parsed_data
+        device_code = device_name
+        
+        # Basic validation
+        if not WebhookConfig.validate_device(device_code):
+            webhook_rejections.labels("unknown_device").inc()
+            return False, f"Unknown device: {device_code}", None
+        
+        if not validate_hex_data(encoded_data):
+            webhook_rejections.labels("invalid_data").inc()
+            return False, f"Invalid data format: {encoded_data}", None
+        
+        return True, "Valid", (device_code, encoded_data, timestamp)
+    
     def process_webhook(self, payload: Dict[str, Any]) -> Tuple[bool, str]:
         """
         Process webhook payload - simplified version
         Returns: (success, message)
         """
         try:
-            # Parse the payload
-            parsed_data = parse_webhook_payload(payload)
-            if not parsed_data:
-                return False, "Could not parse webhook data"
+            valid, message, reading = self.validate_payload(payload)
+            if not valid:
+                return False, message
             
-            device_name, encoded_data, timestamp = parsed_data
-            device_code = device_name
-            
-            # Basic validation
-            if not WebhookConfig.validate_device(device_code):
-                return False, f"Unknown device: {device_code}"
+            return self.store_reading(reading)
+                
+        except Exception as e:
+            logger.error(f"Webhook processing error: {e}")
+            return False, "Processing failed"
+    
+    def store_reading(self, reading: Reading) -> Tuple[bool, str]:
+        """
+        Save one validated reading, or spool it when the database is unavailable
+        (not when it rejects the reading, e.g. a constraint violation)
+        Returns: (success, message)
+        """
+        try:
+            device_code, encoded_data, timestamp = reading
             
-            if not validate_hex_data(encoded_data):
-                return False, f"Invalid data format: {encoded_data}"
+            # The database failed moments ago: answer at disk speed instead of waiting for it
+            if reading_spool.bypassing() and self.spool_readings([reading]):
+                return True, f"Data spooled for {device_code}"
             
             # Save to database
-            success = self.save_to_database(device_code, encoded_data, timestamp)
+            try:
+                saved = self.save_to_database(device_code, encoded_data, timestamp)
+            except Exception as e:
+                if not database_unavailable(e):
+                    # The database refused the reading itself: a retry from the spool would fail again
+                    logger.error(f"Database rejected reading for {device_code}: {e}")
+                    webhook_rejections.labels("db_rejected").inc()
+                    return False, f"Reading rejected by the database for {device_code}"
+                logger.error(f"Database error for {device_code}: {e}")
+                reading_spool.database_failed()
+                if self.spool_readings([reading]):
+                    return True, f"Data spooled for {device_code}"
+                webhook_rejections.labels("db_error").inc()
+                return False, f"Database save failed for {device_code}"
             
-            if success:
+            if saved == DUPLICATE:
+                # Already stored (a redelivery, or the poller got it first): nothing to retry
+                webhook_readings.labels("duplicate").inc()
+                return True, f"Duplicate reading ignored for {device_code}"
+            elif saved:
+                webhook_readings.labels("direct").inc()
                 logger.info(f"Webhook processed: {device_code} -> {encoded_data}")
                 return True, f"Data saved for {device_code}"
             else:
-                return False, f"Database save failed for {device_code}"
+                webhook_rejections.labels("unknown_device").inc()
+                return False, f"Device not found: {device_code}"
                 
         except Exception as e:
             logger.error(f"Webhook processing error: {e}")
             return False, "Processing failed"
     
-    def save_to_database(self, device_code: str, encoded_data: str, timestamp: datetime) -> bool:
-        """Save data to database"""
-        conn = None
-        try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            # Get device_id
-            cur.execute("SELECT device_id FROM devices WHERE code = %s", (device_code,))
-            result = cur.fetchone()
-            
-            if not result:
-                logger.error(f"Device not found: {device_code}")
-                return False
-            
-            device_id = result[0]
-            
-            # Insert reading
-            cur.execute("""
-                INSERT INTO sensor_readings (device_id, encoded_data, timestamp)
-                VALUES (%s, %s, %s)
-            """, (device_id, encoded_data, timestamp))
+    def save_to_database(self, device_code: str, encoded_data: str, timestamp: datetime) -> Union[int, str, None]:
+        """
+        Save data to database, within SPOOL_LATENCY_BUDGET when the spool is on
+        Returns the new reading_id, DUPLICATE when the reading is already stored,
+        or None when the device is not in the database; database errors propagate
+        """
+        # Stored moments ago: no need to ask the database
+        if recent_readings.seen(reading_key(device_code, timestamp)):
+            return DUPLICATE
+        
+        reading = (device_code, encoded_data, timestamp)
+        budget = WebhookConfig.SPOOL_LATENCY_BUDGET if reading_spool.enabled else 0
+        
+        # Uncommitted work is rolled back when the connection goes back to the pool
+        with db_connection(budget or None) as conn:
+            if budget:
+                cur = conn.cursor()
+                cur.execute("SET LOCAL statement_timeout = %s", (int(budget * 1000),))
+                cur.close()
             
+            # Insert reading and its decoded sensor values
+            inserted = insert_readings(conn, [reading])
+            outcome = reading_outcomes(conn, [reading], inserted)[0]
+            if not inserted:
+                return outcome
             conn.commit()
-            return True
-            
-        except Exception as e:
-            logger.error(f"Database error for {device_code}: {e}")
-            if conn:
-                conn.rollback()
+        
+        latest_cache.update(inserted)
+        recent_readings.remember(inserted)
+        return outcome
+    
+    def spool_readings(self, readings: List[Reading]) -> bool:
+        """Hand readings to the local spool; False when it is off or failed"""
+        if not reading_spool.append(readings):
             return False
+        webhook_readings.labels("spool").inc(len(readings))
+        logger.warning(f"Spooled {len(readings)} readings for later replay")
+        return True
+    
+    def save_batch(self, readings: List[Reading]) -> int:
+        """
+        Save a batch of readings with one multi-row insert and a single commit
+        Returns: number of rows inserted (duplicates, unknown devices and
+        readings the database rejects are skipped)
+        """
+        if not readings:
+            return 0
+        
+        try:
+            return sum(1 for outcome in self.store_batch(readings) if isinstance(outcome, int))
             
-        finally:
-            if conn:
-                return_db_connection(conn)
+        except Exception as e:
+            logger.error(f"Batch database error ({len(readings)} readings): {e}")
+            raise
+    
+    def store_batch(self, readings: List[Reading]) -> List[Union[int, str, None, Exception]]:
+        """
+        Save readings in one transaction. When the database rejects the batch
+        for its data (a value too long, a constraint), the readings are saved
+        one per transaction instead, so only the bad ones fail.
+        Returns per reading: its reading_id, DUPLICATE when it was already
+        stored, None where the device is not in the database, or the error the
+        database rejected it with. Errors of an unavailable database propagate.
+        """
+        try:
+            return self._insert_batch(readings)
+        except Exception as e:
+            if database_unavailable(e):
+                raise
+            if len(readings) == 1:
+                logger.error(f"Database rejected reading for {readings[0][0]}: {e}")
+                return [e]
+            logger.warning(f"Database rejected a batch of {len(readings)} readings, saving them one by one: {e}")
+        
+        outcomes = []
+        for reading in readings:
+            try:
+                outcomes.append(self._insert_batch([reading])[0])
+            except Exception as e:
+                if database_unavailable(e):
+                    raise
+                logger.error(f"Database rejected reading for {reading[0]}: {e}")
+                outcomes.append(e)
+        return outcomes
+    
+    def _insert_batch(self, readings: List[Reading]) -> List[Union[int, str, None]]:
+        """Save readings in one transaction; outcomes as store_batch(), all errors propagate"""
+        with db_connection() as conn:
+            inserted = insert_readings(conn, readings)
+            outcomes = reading_outcomes(conn, readings, inserted)
+            conn.commit()
+        
+        latest_cache.update(inserted)
+        recent_readings.remember(inserted)
+        return outcomes
     
     def get_status(self) -> Dict[str, Any]:
         """Get simple system status"""
         try:
             # Test database
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM sensor_readings WHERE timestamp >= NOW() - INTERVAL '1 hour'")
-            recent_count = cur.fetchone()[0]
-            cur.close()
-            return_db_connection(conn)
+            with db_connection() as conn:
+                cur = conn.cursor()
+                execute_timed(cur, "recent_readings", "SELECT COUNT(*) AS recent_count FROM sensor_readings WHERE timestamp >= NOW() - INTERVAL '1 hour'")
+                recent_count = cur.fetchone()["recent_count"]
+                cur.close()
             
             return {
                 "status": "healthy",
                 "database": "connected",
                 "recent_readings_1h": recent_count,
+                "payload_formats": device_formats(),
                 "timestamp": datetime.now().isoformat()
             }
             
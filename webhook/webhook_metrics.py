@@ -0,0 +1,71 @@
+# webhook/webhook_metrics.py
+import sys
+import os
+
+# Add parent directories to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from shared.metrics import metrics
+
+# Readings accepted by /webhook/antares (saved directly or queued) and /webhook/antares/batch
+webhook_readings = metrics.counter(
+    "greenhouse_webhook_readings_total",
+    "Webhook readings accepted, by ingest mode",
+    ["mode"]
+)
+
+# Items per /webhook/antares/batch request
+webhook_batch_items = metrics.histogram(
+    "greenhouse_webhook_batch_items",
+    "Items per batch webhook request",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+
+# Why a webhook request was turned away
+webhook_rejections = metrics.counter(
+    "greenhouse_webhook_rejections_total",
+    "Webhook requests rejected, by reason",
+    ["reason"]
+)
+
+# Ingest queue (INGEST_MODE=queue)
+queue_rows_written = metrics.counter(
+    "greenhouse_webhook_queue_written_total",
+    "Queued readings written to the database"
+)
+queue_rows_dropped = metrics.counter(
+    "greenhouse_webhook_queue_dropped_total",
+    "Queued readings dropped because their batch failed"
+)
+queue_flush_seconds = metrics.histogram(
+    "greenhouse_webhook_queue_flush_duration_seconds",
+    "Time to write one queued batch"
+)
+queue_depth = metrics.gauge(
+    "greenhouse_webhook_queue_depth",
+    "Readings waiting in the ingest queue"
+)
+queue_capacity = metrics.gauge(
+    "greenhouse_webhook_queue_capacity",
+    "Ingest queue size limit (QUEUE_MAX_SIZE)"
+)
+
+# Local spool (WEBHOOK_SPOOL_PATH)
+spool_rows_spooled = metrics.counter(
+    "greenhouse_webhook_spooled_total",
+    "Readings written to the local spool instead of the database"
+)
+spool_rows_replayed = metrics.counter(
+    "greenhouse_webhook_spool_replayed_total",
+    "Spooled readings replayed into the database"
+)
+spool_replay_seconds = metrics.histogram(
+    "greenhouse_webhook_spool_replay_duration_seconds",
+    "Time to replay one spooled batch"
+)
+# Every worker reads the same spool file, so workers are not added up
+spool_depth = metrics.gauge(
+    "greenhouse_webhook_spool_depth",
+    "Readings waiting in the local spool",
+    merge="max"
+)
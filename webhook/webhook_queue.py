@@ -0,0 +1,165 @@
+# webhook/webhook_queue.py
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from .webhook_config import WebhookConfig
+from .webhook_handler import webhook_handler, Reading
+from .webhook_metrics import (queue_rows_written, queue_rows_dropped, queue_flush_seconds,
+                              queue_depth, queue_capacity)
+
+logger = logging.getLogger('webhook')
+
+class IngestQueue:
+    """
+    Bounded in-process queue for validated readings.
+    A background thread flushes the queue in batches, either when
+    batch_size readings are waiting or flush_interval seconds have passed.
+    """
+
+    def __init__(self, writer: Callable[[List[Reading]], int], max_size: int,
+                 batch_size: int, flush_interval: float,
+                 fallback: Optional[Callable[[List[Reading]], bool]] = None):
+        self.writer = writer
+        # Takes a batch the writer failed on (e.g. the local spool); True = kept
+        self.fallback = fallback
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        # Held while a reading is queued, so none slips in after shutdown's drain
+        self._submit_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        # Counters (only the flusher thread updates written/failed/spooled)
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.spooled = 0
+        self.batches = 0
+
+    def submit(self, reading: Reading) -> bool:
+        """Queue a reading; returns False when the queue is full or shutting down"""
+        if self._stopping.is_set():
+            return False
+        self._ensure_started()
+        with self._submit_lock:
+            if self._stopping.is_set():
+                return False
+            try:
+                self._queue.put_nowait(reading)
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self.accepted += 1
+        return True
+
+    def _ensure_started(self):
+        """Start the flusher lazily so it runs in the worker, not the preloading master"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="webhook-ingest-flusher", daemon=True)
+            self._thread.start()
+            logger.info(f"Ingest queue flusher started (pid {self._pid})")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self) -> List[Reading]:
+        """Wait for up to batch_size readings or until flush_interval expires"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Reading]):
+        try:
+            with queue_flush_seconds.time():
+                written = self.writer(batch)
+            self.written += written
+            self.batches += 1
+            queue_rows_written.inc(written)
+        except Exception as e:
+            if self.fallback is not None and self.fallback(batch):
+                self.spooled += len(batch)
+                logger.warning(f"Ingest queue flush failed, {len(batch)} readings spooled: {e}")
+                return
+            self.failed += len(batch)
+            queue_rows_dropped.inc(len(batch))
+            logger.error(f"Ingest queue flush failed, {len(batch)} readings dropped: {e}")
+
+    def _drain(self):
+        """Write everything still queued in batch_size chunks"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def shutdown(self, timeout: float = None):
+        """Stop accepting readings and drain the queue (safe to call more than once)"""
+        with self._submit_lock:
+            if self._stopping.is_set():
+                return
+            self._stopping.set()
+
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout if timeout is not None else WebhookConfig.QUEUE_SHUTDOWN_TIMEOUT)
+
+        pending = self._queue.qsize()
+        self._drain()
+        if pending:
+            logger.info(f"Ingest queue drained {pending} readings on shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput counters"""
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "failed": self.failed,
+            "spooled": self.spooled,
+            "batches": self.batches
+        }
+
+# Global instance
+ingest_queue = IngestQueue(
+    webhook_handler.save_batch,
+    max_size=WebhookConfig.QUEUE_MAX_SIZE,
+    batch_size=WebhookConfig.QUEUE_BATCH_SIZE,
+    flush_interval=WebhookConfig.QUEUE_FLUSH_INTERVAL,
+    fallback=webhook_handler.spool_readings
+)
+
+queue_depth.set_function(ingest_queue._queue.qsize)
+queue_capacity.set(ingest_queue._queue.maxsize)
+
+atexit.register(ingest_queue.shutdown)
@@ -1,25 +1,39 @@
 # webhook/webhook_routes.py (Simplified)
 import logging
 from datetime import datetime
-from flask import request, jsonify, Blueprint
-from .webhook_handler import webhook_handler
-from .webhook_auth import webhook_auth_required, validate_payload_size, check_rate_limit
+from flask import request, jsonify, Blueprint, current_app
+from .webhook_config import WebhookConfig
+from .webhook_handler import webhook_handler, DUPLICATE
+from .webhook_queue import ingest_queue
+from .webhook_spool import reading_spool
+from .webhook_auth import (webhook_auth_required, validate_payload_size, check_rate_limit,
+                           check_device_rate_limit, rate_limited_response)
+from .webhook_metrics import webhook_readings, webhook_rejections, webhook_batch_items
 
 logger = logging.getLogger('webhook')
 
+# Request bodies read as one JSON document per line
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
 # Create webhook blueprint
 webhook_bp = Blueprint('webhook', __name__, url_prefix='/webhook')
 
 @webhook_bp.before_request
 def before_request():
     """Simple request validation"""
+    # Drain readings spooled by an earlier run (no-op once the replayer runs)
+    reading_spool.start()
+    
     # Check payload size
     if not validate_payload_size():
+        webhook_rejections.labels("payload_too_large").inc()
         return jsonify({"status": "error", "message": "Payload too large"}), 413
     
-    # Simple rate limiting
-    if not check_rate_limit():
-        return jsonify({"status": "error", "message": "Rate limit exceeded"}), 429
+    # Per-client and per-key rate limits (shared by all workers)
+    allowed, retry_after = check_rate_limit()
+    if not allowed:
+        webhook_rejections.labels("rate_limited").inc()
+        return rate_limited_response("Rate limit exceeded", retry_after)
 
 @webhook_bp.route('/antares', methods=['POST'])
 @webhook_auth_required
@@ -28,10 +42,27 @@ def antares_webhook():
     try:
         payload = request.get_json()
         if not payload:
+            webhook_rejections.labels("no_payload").inc()
             return jsonify({"status": "error", "message": "No JSON payload"}), 400
         
+        valid, message, reading = webhook_handler.validate_payload(payload)
+        if not valid:
+            return jsonify({
+                "status": "error",
+                "message": message,
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        allowed, retry_after = check_device_rate_limit(reading[0])
+        if not allowed:
+            webhook_rejections.labels("device_rate_limited").inc()
+            return rate_limited_response(f"Rate limit exceeded for {reading[0]}", retry_after)
+        
+        if WebhookConfig.INGEST_MODE == "queue":
+            return queue_webhook(reading)
+        
         # Process webhook
-        success, message = webhook_handler.process_webhook(payload)
+        success, message = webhook_handler.store_reading(reading)
         
         if success:
             return jsonify({
@@ -54,6 +85,153 @@ def antares_webhook():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+def queue_webhook(reading):
+    """Hand a validated reading to the ingest queue"""
+    if not ingest_queue.submit(reading):
+        webhook_rejections.labels("queue_full").inc()
+        logger.warning(f"Ingest queue full, rejecting reading for {reading[0]}")
+        response = jsonify({
+            "status": "error",
+            "message": "Ingest queue full",
+            "timestamp": datetime.now().isoformat()
+        })
+        response.headers["Retry-After"] = str(max(1, int(WebhookConfig.QUEUE_FLUSH_INTERVAL)))
+        return response, 429
+    
+    webhook_readings.labels("queue").inc()
+    return jsonify({
+        "status": "accepted",
+        "message": f"Data queued for {reading[0]}",
+        "timestamp": datetime.now().isoformat()
+    }), 202
+
+def read_batch():
+    """
+    Items of a batch request: a JSON array, or NDJSON (one payload per line)
+    Returns: list of payloads (None for lines that are not valid JSON), or None
+    when the body is neither. Reading stops after BATCH_MAX_ITEMS + 1 items.
+    """
+    if request.mimetype not in NDJSON_MIMETYPES:
+        items = request.get_json(silent=True)
+        return items if isinstance(items, list) else None
+    
+    items = []
+    for line in request.stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(current_app.json.loads(line))
+        except ValueError:
+            items.append(None)
+        if len(items) > WebhookConfig.BATCH_MAX_ITEMS:
+            break
+    return items
+
+def error_summary(error):
+    """First line of a database error (psycopg2 appends DETAIL/CONTEXT lines)"""
+    lines = str(error).strip().splitlines()
+    return lines[0] if lines else type(error).__name__
+
+@webhook_bp.route('/antares/batch', methods=['POST'])
+@webhook_auth_required
+def antares_webhook_batch():
+    """
+    Batch endpoint for buffered or replayed readings: every item is validated,
+    then all valid readings are written in one transaction, whatever INGEST_MODE is.
+    Only an unavailable database sends them to the spool; readings the
+    database rejects get a per-item error.
+    """
+    items = read_batch()
+    if not items:
+        webhook_rejections.labels("no_payload").inc()
+        return jsonify({"status": "error", "message": "Expected a JSON array or NDJSON body"}), 400
+    if len(items) > WebhookConfig.BATCH_MAX_ITEMS:
+        webhook_rejections.labels("batch_too_large").inc()
+        return jsonify({
+            "status": "error",
+            "message": f"Too many items (max {WebhookConfig.BATCH_MAX_ITEMS})"
+        }), 413
+    webhook_batch_items.observe(len(items))
+    
+    results = []
+    pending = []  # (result, reading) for valid items
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            webhook_rejections.labels("unparseable").inc()
+            results.append({"index": index, "status": "error", "message": "Not a JSON object"})
+            continue
+        
+        valid, message, reading = webhook_handler.validate_payload(item)
+        result = {"index": index, "status": "error", "message": message}
+        if valid:
+            result = {"index": index, "status": "stored", "device": reading[0]}
+            pending.append((result, reading))
+        results.append(result)
+    
+    stored = 0
+    duplicates = 0
+    spooled = 0
+    db_failed = False
+    if pending:
+        readings = [reading for _, reading in pending]
+        reading_ids = None
+        # Straight to the spool while the database is failing
+        if not reading_spool.bypassing():
+            try:
+                reading_ids = webhook_handler.store_batch(readings)
+            except Exception as e:
+                # store_batch() only raises when the database is unavailable
+                logger.error(f"Batch database error ({len(pending)} readings): {e}")
+                reading_spool.database_failed()
+        
+        if reading_ids is not None:
+            for (result, reading), reading_id in zip(pending, reading_ids):
+                if isinstance(reading_id, Exception):
+                    webhook_rejections.labels("db_rejected").inc()
+                    result.update(status="error", message=f"Rejected by the database: {error_summary(reading_id)}")
+                elif reading_id is None:
+                    webhook_rejections.labels("unknown_device").inc()
+                    result.update(status="error", message=f"Device not found: {reading[0]}")
+                elif reading_id == DUPLICATE:
+                    # Already stored earlier: accepted, so senders do not retry it
+                    result["status"] = "duplicate"
+                    duplicates += 1
+                else:
+                    result["reading_id"] = reading_id
+                    stored += 1
+            webhook_readings.labels("batch").inc(stored)
+            webhook_readings.labels("duplicate").inc(duplicates)
+        elif webhook_handler.spool_readings(readings):
+            spooled = len(readings)
+            for result, _ in pending:
+                result["status"] = "spooled"
+        else:
+            webhook_rejections.labels("db_error").inc(len(pending))
+            db_failed = True
+            for result, _ in pending:
+                result.update(status="error", message="Database save failed")
+    
+    accepted = stored + duplicates + spooled
+    if accepted == len(items):
+        status, code = ("accepted", 202) if spooled else ("success", 200)
+    elif accepted:
+        status, code = "partial", 207
+    else:
+        status, code = "error", 500 if db_failed else 400
+    
+    logger.info(f"Webhook batch: {stored} stored, {duplicates} duplicates, {spooled} spooled of {len(items)} readings")
+    return jsonify({
+        "status": status,
+        "received": len(items),
+        "stored": stored,
+        "duplicates": duplicates,
+        "spooled": spooled,
+        "failed": len(items) - accepted,
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }), code
+
 @webhook_bp.route('/test', methods=['GET', 'POST'])
 def webhook_test():
     """Test webhook endpoint"""
@@ -84,6 +262,9 @@ def webhook_test():
 def webhook_status():
     """System status check"""
     status = webhook_handler.get_status()
+    if WebhookConfig.INGEST_MODE == "queue":
+        status["ingest_queue"] = ingest_queue.stats()
+    status["spool"] = reading_spool.stats()
     return jsonify(status), 200 if status["status"] == "healthy" else 503
 
 def register_webhook_routes(app):
@@ -0,0 +1,334 @@
+# webhook/webhook_spool.py
+import os
+import sys
+import time
+import fcntl
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from .webhook_config import WebhookConfig
+from .webhook_metrics import spool_rows_spooled, spool_rows_replayed, spool_replay_seconds, spool_depth
+
+# Add parent directories to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from shared.ingest import Reading, database_unavailable
+
+logger = logging.getLogger('webhook')
+
+class ReadingSpool:
+    """
+    Durable local spool for readings the database could not take.
+
+    Readings are appended to a SQLite file (WAL, fsync on commit), one short
+    local transaction per append. A replayer thread drains the file into
+    sensor_readings in batches of `batch_size`, oldest first, and deletes a
+    batch only after the database committed it; a crash in between replays
+    that batch again. Readings the database rejects move to a dead-letter
+    table, so they never block the ones behind them. Every worker appends,
+    but only the process holding an flock on <path>.lock replays.
+    """
+
+    def __init__(self, path: str, batch_size: int, interval: float, bypass_seconds: float):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.bypass_seconds = bypass_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._bypass_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (workers fork after import)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Spooled readings exist nowhere else, so survive power loss too
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS spooled_readings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device_code TEXT NOT NULL,
+                    encoded_data TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    spooled_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_readings (
+                    id INTEGER PRIMARY KEY,
+                    device_code TEXT NOT NULL,
+                    encoded_data TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    spooled_at REAL NOT NULL,
+                    error TEXT,
+                    failed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS replay_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    replayed INTEGER NOT NULL DEFAULT 0,
+                    skipped INTEGER NOT NULL DEFAULT 0,
+                    last_batch INTEGER,
+                    last_batch_seconds REAL,
+                    last_replay_at REAL,
+                    last_error TEXT,
+                    last_error_at REAL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO replay_state (id) VALUES (1)")
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Writing ---
+
+    def append(self, readings: List[Reading]) -> bool:
+        """Spool readings in one local transaction; False when the spool is off or failed"""
+        if not self.enabled or not readings:
+            return False
+        now = time.time()
+        rows = [(device_code, encoded_data, timestamp.isoformat(), now)
+                for device_code, encoded_data, timestamp in readings]
+        try:
+            conn = self._conn()
+            with conn:
+                conn.executemany("""
+                    INSERT INTO spooled_readings (device_code, encoded_data, timestamp, spooled_at)
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Spool write failed, {len(rows)} readings lost: {e}")
+            return False
+
+        spool_rows_spooled.inc(len(rows))
+        self.start()
+        return True
+
+    def database_failed(self):
+        """Send readings straight to the spool for bypass_seconds"""
+        self._bypass_until = time.monotonic() + self.bypass_seconds
+
+    def bypassing(self) -> bool:
+        """True while a recent database failure keeps readings away from the database"""
+        return self.enabled and time.monotonic() < self._bypass_until
+
+    # --- Replaying ---
+
+    def _oldest(self, limit: int):
+        return self._conn().execute("""
+            SELECT id, device_code, encoded_data, timestamp
+            FROM spooled_readings ORDER BY id LIMIT ?
+        """, (limit,)).fetchall()
+
+    def _write(self, writer: Callable[[List[Reading]], List[Any]], readings: List[Reading]) -> List[Any]:
+        """writer(readings), retried one reading at a time when it fails on the data"""
+        if not readings:
+            return []
+        try:
+            return writer(readings)
+        except Exception as e:
+            if database_unavailable(e):
+                raise
+            if len(readings) == 1:
+                return [e]
+            logger.warning(f"Spool replay of {len(readings)} readings failed, replaying them one by one: {e}")
+        return [self._write(writer, [reading])[0] for reading in readings]
+
+    def replay_once(self, writer: Callable[[List[Reading]], List[Any]]) -> int:
+        """
+        Write the oldest batch with writer() and delete it from the spool.
+        writer() returns one outcome per reading: the reading_id when stored,
+        the error when the database rejected it, anything else when it was
+        skipped (duplicate, unknown device). Rejected readings, and rows that
+        cannot be parsed, move to dead_readings. Errors of an unavailable
+        database propagate and leave the batch in place.
+        Returns: number of spooled readings handled
+        """
+        rows = self._oldest(self.batch_size)
+        if not rows:
+            return 0
+
+        dead = []     # (id, reason)
+        pending = []  # (id, reading)
+        for row_id, device_code, encoded_data, timestamp in rows:
+            try:
+                pending.append((row_id, (device_code, encoded_data, datetime.fromisoformat(timestamp))))
+            except ValueError as e:
+                dead.append((row_id, f"Bad timestamp: {e}"))
+
+        started = time.monotonic()
+        with spool_replay_seconds.time():
+            outcomes = self._write(writer, [reading for _, reading in pending])
+        elapsed = time.monotonic() - started
+
+        written = 0
+        for (row_id, _), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                dead.append((row_id, str(outcome).strip() or type(outcome).__name__))
+            elif isinstance(outcome, int):
+                written += 1
+        for row_id, reason in dead:
+            logger.error(f"Spooled reading {row_id} moved to dead_readings: {reason}")
+
+        # Already stored (e.g. a commit whose reply was lost), of devices
+        # missing from the database, or rejected: none would ever succeed
+        skipped = len(rows) - written
+        if skipped > len(dead):
+            logger.warning(f"Spool replay skipped {skipped - len(dead)} duplicate readings or readings of unknown devices")
+
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO dead_readings (id, device_code, encoded_data, timestamp, spooled_at, error, failed_at)
+                SELECT id, device_code, encoded_data, timestamp, spooled_at, ?, ?
+                FROM spooled_readings WHERE id = ?
+            """, [(reason, now, row_id) for row_id, reason in dead])
+            conn.execute("DELETE FROM spooled_readings WHERE id <= ?", (rows[-1][0],))
+            conn.execute("""
+                UPDATE replay_state SET replayed = replayed + ?, skipped = skipped + ?,
+                    last_batch = ?, last_batch_seconds = ?, last_replay_at = ?
+                WHERE id = 1
+            """, (written, skipped, len(rows), elapsed, now))
+        spool_rows_replayed.inc(written)
+        return len(rows)
+
+    def _record_error(self, error: Exception):
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("UPDATE replay_state SET last_error = ?, last_error_at = ? WHERE id = 1",
+                             (str(error), time.time()))
+        except sqlite3.Error:
+            pass
+
+    def _acquire_replay_lock(self):
+        """Open file holding the replay lock, or None when another process replays"""
+        lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def start(self):
+        """Start the replayer thread in this process (no-op when running or disabled)"""
+        if not self.enabled or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="webhook-spool-replayer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Imported here: the handler imports this module
+        from .webhook_handler import webhook_handler
+
+        lock_file = None
+        failures = 0
+        try:
+            while not self._stopping.is_set():
+                if lock_file is None:
+                    try:
+                        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                        lock_file = self._acquire_replay_lock()
+                    except OSError as e:
+                        logger.error(f"Spool replay lock failed: {e}")
+                    if lock_file is None:
+                        self._stopping.wait(self.interval)
+                        continue
+                    logger.info(f"Spool replayer active (pid {os.getpid()})")
+
+                try:
+                    handled = self.replay_once(webhook_handler.store_batch)
+                    failures = 0
+                except Exception as e:
+                    # Only an unavailable database (or the spool file) gets here
+                    failures += 1
+                    self._record_error(e)
+                    logger.warning(f"Spool replay failed ({failures}x), retrying: {e}")
+                    # Back off while the database stays down, up to a minute
+                    self._stopping.wait(min(self.interval * 2 ** failures, 60))
+                    continue
+
+                # A full batch means more is waiting
+                if handled < self.batch_size:
+                    self._stopping.wait(self.interval)
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def stop(self, timeout: float = 5):
+        """Stop the replayer and release the replay lock (the spool keeps accepting readings)"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+
+    # --- Status ---
+
+    def depth(self) -> int:
+        """Readings waiting; ids stay contiguous because only the oldest rows are deleted"""
+        if not self.enabled:
+            return 0
+        try:
+            first, last = self._conn().execute("SELECT MIN(id), MAX(id) FROM spooled_readings").fetchone()
+        except (sqlite3.Error, OSError):
+            return 0
+        return last - first + 1 if first is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Spool depth and replay progress (shared by all workers), for /webhook/status"""
+        if not self.enabled:
+            return {"enabled": False}
+
+        try:
+            conn = self._conn()
+            oldest = conn.execute("SELECT spooled_at FROM spooled_readings ORDER BY id LIMIT 1").fetchone()
+            dead_letter = conn.execute("SELECT COUNT(*) FROM dead_readings").fetchone()[0]
+            replayed, skipped, last_batch, last_batch_seconds, last_replay_at, last_error, last_error_at = conn.execute("""
+                SELECT replayed, skipped, last_batch, last_batch_seconds, last_replay_at, last_error, last_error_at
+                FROM replay_state WHERE id = 1
+            """).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            return {"enabled": True, "error": str(e)}
+        return {
+            "enabled": True,
+            "depth": self.depth(),
+            "oldest_age_seconds": round(time.time() - oldest[0], 1) if oldest else None,
+            "bypassing": self.bypassing(),
+            "replayed": replayed,
+            "skipped": skipped,
+            "dead_letter": dead_letter,
+            "last_replay_at": datetime.fromtimestamp(last_replay_at).isoformat() if last_replay_at else None,
+            "replay_rate_per_second": round(last_batch / last_batch_seconds, 1) if last_batch_seconds else None,
+            "last_error": last_error if last_error_at and (not last_replay_at or last_error_at > last_replay_at) else None
+        }
+
+# Global instance
+reading_spool = ReadingSpool(
+    WebhookConfig.SPOOL_PATH,
+    batch_size=WebhookConfig.SPOOL_REPLAY_BATCH,
+    interval=WebhookConfig.SPOOL_REPLAY_INTERVAL,
+    bypass_seconds=WebhookConfig.SPOOL_BYPASS_SECONDS
+)
+
+spool_depth.set_function(reading_spool.depth)
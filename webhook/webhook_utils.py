@@ -1,84 +1,106 @@
 # webhook/webhook_utils.py (Simplified)
-import json
+import os
+import sys
 import logging
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
+from .webhook_config import WebhookConfig
+
+# Add parent directories to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Timestamp and content instance parsing, shared with the Antares poller
+from shared.antares import cin_content, reading_time
+from shared.ingest import valid_encoded_data
 
 logger = logging.getLogger('webhook')
 
+# Last payload format seen per device (see device_formats())
+_device_formats: Dict[str, str] = {}
+
+def _from_cin(cin: Dict[str, Any]):
+    content = cin_content(cin)
+    if content is None:
+        return None
+    return (content.get('deviceName') or content.get('device'), content.get('data'),
+            content.get('timestamp'), cin.get('ct'))
+
+def _parse_direct(payload: Dict[str, Any]):
+    # {"deviceName": "CZ1", "data": "01F4...", "timestamp": "..."}
+    return (payload.get('deviceName') or payload.get('device'), payload.get('data'),
+            payload.get('timestamp'), None)
+
+def _parse_cin(payload: Dict[str, Any]):
+    # {"m2m:cin": {"con": "{\"deviceName\": \"CZ1\", \"data\": \"01F4...\"}", "ct": "20250913T062914"}}
+    return _from_cin(payload['m2m:cin'])
+
+def _parse_notification(payload: Dict[str, Any]):
+    # Subscription notification: {"m2m:sgn": {"m2m:nev": {"m2m:rep": {"m2m:cin": {...}}}}},
+    # older Antares versions send "nev"/"rep" without the prefix
+    notification = payload['m2m:sgn']
+    event = notification.get('m2m:nev') or notification.get('nev') or {}
+    representation = event.get('m2m:rep') or event.get('rep') or {}
+    return _from_cin(representation.get('m2m:cin') or {})
+
+def _parse_nested(payload: Dict[str, Any]):
+    # {"payload": {"deviceName": "CZ1", "data": "01F4...", "timestamp": "..."}}
+    nested = payload['payload']
+    return (payload.get('deviceName') or payload.get('device') or nested.get('deviceName'),
+            nested.get('data'), payload.get('timestamp') or nested.get('timestamp'), None)
+
+# (format name, top-level key that identifies it, parser), checked in order
+PAYLOAD_FORMATS = (
+    ("direct", "data", _parse_direct),
+    ("m2m:cin", "m2m:cin", _parse_cin),
+    ("m2m:sgn", "m2m:sgn", _parse_notification),
+    ("payload", "payload", _parse_nested),
+)
+
+def detect_format(payload: Dict[str, Any]):
+    """(format name, parser) for a payload, by its top-level keys; None when unknown"""
+    for name, key, parser in PAYLOAD_FORMATS:
+        if key in payload:
+            return name, parser
+    return None
+
 def parse_webhook_payload(payload: Dict[str, Any]) -> Optional[Tuple[str, str, datetime]]:
     """
-    Simple webhook payload parser for Antares data
+    Webhook payload parser for Antares data
     Returns: (device_name, encoded_data, timestamp) or None
     """
     try:
-        # Try different common formats from Antares
-        
-        # Format 1: Simple direct format
-        device_name = payload.get('deviceName') or payload.get('device')
-        encoded_data = payload.get('data')
-        timestamp_str = payload.get('timestamp')
-        
-        # Format 2: Check if data is nested in m2m:cin
-        if not encoded_data and 'm2m:cin' in payload:
-            try:
-                con_data = json.loads(payload['m2m:cin'].get('con', '{}'))
-                device_name = device_name or con_data.get('deviceName')
-                encoded_data = con_data.get('data')
-            except:
-                pass
-        
-        # Format 3: Check payload nested structure
-        if not encoded_data and 'payload' in payload:
-            nested = payload['payload']
-            device_name = device_name or nested.get('deviceName')
-            encoded_data = encoded_data or nested.get('data')
-            timestamp_str = timestamp_str or nested.get('timestamp')
-        
-        if not device_name or not encoded_data:
+        detected = detect_format(payload)
+        if detected is None:
+            return None
+        format_name, parser = detected
+
+        fields = parser(payload)
+        if fields is None:
+            return None
+        device_name, encoded_data, timestamp_str, created = fields
+        if not device_name or not encoded_data or not isinstance(device_name, str) or not isinstance(encoded_data, str):
             return None
-        
-        # Simple timestamp parsing
-        timestamp = parse_timestamp(timestamp_str)
-        
-        return device_name, encoded_data, timestamp
-        
+
+        # Known devices only, so made-up names cannot grow the map
+        if _device_formats.get(device_name) != format_name and device_name in WebhookConfig.DEVICES:
+            if device_name in _device_formats:
+                logger.info(f"Device {device_name} switched payload format: {_device_formats[device_name]} -> {format_name}")
+            _device_formats[device_name] = format_name
+
+        # The device's own timestamp first, else the Antares creation time
+        return device_name, encoded_data, reading_time(timestamp_str, created)
+
     except Exception as e:
         logger.error(f"Error parsing webhook payload: {e}")
         return None
 
-def parse_timestamp(timestamp_str: Optional[str]) -> datetime:
-    """Simple timestamp parser"""
-    if not timestamp_str:
-        return datetime.now()
-    
-    try:
-        # Try ISO format first
-        if 'T' in timestamp_str:
-            # Remove 'Z' and parse
-            clean_ts = timestamp_str.replace('Z', '+00:00')
-            return datetime.fromisoformat(clean_ts.replace('Z', ''))
-        
-        # Try other formats
-        for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]:
-            try:
-                return datetime.strptime(timestamp_str, fmt)
-            except:
-                continue
-                
-    except Exception as e:
-        logger.debug(f"Timestamp parse error: {e}")
-    
-    # Fallback to current time
-    return datetime.now()
-
 def validate_hex_data(data: str) -> bool:
-    """Simple hex data validation"""
-    if not data or len(data) < 2:
-        return False
-    
-    try:
-        int(data, 16)
-        return len(data) % 2 == 0  # Must be even length
-    except ValueError:
-        return False
\ No newline at end of file
+    """
+    Even-length HEX string of at most 64 digits (the encoded_data column),
+    so an overlong payload is rejected here instead of failing the insert
+    """
+    return valid_encoded_data(data)
+
+def device_formats() -> Dict[str, str]:
+    """Payload format last seen per device, e.g. {"CZ1": "m2m:sgn"}"""
+    return dict(_device_formats)
@@ -175,7 +175,10 @@ if ! grep -q "WEBHOOK_RATE_LIMIT" .env; then
     echo "" >> .env
     echo "# Webhook Configuration" >> .env
     echo "WEBHOOK_RATE_LIMIT=1000" >> .env
+    echo "WEBHOOK_DEVICE_RATE_LIMIT=120" >> .env
+    echo "RATE_LIMIT_BACKEND=sqlite:////home/elektro1/smart_greenhouse/cache/rate_limit.db" >> .env
     echo "WEBHOOK_MAX_PAYLOAD_SIZE=5242880" >> .env
+    echo "WEBHOOK_SPOOL_PATH=/home/elektro1/smart_greenhouse/spool/webhook_spool.db" >> .env
     echo "WEBHOOK_LOG_FILE=/home/elektro1/smart_greenhouse/logs/webhook.log" >> .env
     print_success ".env updated with webhook settings"
 else